@@ -1,42 +1,111 @@
 """Flask API for Touch Grass - Mood-based walking routes"""
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, request, jsonify, g, stream_with_context
 from flask_cors import CORS
+import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from dotenv import load_dotenv
-import google.generativeai as genai
-
-from config import VIBE_CONFIGS
-from services.ai_service import detect_vibe_from_text, generate_route_description
-from services.google_maps_service import get_google_places, get_google_directions, geocode_location, discover_all_places
-from services.route_service import calculate_route_parameters, optimize_waypoints, find_places_near_route
-from services import place_service
 
+# Load .env before importing config so env-driven settings pick it up
 load_dotenv()
 
-app = Flask(__name__)
-CORS(app)
-
-# Configure Gemini
-genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
-gemini_model = genai.GenerativeModel('gemini-pro')
+from config import (
+    VIBE_CONFIGS, RESPONSE_COMPRESSION_MIN_BYTES, BATCH_MAX_ROUTES, AUTOCOMPLETE_MAX_RESULTS,
+    ROUTE_DEADLINE_SECONDS, DESCRIPTION_MIN_SECONDS, CLUSTER_MAX_ZOOM, CLUSTER_MAX_RESULTS
+)
+from services.ai_service import detect_vibe_from_text, generate_route_description
+from services.google_maps_service import get_google_directions
+from services import gazetteer
+from services.route_service import (
+    parse_route_spec, calculate_route_parameters, optimize_waypoints, generate_waypoint_candidates, build_route_result,
+    straight_line_directions
+)
+from services.route_cache import route_cache, make_route_key
+from services.batch_service import generate_routes_batch
+from services import place_service
+from services.place_clusters import get_cluster_index
+from services.maintenance import start_maintenance_scheduler
+from services.upstream import circuit_open, circuit_states
+from models.storage import get_storage
+from utils.deadline import deadline, has_budget
+from utils.payload import parse_payload_shape, shape_response, choose_encoding, compress_body
+from utils.profiling import profiled
+from utils.metrics import (
+    stage, begin_request_timing, end_request_timing, server_timing_header, render_prometheus,
+    REQUEST_SECONDS, ERRORS, ROUTE_CACHE_REQUESTS, DEGRADED_RESPONSES
+)
+
+api = Blueprint('api', __name__)
 
 # API Keys
 GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
 OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY')
 
 
-@app.route('/api/health', methods=['GET'])
+@api.before_app_request
+def start_timing():
+    """Start collecting per-stage timings for this request"""
+    g.request_started = time.perf_counter()
+    g.timing_token = begin_request_timing()
+
+
+@api.after_app_request
+def add_timing(response):
+    """Expose stage timings as a Server-Timing header and record request latency"""
+    token = g.pop('timing_token', None)
+    if token is None:
+        return response
+
+    timings = end_request_timing(token)
+    elapsed = time.perf_counter() - g.request_started
+    timings.append(('total', elapsed))
+    response.headers['Server-Timing'] = server_timing_header(timings)
+    endpoint = request.endpoint.rsplit('.', 1)[-1] if request.endpoint else 'unknown'
+    REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, status=response.status_code)
+    return response
+
+
+@api.after_app_request
+def compress_response(response):
+    """Gzip/brotli-compress large JSON responses when the client accepts it"""
+    if (response.direct_passthrough or response.status_code < 200 or response.status_code >= 300
+            or 'Content-Encoding' in response.headers or response.mimetype != 'application/json'):
+        return response
+
+    data = response.get_data()
+    if len(data) < RESPONSE_COMPRESSION_MIN_BYTES:
+        return response
+
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if encoding:
+        response.set_data(compress_body(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+@api.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics (stage/request/upstream latencies, upstream calls, errors, cache hits)"""
+    return render_prometheus(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
+@api.route('/api/health', methods=['GET'])
 def health():
-    """Health check endpoint"""
+    """Health check endpoint ('degraded' while any upstream's circuit breaker isn't closed)"""
+    upstreams = circuit_states()
     return jsonify({
-        'status': 'healthy',
+        'status': 'healthy' if all(u['state'] == 'closed' for u in upstreams.values()) else 'degraded',
         'google_maps_configured': GOOGLE_MAPS_API_KEY is not None,
         'gemini_configured': os.getenv('GEMINI_API_KEY') is not None,
-        'openrouter_configured': OPENROUTER_API_KEY is not None
+        'openrouter_configured': OPENROUTER_API_KEY is not None,
+        'upstreams': upstreams
     })
 
 
-@app.route('/api/vibes', methods=['GET'])
+@api.route('/api/vibes', methods=['GET'])
 def get_vibes():
     """Get all available vibes"""
     return jsonify({
@@ -52,7 +121,7 @@ def get_vibes():
     })
 
 
-@app.route('/api/geocode', methods=['POST'])
+@api.route('/api/geocode', methods=['POST'])
 def geocode():
     """Geocode a location string to coordinates"""
     try:
@@ -62,8 +131,8 @@ def geocode():
         if not location_name:
             return jsonify({'error': 'Location string is required'}), 400
 
-        # Geocode the location
-        geocoded = geocode_location(GOOGLE_MAPS_API_KEY, location_name)
+        # Geocode the location (offline gazetteer first, then Google)
+        geocoded = gazetteer.geocode(GOOGLE_MAPS_API_KEY, location_name)
 
         if geocoded:
             return jsonify({
@@ -72,21 +141,77 @@ def geocode():
                     'longitude': geocoded['longitude'],
                     'formatted_address': geocoded['formatted_address'],
                     'name': location_name
-                }
+                },
+                'source': geocoded['source']
             })
         else:
             return jsonify({'error': f'Could not find location: {location_name}'}), 404
 
     except Exception as e:
+        ERRORS.inc(endpoint='geocode')
         print(f"Error geocoding: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/detect-vibe', methods=['POST'])
+@api.route('/api/autocomplete', methods=['GET'])
+def autocomplete():
+    """Suggest known locations for a partial name (?q=, optional limit, lat and lon to favour nearby)"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Query parameter q is required'}), 400
+
+    limit = max(1, min(request.args.get('limit', AUTOCOMPLETE_MAX_RESULTS, type=int), AUTOCOMPLETE_MAX_RESULTS))
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    near = (lat, lon) if lat is not None and lon is not None else None
+
+    return jsonify({
+        'query': query,
+        'suggestions': gazetteer.get_gazetteer().search(query, limit, near)
+    })
+
+
+@api.route('/api/places', methods=['GET'])
+def browse_places():
+    """
+    Clustered places for a map viewport.
+
+    Query parameters: vibe, zoom, and the viewport's min_lat, min_lon,
+    max_lat and max_lon (min_lon > max_lon crosses the antimeridian).
+    Returns one cluster per occupied grid cell with its count, mean position
+    and best-rated place.
+    """
+    vibe = request.args.get('vibe')
+    if vibe not in VIBE_CONFIGS:
+        return jsonify({'error': f'vibe must be one of: {", ".join(VIBE_CONFIGS)}'}), 400
+
+    zoom = request.args.get('zoom', type=int)
+    bounds = [request.args.get(name, type=float) for name in ('min_lat', 'min_lon', 'max_lat', 'max_lon')]
+    if zoom is None or zoom < 0 or None in bounds:
+        return jsonify({'error': 'zoom, min_lat, min_lon, max_lat and max_lon are required'}), 400
+    min_lat, min_lon, max_lat, max_lon = bounds
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+        return jsonify({'error': 'Invalid bounding box'}), 400
+
+    with stage('clustering'):
+        clusters, truncated = get_cluster_index().clusters(
+            vibe, zoom, min_lat, min_lon, max_lat, max_lon, CLUSTER_MAX_RESULTS
+        )
+
+    return jsonify({
+        'vibe': vibe,
+        'zoom': min(zoom, CLUSTER_MAX_ZOOM),
+        'clusters': clusters,
+        'total': sum(cluster['count'] for cluster in clusters),
+        'truncated': truncated
+    })
+
+
+@api.route('/api/detect-vibe', methods=['POST'])
 def detect_vibe():
-    """Detect vibe and location from user's text description using LLM"""
+    """Detect vibe and location from user's text description (local classifier, then LLM when unsure)"""
     try:
         data = request.json
         user_text = data.get('text', '').strip()
@@ -96,12 +221,13 @@ def detect_vibe():
 
         # Detect vibe and extract location name
         result = detect_vibe_from_text(OPENROUTER_API_KEY, user_text)
+        response = dict(result)
 
         # If location was extracted, geocode it
         if result.get('location'):
-            geocoded = geocode_location(GOOGLE_MAPS_API_KEY, result['location'])
+            geocoded = gazetteer.geocode(GOOGLE_MAPS_API_KEY, result['location'])
             if geocoded:
-                result['geocoded_location'] = {
+                response['geocoded_location'] = {
                     'latitude': geocoded['latitude'],
                     'longitude': geocoded['longitude'],
                     'formatted_address': geocoded['formatted_address'],
@@ -109,160 +235,249 @@ def detect_vibe():
                 }
             else:
                 # Keep the location name even if geocoding fails
-                result['geocoded_location'] = None
-                result['location_error'] = f"Could not find location: {result['location']}"
+                response['geocoded_location'] = None
+                response['location_error'] = f"Could not find location: {result['location']}"
 
-        return jsonify(result)
+        return jsonify(response)
 
     except ValueError as e:
         return jsonify({'error': str(e)}), 500
     except Exception as e:
+        ERRORS.inc(endpoint='detect_vibe')
         print(f"Error detecting vibe: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/generate-route', methods=['POST'])
+def with_cache_status(response, status):
+    """Tag a route response with its cache status (HIT, MISS or BYPASS)"""
+    response.headers['X-Route-Cache'] = status
+    ROUTE_CACHE_REQUESTS.inc(status=status.lower())
+    return response
+
+
+@api.route('/api/generate-route', methods=['POST'])
+@profiled('generate_route')
 def generate_route():
     """Generate a walking route based on vibe, location, duration, and route type"""
     try:
         data = request.json
-        vibe = data.get('vibe', 'chill')
-        latitude = data.get('latitude')
-        longitude = data.get('longitude')
-        is_circular = data.get('circular', True)
-        destination = data.get('destination')  # For one-way routes
-
-        # Handle duration - required for circular routes, optional for one-way
-        duration = data.get('duration')
-        if duration is not None:
-            try:
-                duration = int(duration)
-            except (ValueError, TypeError):
-                duration = 30  # Default if invalid
-        else:
-            duration = 30  # Default duration
-
-        # Validate inputs
-        if not latitude or not longitude:
-            return jsonify({'error': 'Location (latitude, longitude) is required'}), 400
-
-        # For one-way routes, validate destination
-        if not is_circular and not destination:
-            return jsonify({'error': 'Destination is required for one-way routes'}), 400
-
-        if vibe not in VIBE_CONFIGS:
-            return jsonify({'error': f'Invalid vibe. Choose from: {list(VIBE_CONFIGS.keys())}'}), 400
+        try:
+            spec = parse_route_spec(data)
+            geometry, waypoint_fields = parse_payload_shape(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
         if not GOOGLE_MAPS_API_KEY:
             return jsonify({'error': 'Google Maps API not configured'}), 500
 
-        # Only validate duration for circular routes
-        if is_circular and (duration < 10 or duration > 120):
-            return jsonify({'error': 'Duration must be between 10 and 120 minutes'}), 400
-
-        # Calculate route parameters
-        route_params = calculate_route_parameters(duration, vibe, is_circular)
-        search_radius = route_params['search_radius']
-
-        # Check if area is already indexed in our database
-        if not place_service.is_area_indexed(latitude, longitude, search_radius):
-            # Discover all places in area
-            raw_places = discover_all_places(GOOGLE_MAPS_API_KEY, latitude, longitude, search_radius)
-
-            # Categorize each place (static mapping or LLM for unknown types)
-            places_to_save = []
-            for place in raw_places:
-                vibes, source = place_service.categorize_place(place, OPENROUTER_API_KEY)
-                places_to_save.append((place, vibes, source))
-
-            # Bulk save to database
-            if places_to_save:
-                place_service.save_places_bulk(places_to_save)
-
-            # Mark area as indexed
-            place_service.mark_area_indexed(latitude, longitude, search_radius)
-
-        # Query places for the requested vibe from database
-        places = place_service.get_places_by_vibe(latitude, longitude, search_radius, vibe)
-
-        # If no places found in database, expand search radius
-        if not places:
-            expanded_radius = min(search_radius * 2, 10000)
-
-            # Check if expanded area needs indexing
-            if not place_service.is_area_indexed(latitude, longitude, expanded_radius):
-                raw_places = discover_all_places(GOOGLE_MAPS_API_KEY, latitude, longitude, expanded_radius)
-                places_to_save = []
-                for place in raw_places:
-                    vibes, source = place_service.categorize_place(place, OPENROUTER_API_KEY)
-                    places_to_save.append((place, vibes, source))
-                if places_to_save:
-                    place_service.save_places_bulk(places_to_save)
-                place_service.mark_area_indexed(latitude, longitude, expanded_radius)
-
-            places = place_service.get_places_by_vibe(latitude, longitude, expanded_radius, vibe)
-
-        # Fallback to direct API call if still no places
-        if not places:
-            places = get_google_places(GOOGLE_MAPS_API_KEY, latitude, longitude, vibe, search_radius)
-            if not places:
-                places = get_google_places(GOOGLE_MAPS_API_KEY, latitude, longitude, vibe, min(search_radius * 2, 10000))
-
-        # Optimize waypoints
-        # For one-way routes, pass destination coordinates
-        dest_coords = None
-        if not is_circular and destination:
-            dest_coords = (destination['latitude'], destination['longitude'])
-
-        waypoints = optimize_waypoints(
-            latitude, longitude, places.copy(),
-            route_params['target_distance'], vibe, is_circular, dest_coords
-        )
-
-        # Get directions
-        directions = get_google_directions(GOOGLE_MAPS_API_KEY, waypoints)
-
-        if not directions:
+        vibe = spec['vibe']
+        latitude = spec['latitude']
+        longitude = spec['longitude']
+        is_circular = spec['is_circular']
+        destination = spec['destination']
+        duration = spec['duration']
+        num_routes = spec['num_routes']
+
+        # Serve repeated requests (same snapped start, vibe, duration bucket) from cache
+        cache_key = None
+        if route_cache is not None and not data.get('no_cache'):
+            cache_key = make_route_key(
+                latitude, longitude, vibe, duration, is_circular,
+                None if is_circular else destination, num_routes
+            )
+            cached = route_cache.get(cache_key)
+            if cached:
+                return with_cache_status(jsonify(shape_response(cached, geometry, waypoint_fields)), 'HIT')
+
+            # Directions is down: an expired full route beats a straight-line one
+            if circuit_open('google_directions'):
+                cached = route_cache.get(cache_key, allow_stale=True)
+                if cached:
+                    return with_cache_status(jsonify(shape_response(cached, geometry, waypoint_fields)), 'STALE')
+
+        with deadline(ROUTE_DEADLINE_SECONDS):
+            response = build_route_response(spec)
+
+        if not response:
             return jsonify({'error': 'Could not generate route. Try a different location or duration.'}), 500
 
-        # Find places that are actually close to the generated route path
-        # This ensures "places along the way" are truly on the path
-        route_coordinates = directions['coordinates']
-        places_on_route = find_places_near_route(route_coordinates, places, max_distance=150)
-
-        # If we found places on route, use those; otherwise fall back to nearby places
-        waypoints_to_display = places_on_route if places_on_route else places[:10]
-
-        # Limit to top 10 places
-        waypoints_to_display = waypoints_to_display[:10]
-
-        # Generate AI description
-        description = generate_route_description(gemini_model, vibe, waypoints_to_display)
-
-        return jsonify({
-            'vibe': vibe,
-            'description': description,
-            'route': {
-                'coordinates': directions['coordinates'],
-                'distance': directions['distance'],
-                'duration': directions['duration'],
-                'polyline': directions['polyline']
-            },
-            'waypoints': waypoints_to_display,
-            'directions': {
-                'steps': directions['steps']
-            },
-            'config': VIBE_CONFIGS[vibe]
-        })
+        # Degraded responses aren't cached, so the next request gets the full route
+        if cache_key and not response.get('degraded'):
+            route_cache.put(cache_key, response)
+        else:
+            cache_key = None
+
+        shaped = shape_response(response, geometry, waypoint_fields)
+        return with_cache_status(jsonify(shaped), 'MISS' if cache_key else 'BYPASS')
 
     except Exception as e:
+        ERRORS.inc(endpoint='generate_route')
         print(f"Error generating route: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
 
+def build_route_response(spec):
+    """
+    Generate the route response for a parsed spec within the current deadline.
+
+    Stages that run short of budget, or whose upstream's circuit breaker is
+    open, degrade instead of failing: a new area is indexed in the
+    background, a failed Directions call becomes a straight-line route and
+    the AI description falls back to the static one. Such responses list
+    the affected stages under 'degraded'.
+
+    Returns:
+        Response dict, or None if no route could be built
+    """
+    vibe = spec['vibe']
+    latitude = spec['latitude']
+    longitude = spec['longitude']
+    is_circular = spec['is_circular']
+    destination = spec['destination']
+    num_routes = spec['num_routes']
+    degraded = []
+    directions_up = not circuit_open('google_directions')
+
+    # Calculate route parameters
+    route_params = calculate_route_parameters(spec['duration'], vibe, is_circular)
+
+    # Places for the vibe from the database (indexing the area on first use)
+    places = place_service.get_route_places(
+        GOOGLE_MAPS_API_KEY, OPENROUTER_API_KEY, latitude, longitude, route_params['search_radius'], vibe,
+        degraded
+    )
+
+    # Optimize waypoints
+    # For one-way routes, pass destination coordinates
+    dest_coords = None
+    if not is_circular and destination:
+        dest_coords = (destination['latitude'], destination['longitude'])
+
+    if num_routes == 1:
+        with stage('optimizer'):
+            candidate_waypoints = [optimize_waypoints(
+                latitude, longitude, places.places(),
+                route_params['target_distance'], vibe, is_circular, dest_coords
+            )]
+        with stage('directions'):
+            directions_results = [
+                get_google_directions(GOOGLE_MAPS_API_KEY, candidate_waypoints[0]) if directions_up else None
+            ]
+    else:
+        # Build several waypoint sets from the same candidate pool and
+        # fetch directions for all of them at once
+        with stage('optimizer'):
+            candidates = generate_waypoint_candidates(
+                latitude, longitude, places.places(),
+                route_params['target_distance'], vibe, is_circular, dest_coords, k=num_routes
+            )
+        candidate_waypoints = [c['waypoints'] for c in candidates]
+        directions_results = []
+        if directions_up:
+            # Each worker runs in a copy of this request's context (deadline, priority)
+            contexts = [copy_context() for _ in candidate_waypoints]
+            with stage('directions'), ThreadPoolExecutor(max_workers=max(1, len(candidate_waypoints))) as executor:
+                directions_results = list(executor.map(
+                    lambda ctx, wps: ctx.run(get_google_directions, GOOGLE_MAPS_API_KEY, wps),
+                    contexts, candidate_waypoints
+                ))
+
+    if candidate_waypoints and not any(directions_results):
+        # Directions unavailable or out of time: join the waypoints directly
+        directions_results = [straight_line_directions(candidate_waypoints[0])]
+        degraded.append('directions')
+
+    with stage('near-route'):
+        routes = [
+            build_route_result(directions, places)
+            for directions in directions_results if directions
+        ]
+
+    if not routes:
+        return None
+
+    primary = routes[0]
+
+    # Generate AI description when there's time left for it and Gemini is up
+    if has_budget(DESCRIPTION_MIN_SECONDS) and not circuit_open('gemini'):
+        with stage('description'):
+            description = generate_route_description(vibe, primary['waypoints'])
+    else:
+        description = VIBE_CONFIGS[vibe]['description']
+        degraded.append('description')
+
+    response = {
+        'vibe': vibe,
+        'description': description,
+        'route': primary['route'],
+        'waypoints': primary['waypoints'],
+        'directions': primary['directions'],
+        'config': VIBE_CONFIGS[vibe]
+    }
+    if num_routes > 1:
+        response['alternatives'] = routes[1:]
+    if degraded:
+        response['degraded'] = degraded
+        for name in degraded:
+            DEGRADED_RESPONSES.inc(stage=name)
+    return response
+
+
+@api.route('/api/generate-routes/batch', methods=['POST'])
+def generate_routes_batch_endpoint():
+    """
+    Generate routes for many specs in one call, streamed back as NDJSON.
+
+    Body: {"routes": [<generate-route body, optional "id">, ...], "describe": false}.
+    Each output line is one route result (or an error) tagged with the
+    spec's "index" (and "id"), in completion order.
+    """
+    data = request.json or {}
+    specs = data.get('routes')
+
+    if not isinstance(specs, list) or not specs:
+        return jsonify({'error': 'routes must be a non-empty list of route specs'}), 400
+    if len(specs) > BATCH_MAX_ROUTES:
+        return jsonify({'error': f'At most {BATCH_MAX_ROUTES} routes per batch'}), 400
+    if not GOOGLE_MAPS_API_KEY:
+        return jsonify({'error': 'Google Maps API not configured'}), 500
+
+    results = generate_routes_batch(
+        specs, GOOGLE_MAPS_API_KEY, OPENROUTER_API_KEY, describe=bool(data.get('describe'))
+    )
+    lines = (json.dumps(result) + '\n' for result in results)
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+
+
+def create_app(initialize=True):
+    """
+    Build the Flask app.
+
+    With initialize=True the place storage (the database schema) is set up front, which is
+    what a pre-forking server wants (e.g. gunicorn 'app:create_app()').
+    Otherwise it is created on first use. Upstream SDK clients are always
+    set up lazily on first use. initialize=True also starts the scheduled
+    database maintenance when DB_MAINTENANCE_INTERVAL_SECONDS is set.
+    """
+    flask_app = Flask(__name__)
+    CORS(flask_app)
+    flask_app.register_blueprint(api)
+    if initialize:
+        storage = get_storage()
+        storage.initialize()
+        # Maintenance works on places.db; other backends have nothing to tidy
+        if storage.name == 'sqlite':
+            start_maintenance_scheduler()
+    return flask_app
+
+
+# Module-level app for `python app.py`; importing it does no setup work
+app = create_app(initialize=False)
+
+
 if __name__ == '__main__':
     app.run(debug=True, port=5001)
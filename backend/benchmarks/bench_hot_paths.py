@@ -0,0 +1,223 @@
+"""
+Benchmark the backend hot paths against synthetic data.
+
+Run from the backend directory:
+    python -m benchmarks.bench_hot_paths --sizes 10000 100000 -o bench.json
+    python -m benchmarks.bench_hot_paths --compare bench.json
+
+Each size gets its own throwaway SQLite database, so places.db is never touched.
+"""
+import argparse
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Point the place store at a scratch database before any model is imported
+_scratch_dir = tempfile.mkdtemp(prefix='touchgrass-bench-')
+atexit.register(shutil.rmtree, _scratch_dir, ignore_errors=True)
+os.environ['PLACES_DB_PATH'] = os.path.join(_scratch_dir, 'bootstrap.db')
+
+from models import database  # noqa: E402
+from models import place_snapshot  # noqa: E402
+from models.place_table import PlaceTable  # noqa: E402
+from models.storage import get_storage  # noqa: E402
+from models.write_queue import write_queue  # noqa: E402
+from services import place_service  # noqa: E402
+from services.google_maps_service import decode_polyline  # noqa: E402
+from services.place_clusters import PlaceClusterIndex  # noqa: E402
+from services.recategorize import recategorize  # noqa: E402
+from services.route_service import find_places_near_route, optimize_waypoints, calculate_route_parameters  # noqa: E402
+from config import VALID_VIBES, PLACE_TYPE_TO_VIBES  # noqa: E402
+from benchmarks import synthetic  # noqa: E402
+from benchmarks.harness import BenchmarkRun, add_common_arguments, finish  # noqa: E402
+
+DEFAULT_SIZES = [10000, 100000]
+SAVE_BATCH_SIZE = 500
+QUERY_RADIUS = 1500
+ROUTE_LIMIT = 20
+INGEST_THREADS = 8
+INGEST_BATCH_SIZE = 50
+VIEWPORT_PIXELS = (1280, 800)
+CLUSTER_ZOOMS = (4, 10, 14, 18)
+
+
+def use_fresh_database(name):
+    """Switch the place store to a new empty database file"""
+    database.DB_PATH = os.path.join(_scratch_dir, f'{name}.db')
+    if os.path.exists(database.DB_PATH):
+        os.remove(database.DB_PATH)
+    database.init_db()
+
+
+def bench_database(run, size, seed):
+    """save_places_bulk, get_places_by_vibe and is_area_indexed at one scale"""
+    print(f"\n{size} places")
+    use_fresh_database(f'places-{size}')
+    places = synthetic.generate_places(size, seed)
+
+    def save_all():
+        for i in range(0, len(places), SAVE_BATCH_SIZE):
+            place_service.save_places_bulk(places[i:i + SAVE_BATCH_SIZE])
+
+    result = run.measure(f'save_places_bulk[n={size}]', save_all, min_runs=1, max_runs=1)
+    run.results[f'save_places_bulk[n={size}]']['places_per_second'] = size / (result['median_ms'] / 1000)
+
+    points = synthetic.generate_query_points(32, seed)
+    state = {'i': 0}
+
+    def query_by_vibe():
+        lat, lon = points[state['i'] % len(points)]
+        vibe = VALID_VIBES[state['i'] % len(VALID_VIBES)]
+        state['i'] += 1
+        place_service.get_places_by_vibe(lat, lon, QUERY_RADIUS, vibe)
+
+    run.measure(f'get_places_by_vibe[n={size}]', query_by_vibe, max_runs=32)
+
+    def top_places_by_vibe():
+        lat, lon = points[state['i'] % len(points)]
+        vibe = VALID_VIBES[state['i'] % len(VALID_VIBES)]
+        state['i'] += 1
+        place_service.get_places_by_vibe(lat, lon, QUERY_RADIUS, vibe, limit=ROUTE_LIMIT)
+
+    run.measure(f'get_places_by_vibe[n={size},limit={ROUTE_LIMIT}]', top_places_by_vibe, max_runs=32)
+
+    # Same queries answered from the memory-mapped snapshot (writes within
+    # the export's second would count as deltas, so let that pass first)
+    time.sleep(1)
+    run.measure(f'export_snapshot[n={size}]', place_snapshot.export_snapshot, min_runs=1, max_runs=1)
+    run.measure(f'get_places_by_vibe[n={size},snapshot]', query_by_vibe, max_runs=32)
+    run.measure(f'get_places_by_vibe[n={size},limit={ROUTE_LIMIT},snapshot]', top_places_by_vibe, max_runs=32)
+    os.remove(place_snapshot.snapshot_path())
+
+    num_areas = max(100, size // 50)
+    areas = synthetic.generate_indexed_areas(num_areas, seed)
+    for lat, lon, radius in areas:
+        place_service.mark_area_indexed(lat, lon, radius)
+
+    # Misses are the expensive case: every area has to be checked
+    def area_lookup():
+        lat, lon = points[state['i'] % len(points)]
+        state['i'] += 1
+        place_service.is_area_indexed(lat + 1.0, lon, QUERY_RADIUS)
+
+    run.measure(f'is_area_indexed[areas={num_areas}]', area_lookup, max_runs=32)
+
+    # /api/places: one index build, then a viewport's clusters at several zooms
+    index = {}
+
+    def build_index():
+        index['value'] = PlaceClusterIndex(get_storage().all_places())
+
+    run.measure(f'PlaceClusterIndex[n={size}]', build_index, min_runs=1, max_runs=1)
+    for zoom in CLUSTER_ZOOMS:
+        # Viewport degrees at this zoom (latitude span roughly, away from the poles)
+        lon_span = VIEWPORT_PIXELS[0] * 360 / (256 << zoom)
+        lat_span = VIEWPORT_PIXELS[1] * 360 / (256 << zoom) * 0.6
+
+        def viewport_clusters():
+            lat, lon = points[state['i'] % len(points)]
+            state['i'] += 1
+            index['value'].clusters('chill', zoom, lat - lat_span / 2, lon - lon_span / 2,
+                                    lat + lat_span / 2, lon + lon_span / 2)
+
+        viewport_clusters()  # Build and cache this zoom's grid
+        run.measure(f'place_clusters[n={size},zoom={zoom}]', viewport_clusters, max_runs=32)
+
+    # Applying a PLACE_TYPE_TO_VIBES edit: one common type gains every vibe
+    recategorize(snapshot=False)  # Records the fingerprint
+    edited = dict(PLACE_TYPE_TO_VIBES, cafe=list(VALID_VIBES))
+    run.measure(f'recategorize[n={size},types=1]', lambda: recategorize(edited, snapshot=False),
+                min_runs=1, max_runs=1)
+
+
+def bench_concurrent_ingest(run, size, seed):
+    """Many threads saving small batches at once, with and without the write-behind queue"""
+    print(f"\nconcurrent ingestion ({INGEST_THREADS} threads)")
+    places = synthetic.generate_places(size, seed)
+    chunks = [places[i:i + INGEST_BATCH_SIZE] for i in range(0, len(places), INGEST_BATCH_SIZE)]
+    queued = write_queue.enabled
+
+    for mode in ('direct', 'queued'):
+        use_fresh_database(f'ingest-{mode}-{size}')
+        write_queue.enabled = mode == 'queued'
+        failures = []
+
+        def save(chunk):
+            try:
+                place_service.save_places_bulk(chunk)
+            except Exception as e:
+                failures.append(e)
+
+        def ingest():
+            with ThreadPoolExecutor(max_workers=INGEST_THREADS) as executor:
+                list(executor.map(save, chunks))
+
+        name = f'save_places_bulk[n={size},threads={INGEST_THREADS},{mode}]'
+        result = run.measure(name, ingest, min_runs=1, max_runs=1)
+        run.results[name]['places_per_second'] = size / (result['median_ms'] / 1000)
+        run.results[name]['failed_batches'] = len(failures)
+
+    write_queue.enabled = queued
+
+
+def bench_route(run, seed):
+    """find_places_near_route and optimize_waypoints on realistic candidate sets"""
+    print("\nroute service")
+    _, lat, lon = synthetic.CITIES[0]
+    places = synthetic.places_to_dicts(synthetic.generate_places(40000, seed), lat, lon, 3000)
+    vibe_places = [p for p in places if 'chill' in p['vibes']]
+    vibe_table = PlaceTable.from_dicts(vibe_places)
+
+    for num_points in (300, 3000):
+        coordinates = synthetic.generate_route_coordinates(lat, lon, num_points, seed=seed)
+        run.measure(
+            f'find_places_near_route[places={len(vibe_places)},points={num_points}]',
+            lambda: find_places_near_route(coordinates, vibe_places, max_distance=150)
+        )
+        run.measure(
+            f'find_places_near_route[table,places={len(vibe_places)},points={num_points}]',
+            lambda: find_places_near_route(coordinates, vibe_table, max_distance=150)
+        )
+
+    for duration in (30, 90):
+        for circular in (True, False):
+            params = calculate_route_parameters(duration, 'chill', circular)
+            run.measure(
+                f'optimize_waypoints[places={len(vibe_places)},{duration}min,{"loop" if circular else "oneway"}]',
+                lambda: optimize_waypoints(lat, lon, vibe_places, params['target_distance'], 'chill', circular)
+            )
+
+
+def bench_polyline(run, seed):
+    print("\npolyline decoding")
+    for num_points in (500, 5000, 50000):
+        encoded = synthetic.generate_polyline(num_points, seed)
+        run.measure(f'decode_polyline[points={num_points}]', lambda: decode_polyline(encoded))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Place counts to benchmark (e.g. 10000 100000 1000000)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--skip-db', action='store_true', help='Skip the SQLite benchmarks')
+    add_common_arguments(parser)
+    args = parser.parse_args(argv)
+
+    run = BenchmarkRun('hot_paths')
+    if not args.skip_db:
+        for size in args.sizes:
+            bench_database(run, size, args.seed)
+        bench_concurrent_ingest(run, min(args.sizes), args.seed)
+    bench_route(run, args.seed)
+    bench_polyline(run, args.seed)
+
+    return finish(run, args.output, args.compare, args.threshold)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
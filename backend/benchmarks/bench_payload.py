@@ -0,0 +1,91 @@
+"""
+Measure /api/generate-route payload sizes for each response shape.
+
+Run from the backend directory:
+    python -m benchmarks.bench_payload -o payload.json
+
+Builds a long synthetic loop (full waypoint dicts, thousands of route
+points) and reports raw, gzip and brotli sizes for full and compact shapes.
+"""
+import argparse
+import gzip
+import json
+import sys
+
+from config import VIBE_CONFIGS
+from benchmarks import synthetic
+from benchmarks.harness import BenchmarkRun, add_common_arguments, finish
+from services.google_maps_service import encode_polyline
+from utils.payload import shape_route, compress_body, brotli, COMPACT_WAYPOINT_FIELDS
+
+SHAPES = {
+    'full': ('full', None),
+    'compact-polyline': ('polyline', COMPACT_WAYPOINT_FIELDS),
+    'compact-delta': ('delta', COMPACT_WAYPOINT_FIELDS),
+}
+
+
+def build_response(num_points, seed):
+    """A generate_route-shaped response for a loop with num_points coordinates"""
+    _, lat, lon = synthetic.CITIES[0]
+    coordinates = synthetic.generate_route_coordinates(lat, lon, num_points, seed=seed)
+    places = synthetic.places_to_dicts(synthetic.generate_places(20000, seed), lat, lon, 2000)[:10]
+    for i, place in enumerate(places):
+        place['distance_to_route'] = 40.0 + i
+        place['route_position'] = i / 10
+
+    return {
+        'vibe': 'chill',
+        'description': 'A relaxing loop past parks and quiet cafes.',
+        'route': {
+            'coordinates': coordinates,
+            'distance': num_points * 15,
+            'duration': num_points * 15 // 80,
+            'polyline': encode_polyline(coordinates)
+        },
+        'waypoints': places,
+        'directions': {
+            'steps': [
+                {'instruction': f'Turn left onto Street {i}', 'distance': 120, 'duration': 1, 'maneuver': 'turn-left'}
+                for i in range(num_points // 50)
+            ]
+        },
+        'config': VIBE_CONFIGS['chill']
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, nargs='+', default=[1000, 5000])
+    parser.add_argument('--seed', type=int, default=42)
+    add_common_arguments(parser)
+    args = parser.parse_args(argv)
+
+    run = BenchmarkRun('payload')
+    for num_points in args.points:
+        print(f"\n{num_points}-point route")
+        response = build_response(num_points, args.seed)
+        full_size = None
+
+        for shape_name, (geometry, fields) in SHAPES.items():
+            body = json.dumps(shape_route(response, geometry, fields), separators=(',', ':')).encode()
+            sizes = {'raw_bytes': len(body), 'gzip_bytes': len(gzip.compress(body, compresslevel=6))}
+            if brotli is not None:
+                sizes['brotli_bytes'] = len(compress_body(body, 'br'))
+            full_size = full_size or len(body)
+            sizes['raw_reduction'] = round(1 - len(body) / full_size, 3)
+            sizes['gzip_reduction'] = round(1 - sizes['gzip_bytes'] / full_size, 3)
+            run.record(f'size[{shape_name},points={num_points}]', **sizes)
+
+            run.measure(
+                f'shape+serialize+gzip[{shape_name},points={num_points}]',
+                lambda: gzip.compress(
+                    json.dumps(shape_route(response, geometry, fields)).encode(), compresslevel=6
+                )
+            )
+
+    return finish(run, args.output, args.compare, args.threshold)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
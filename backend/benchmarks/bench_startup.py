@@ -0,0 +1,78 @@
+"""
+Measure backend cold start: import time and time to first request.
+
+Run from the backend directory:
+    python -m benchmarks.bench_startup -o startup.json
+    python -m benchmarks.bench_startup --compare startup.json
+
+Every sample is a fresh interpreter, so module caches don't hide regressions.
+The database is a scratch copy, so places.db is never touched.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.harness import BenchmarkRun, add_common_arguments, finish
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter; prints its own timings as JSON
+CHILD_SCRIPT = '''
+import json, time
+t0 = time.perf_counter()
+import app
+t_import = time.perf_counter()
+client = app.app.test_client()
+client.get('/api/health')
+t_health = time.perf_counter()
+client.get('/api/vibes')
+t_vibes = time.perf_counter()
+print(json.dumps({
+    'import_ms': (t_import - t0) * 1000,
+    'first_request_ms': (t_health - t0) * 1000,
+    'second_request_ms': (t_vibes - t_health) * 1000,
+}))
+'''
+
+
+def run_child(db_path):
+    env = dict(os.environ, PLACES_DB_PATH=db_path, ROUTE_CACHE_DB_PATH='')
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD_SCRIPT],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='Fresh interpreters to start')
+    add_common_arguments(parser)
+    args = parser.parse_args(argv)
+
+    scratch_dir = tempfile.mkdtemp(prefix='touchgrass-startup-')
+    try:
+        db_path = os.path.join(scratch_dir, 'places.db')
+        source_db = os.path.join(BACKEND_DIR, 'places.db')
+        if os.path.exists(source_db):
+            shutil.copy(source_db, db_path)
+
+        samples = [run_child(db_path) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    run = BenchmarkRun('startup')
+    print()
+    for key, name in [('import_ms', 'import_app'), ('first_request_ms', 'time_to_first_request'),
+                      ('second_request_ms', 'second_request')]:
+        run.add_samples(name, [s[key] for s in samples])
+
+    return finish(run, args.output, args.compare, args.threshold)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
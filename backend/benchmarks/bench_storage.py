@@ -0,0 +1,314 @@
+"""
+Conformance checks and benchmarks for the place storage backends.
+
+Every backend (see models/storage.py) gets the same synthetic places and
+must give the same answers as a brute-force reference: radius queries per
+vibe (with and without a limit) and for any place, upserts that move places
+or change their vibes, lookup by id, alias links and area coverage. Radius
+queries run at several radii, with extra places just inside and just
+outside each radius due north, south, east and west of the query points,
+where box prefilters can cut the circle off. The same operations are then
+timed.
+
+Run from the backend directory:
+    python -m benchmarks.bench_storage --backends sqlite memory --size 20000 -o storage.json
+
+Exits nonzero if a backend gives a wrong answer. SQLite runs against a
+throwaway database, so places.db is never touched.
+"""
+import argparse
+import atexit
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Point the place store at a scratch database before any model is imported
+_scratch_dir = tempfile.mkdtemp(prefix='touchgrass-storage-')
+atexit.register(shutil.rmtree, _scratch_dir, ignore_errors=True)
+os.environ['PLACES_DB_PATH'] = os.path.join(_scratch_dir, 'bootstrap.db')
+
+from models import database  # noqa: E402
+from models import place_snapshot  # noqa: E402
+from models.place import VIBE_BITS  # noqa: E402
+from models.storage import create_storage  # noqa: E402
+from config import VALID_VIBES  # noqa: E402
+from utils.geo_utils import calculate_distance, METERS_PER_DEGREE  # noqa: E402
+from benchmarks import synthetic  # noqa: E402
+from benchmarks.harness import BenchmarkRun, add_common_arguments, finish  # noqa: E402
+
+BACKENDS = ['sqlite', 'memory']
+DEFAULT_SIZE = 20000
+SAVE_BATCH_SIZE = 500
+QUERY_RADIUS = 1500
+# Radii the conformance checks query at, and how far inside and outside
+# them the edge places lie
+CHECK_RADII = (300, 1500, 4000)
+EDGE_METERS = 0.5
+EDGE_POINTS = 6
+QUERY_LIMIT = 20
+NEAR_RADIUS = 300
+NUM_QUERIES = 24
+NUM_AREAS = 200
+
+
+class Reference:
+    """Brute-force answers from a plain dict of places"""
+
+    def __init__(self):
+        self.places = {}
+
+    def upsert(self, places_with_vibes):
+        for place_data, vibes, source in places_with_vibes:
+            self.places[place_data['place_id']] = (place_data, set(vibes), source)
+
+    def places_near(self, lat, lon, radius):
+        hits = {}
+        for place_id, (place_data, _, _) in self.places.items():
+            distance = calculate_distance(lat, lon, place_data['latitude'], place_data['longitude'])
+            if distance <= radius:
+                hits[place_id] = distance
+        return hits
+
+    def places_by_vibe(self, lat, lon, radius, vibe):
+        hits = {}
+        for place_id, (place_data, vibes, _) in self.places.items():
+            if vibe not in vibes:
+                continue
+            distance = calculate_distance(lat, lon, place_data['latitude'], place_data['longitude'])
+            if distance <= radius:
+                hits[place_id] = (place_data.get('rating') or 0, distance)
+        return hits
+
+
+def edge_places(points):
+    """Places EDGE_METERS inside and outside each check radius, due N/S/E/W of the first query points"""
+    places = []
+    for i, (lat, lon) in enumerate(points[:EDGE_POINTS]):
+        for radius in CHECK_RADII:
+            for distance in (radius - EDGE_METERS, radius + EDGE_METERS):
+                for direction, (north, east) in zip('nsew', ((1, 0), (-1, 0), (0, 1), (0, -1))):
+                    place_data = {
+                        'place_id': f'edge-{i}-{radius}-{distance:g}-{direction}',
+                        'name': f'Edge {i} {direction}',
+                        'latitude': lat + north * distance / METERS_PER_DEGREE,
+                        'longitude': lon + east * distance / (METERS_PER_DEGREE * math.cos(math.radians(lat))),
+                        'google_type': 'park',
+                        'address': '',
+                        'rating': 4.0,
+                        'user_ratings_total': 10,
+                    }
+                    places.append((place_data, list(VALID_VIBES), 'static'))
+    return places
+
+
+def new_storage(name):
+    """A backend with no places, on a fresh database for SQLite"""
+    if name == 'sqlite':
+        database.DB_PATH = os.path.join(_scratch_dir, f'storage-{len(os.listdir(_scratch_dir))}.db')
+    storage = create_storage(name)
+    storage.initialize()
+    return storage
+
+
+def check_queries(storage, reference, points, failures, label):
+    """Compare radius queries (every vibe and radius, with and without a limit) against the reference"""
+    for i, (lat, lon) in enumerate(points):
+        for radius in CHECK_RADII:
+            check_query(storage, reference, lat, lon, radius, VALID_VIBES[i % len(VALID_VIBES)], failures, label)
+
+
+def check_query(storage, reference, lat, lon, radius, vibe, failures, label):
+    """Compare one radius query against the reference"""
+    expected = reference.places_by_vibe(lat, lon, radius, vibe)
+    table = storage.places_by_vibe(lat, lon, radius, VIBE_BITS[vibe])
+    got = {table.place_ids[j]: (table.ratings[j] or 0, table.distances[j]) for j in range(len(table))}
+
+    if set(got) != set(expected):
+        failures.append(f'{label}: {vibe} within {radius} m of ({lat:.4f}, {lon:.4f}) returned '
+                        f'{len(got)} places, expected {len(expected)}')
+        return
+    for place_id, (rating, distance) in got.items():
+        if rating != expected[place_id][0] or abs(distance - expected[place_id][1]) > 0.01:
+            failures.append(f'{label}: {place_id} has rating/distance {rating}/{distance}, '
+                            f'expected {expected[place_id]}')
+            break
+    ratings = [table.ratings[j] or 0 for j in range(len(table))]
+    if ratings != sorted(ratings, reverse=True):
+        failures.append(f'{label}: {vibe} within {radius} m of ({lat:.4f}, {lon:.4f}) is not sorted by rating')
+
+    # Ties may come back in any order, so only the ratings are compared
+    limited = storage.places_by_vibe(lat, lon, radius, VIBE_BITS[vibe], QUERY_LIMIT)
+    best = sorted((rating for rating, _ in expected.values()), reverse=True)[:QUERY_LIMIT]
+    if [limited.ratings[j] or 0 for j in range(len(limited))] != best or \
+            any(limited.place_ids[j] not in expected for j in range(len(limited))):
+        failures.append(f'{label}: top {QUERY_LIMIT} {vibe} within {radius} m of ({lat:.4f}, {lon:.4f}) differ')
+
+
+def check_backend(name, places, points, failures):
+    """Run every conformance check against one backend"""
+    storage = new_storage(name)
+    reference = Reference()
+
+    places = places + edge_places(points)
+    storage.upsert_places(places)
+    reference.upsert(places)
+    check_queries(storage, reference, points, failures, f'{name} insert')
+
+    # Move some places, change others' vibes and ratings, and add a few
+    updates = []
+    for i, (place_data, vibes, source) in enumerate(places[:len(places) // 10]):
+        place_data = dict(place_data)
+        if i % 3 == 0:
+            place_data['latitude'], place_data['longitude'] = points[i % len(points)]
+        elif i % 3 == 1:
+            vibes = [VALID_VIBES[i % len(VALID_VIBES)]]
+        place_data['rating'] = None if i % 7 == 0 else 5.0
+        updates.append((place_data, vibes, 'llm'))
+    updates += [
+        (dict(place_data, place_id=place_data['place_id'] + '-new'), vibes, source)
+        for place_data, vibes, source in places[:50]
+    ]
+    storage.upsert_places(updates)
+    reference.upsert(updates)
+    check_queries(storage, reference, points, failures, f'{name} update')
+
+    if name == 'sqlite':
+        # Queries from the memory-mapped snapshot, then with changes since the export
+        place_snapshot.export_snapshot()
+        check_queries(storage, reference, points, failures, f'{name} snapshot')
+        storage.upsert_places(updates[:100])
+        check_queries(storage, reference, points, failures, f'{name} snapshot+delta')
+        os.remove(place_snapshot.snapshot_path())
+
+    # Any place near a point, nearest first
+    near_checks = [(lat, lon, NEAR_RADIUS) for lat, lon in points[:8]]
+    near_checks += [(lat, lon, radius) for lat, lon in points[:EDGE_POINTS] for radius in CHECK_RADII]
+    for lat, lon, radius in near_checks:
+        expected = reference.places_near(lat, lon, radius)
+        near = storage.places_near(lat, lon, radius)
+        distances = [place['distance'] for place in near]
+        if {place['place_id'] for place in near} != set(expected) or distances != sorted(distances):
+            failures.append(f'{name}: places_near({lat:.4f}, {lon:.4f}, {radius}) returned {len(near)} places, '
+                            f'expected {len(expected)} nearest first')
+            break
+
+    # Lookup by id
+    sample = [place_data['place_id'] for place_data, _, _ in updates[::7]] + ['missing-place']
+    stored = storage.get_places(sample)
+    if set(stored) != set(sample[:-1]):
+        failures.append(f'{name}: get_places returned {len(stored)} of {len(sample) - 1} places')
+    for place_id, place in stored.items():
+        place_data, vibes, source = reference.places[place_id]
+        expected = {key: place_data.get(key) for key in (
+            'place_id', 'name', 'latitude', 'longitude', 'google_type', 'address', 'rating', 'user_ratings_total')}
+        expected.update(categorization_source=source, vibes=sorted(vibes))
+        if dict(place, vibes=sorted(place['vibes'])) != expected:
+            failures.append(f'{name}: get_places({place_id}) = {place}, expected {expected}')
+            break
+    if storage.get_place('missing-place') is not None:
+        failures.append(f'{name}: get_place returned a place that was never stored')
+    if len(storage.all_places()) != len(reference.places):
+        failures.append(f'{name}: all_places has {len(storage.all_places())} places, '
+                        f'expected {len(reference.places)}')
+
+    # Alias links
+    canonical = sample[0]
+    storage.add_aliases({'alias-1': canonical, 'alias-2': canonical})
+    aliases = storage.get_aliases(['alias-1', 'alias-2', canonical, 'missing-place'])
+    if aliases != {'alias-1': canonical, 'alias-2': canonical}:
+        failures.append(f'{name}: get_aliases = {aliases}')
+
+    # Coverage: new areas are fresh, a refresh resets an area's age
+    areas = synthetic.generate_indexed_areas(5)
+    for lat, lon, radius in areas:
+        storage.mark_area_indexed(lat, lon, radius)
+    indexed = storage.indexed_areas()
+    if sorted((a['center_lat'], a['center_lon'], a['radius']) for a in indexed) != sorted(areas):
+        failures.append(f'{name}: indexed_areas = {indexed}, expected {areas}')
+    elif any(not -1 <= a['age_seconds'] < 60 for a in indexed):
+        failures.append(f'{name}: new areas have ages {[a["age_seconds"] for a in indexed]}')
+    else:
+        time.sleep(1.1)
+        area = indexed[0]
+        storage.mark_area_refreshed(area['id'], sample[:3])
+        ages = {a['id']: a['age_seconds'] for a in storage.indexed_areas()}
+        if not ages[area['id']] < min(age for area_id, age in ages.items() if area_id != area['id']):
+            failures.append(f'{name}: refreshing area {area["id"]} did not reset its age ({ages})')
+
+
+def bench_backend(run, name, places, points):
+    """Time the storage operations place_service uses"""
+    print(f"\n{name}")
+    storage = new_storage(name)
+
+    def upsert_all():
+        for i in range(0, len(places), SAVE_BATCH_SIZE):
+            storage.upsert_places(places[i:i + SAVE_BATCH_SIZE])
+
+    result = run.measure(f'{name}.upsert_places[n={len(places)}]', upsert_all, min_runs=1, max_runs=1)
+    run.results[f'{name}.upsert_places[n={len(places)}]']['places_per_second'] = \
+        len(places) / (result['median_ms'] / 1000)
+
+    state = {'i': 0}
+
+    def query(limit):
+        lat, lon = points[state['i'] % len(points)]
+        bit = VIBE_BITS[VALID_VIBES[state['i'] % len(VALID_VIBES)]]
+        state['i'] += 1
+        storage.places_by_vibe(lat, lon, QUERY_RADIUS, bit, limit)
+
+    run.measure(f'{name}.places_by_vibe[n={len(places)}]', lambda: query(None), max_runs=32)
+    run.measure(f'{name}.places_by_vibe[n={len(places)},limit={QUERY_LIMIT}]', lambda: query(QUERY_LIMIT),
+                max_runs=32)
+
+    ids = [place_data['place_id'] for place_data, _, _ in places[::max(1, len(places) // 200)]]
+    run.measure(f'{name}.get_places[ids={len(ids)}]', lambda: storage.get_places(ids))
+
+    def near():
+        lat, lon = points[state['i'] % len(points)]
+        state['i'] += 1
+        storage.places_near(lat, lon, NEAR_RADIUS)
+
+    run.measure(f'{name}.places_near[n={len(places)},radius={NEAR_RADIUS}]', near, max_runs=32)
+
+    for lat, lon, radius in synthetic.generate_indexed_areas(NUM_AREAS):
+        storage.mark_area_indexed(lat, lon, radius)
+    run.measure(f'{name}.indexed_areas[areas={NUM_AREAS}]', storage.indexed_areas)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=BACKENDS)
+    parser.add_argument('--size', type=int, default=DEFAULT_SIZE, help='Places to benchmark with')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--skip-bench', action='store_true', help='Only run the conformance checks')
+    add_common_arguments(parser)
+    args = parser.parse_args(argv)
+
+    # Conformance runs on a smaller set: the reference is a full scan per query
+    places = synthetic.generate_places(min(args.size, 5000), args.seed)
+    points = synthetic.generate_query_points(NUM_QUERIES, args.seed)
+    failures = []
+    for name in args.backends:
+        before = len(failures)
+        check_backend(name, places, points, failures)
+        print(f"{name}: {'ok' if len(failures) == before else f'{len(failures) - before} failure(s)'}")
+    for failure in failures:
+        print(f"  FAIL {failure}")
+    if failures:
+        return 1
+
+    if args.skip_bench:
+        return 0
+    run = BenchmarkRun('storage')
+    places = synthetic.generate_places(args.size, args.seed)
+    for name in args.backends:
+        bench_backend(run, name, places, points)
+    return finish(run, args.output, args.compare, args.threshold)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Evaluate the local vibe classifier against the labeled examples (and the LLM).
+
+Run from the backend directory:
+    python -m benchmarks.eval_vibe_classifier
+    python -m benchmarks.eval_vibe_classifier --llm -o vibe_eval.json
+
+The local model is scored with k-fold cross-validation (each fold's model
+never sees the examples it is scored on). For each threshold, it reports
+how often inputs would be escalated and how accurate the locally answered
+ones are. --llm also sends every example to OpenRouter (OPENROUTER_API_KEY,
+or a local stand-in via OPENROUTER_BASE_URL) and reports its accuracy,
+latency and the accuracy of the combined local-then-LLM pipeline.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+from benchmarks.harness import BenchmarkRun, add_common_arguments, finish
+from config import VIBE_CLASSIFIER_THRESHOLD
+from services.ai_service import detect_vibe_with_llm
+from services.vibe_classifier import VibeModel, classify_vibe, load_examples, EXAMPLES_PATH
+
+
+def cross_validate(examples, folds, seed):
+    """Classify every example with a model trained on the other folds; returns (example, result, ms) triples"""
+    shuffled = list(examples)
+    random.Random(seed).shuffle(shuffled)
+
+    predictions = []
+    for fold in range(folds):
+        held_out = shuffled[fold::folds]
+        training = [e for i, e in enumerate(shuffled) if i % folds != fold]
+        model = VibeModel.train(training)
+        for example in held_out:
+            started = time.perf_counter()
+            result = classify_vibe(example['text'], model)
+            predictions.append((example, result, (time.perf_counter() - started) * 1000))
+    return predictions
+
+
+def location_matches(predicted, expected):
+    return (predicted or '').casefold() == (expected or '').casefold()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--examples', default=EXAMPLES_PATH, help='Labeled examples (JSON lines)')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--thresholds', type=float, nargs='+',
+                        default=sorted({0.4, 0.5, 0.6, 0.7, 0.8, 0.9, VIBE_CLASSIFIER_THRESHOLD}))
+    parser.add_argument('--llm', action='store_true', help='Also classify every example with the LLM')
+    add_common_arguments(parser)
+    args = parser.parse_args(argv)
+
+    examples = load_examples(args.examples)
+    run = BenchmarkRun('vibe_classifier')
+    print(f"{len(examples)} examples, {args.folds}-fold cross-validation\n")
+
+    predictions = cross_validate(examples, args.folds, args.seed)
+    run.add_samples('local_classify', [ms for _, _, ms in predictions])
+    run.record(
+        'local_accuracy',
+        vibe=round(sum(r['vibe'] == e['vibe'] for e, r, _ in predictions) / len(predictions), 3),
+        location=round(sum(location_matches(r['location'], e['location']) for e, r, _ in predictions) / len(predictions), 3)
+    )
+
+    llm_results = {}
+    if args.llm:
+        api_key = os.getenv('OPENROUTER_API_KEY')
+        if not api_key:
+            parser.error('--llm needs OPENROUTER_API_KEY')
+        timings = []
+        for example in examples:
+            started = time.perf_counter()
+            try:
+                llm_results[example['text']] = detect_vibe_with_llm(api_key, example['text'])
+            except Exception as e:
+                print(f"  LLM error for {example['text']!r}: {e}")
+            timings.append((time.perf_counter() - started) * 1000)
+        run.add_samples('llm_classify', timings)
+        answered = [e for e in examples if e['text'] in llm_results]
+        run.record(
+            'llm_accuracy',
+            vibe=round(sum(llm_results[e['text']]['vibe'] == e['vibe'] for e in answered) / max(1, len(answered)), 3),
+            location=round(sum(
+                location_matches(llm_results[e['text']]['location'], e['location']) for e in answered
+            ) / max(1, len(answered)), 3)
+        )
+
+    print()
+    for threshold in args.thresholds:
+        local = [(e, r) for e, r, _ in predictions if r['confidence'] >= threshold]
+        values = {
+            'escalation_rate': round(1 - len(local) / len(predictions), 3),
+            'local_vibe_accuracy': round(sum(r['vibe'] == e['vibe'] for e, r in local) / max(1, len(local)), 3),
+            'local_location_accuracy': round(
+                sum(location_matches(r['location'], e['location']) for e, r in local) / max(1, len(local)), 3
+            ),
+        }
+        if llm_results:
+            combined = [
+                r if r['confidence'] >= threshold else llm_results.get(e['text'], r)
+                for e, r, _ in predictions
+            ]
+            values['combined_vibe_accuracy'] = round(
+                sum(c['vibe'] == e['vibe'] for c, (e, _, _) in zip(combined, predictions)) / len(predictions), 3
+            )
+        run.record(f'threshold_{threshold:.2f}', **values)
+
+    return finish(run, args.output, args.compare, args.threshold)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""Timing, result storage and baseline comparison shared by the benchmarks"""
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+
+class BenchmarkRun:
+    """Collects timings for named benchmarks and writes them as JSON"""
+
+    def __init__(self, suite):
+        self.suite = suite
+        self.results = {}
+
+    def measure(self, name, fn, min_runs=3, max_runs=50, time_budget=2.0, **extra):
+        """
+        Time fn() repeatedly and record the result under name.
+
+        Runs at least min_runs times and stops after max_runs or once
+        time_budget seconds have been spent.
+        """
+        timings = []
+        started = time.perf_counter()
+        while len(timings) < max_runs:
+            t0 = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - t0) * 1000)
+            if len(timings) >= min_runs and time.perf_counter() - started >= time_budget:
+                break
+
+        return self.add_samples(name, timings, **extra)
+
+    def add_samples(self, name, timings, **extra):
+        """Record timings (in ms) measured elsewhere, e.g. in a subprocess"""
+        timings = sorted(timings)
+        result = {
+            'median_ms': statistics.median(timings),
+            'min_ms': timings[0],
+            'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+            'runs': len(timings),
+        }
+        result.update(extra)
+        self.results[name] = result
+        print(f"  {name:<50} median {result['median_ms']:10.3f} ms  p95 {result['p95_ms']:10.3f} ms  ({len(timings)} runs)")
+        return result
+
+    def record(self, name, **values):
+        """Record a non-timing result (sizes, counts)"""
+        self.results[name] = values
+        print(f"  {name:<50} {values}")
+
+    def to_dict(self):
+        return {
+            'suite': self.suite,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'results': self.results,
+        }
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+        print(f"Wrote {len(self.results)} results to {path}")
+
+
+def compare_results(current, baseline, threshold=0.15, metric='median_ms'):
+    """
+    Compare two result dicts and report regressions.
+
+    Args:
+        current: Results dict from BenchmarkRun.to_dict()
+        baseline: Stored results dict to compare against
+        threshold: Allowed relative slowdown (0.15 = 15%)
+        metric: Timing field to compare
+
+    Returns:
+        List of (name, baseline_value, current_value, change) for regressions
+    """
+    regressions = []
+    base_results = baseline.get('results', {})
+
+    for name, result in sorted(current.get('results', {}).items()):
+        if metric not in result or metric not in base_results.get(name, {}):
+            continue
+        before = base_results[name][metric]
+        after = result[metric]
+        change = (after - before) / before if before else 0.0
+        flag = 'REGRESSION' if change > threshold else ('faster' if change < -threshold else '')
+        print(f"  {name:<50} {before:10.3f} -> {after:10.3f} ms  {change:+7.1%}  {flag}")
+        if change > threshold:
+            regressions.append((name, before, after, change))
+
+    return regressions
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def finish(run, output=None, compare=None, threshold=0.15):
+    """Save results and compare against a baseline; returns a process exit code"""
+    if output:
+        run.save(output)
+
+    if not compare:
+        return 0
+
+    print(f"\nComparing against {compare} (threshold {threshold:.0%})")
+    regressions = compare_results(run.to_dict(), load_results(compare), threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) found")
+        return 1
+    print("\nNo regressions")
+    return 0
+
+
+def add_common_arguments(parser):
+    parser.add_argument('--output', '-o', help='Write results to this JSON file')
+    parser.add_argument('--compare', help='Baseline JSON file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help='Relative slowdown flagged as a regression (default 0.15)')
@@ -0,0 +1,149 @@
+"""Deterministic synthetic data for benchmarks (places, indexed areas, routes)"""
+import math
+import random
+
+from config import PLACE_TYPE_TO_VIBES
+from services.google_maps_service import encode_polyline
+from utils.geo_utils import calculate_distance
+
+# City centers the synthetic places are spread around
+CITIES = [
+    ('london', 51.5074, -0.1278),
+    ('new_york', 40.7128, -74.0060),
+    ('san_francisco', 37.7749, -122.4194),
+    ('paris', 48.8566, 2.3522),
+    ('tokyo', 35.6762, 139.6503),
+    ('berlin', 52.5200, 13.4050),
+    ('sydney', -33.8688, 151.2093),
+    ('toronto', 43.6532, -79.3832),
+]
+
+# Standard deviation of place spread around a city center (meters)
+CITY_SPREAD_METERS = 6000
+
+METERS_PER_DEGREE = 111320
+
+PLACE_TYPES = sorted(PLACE_TYPE_TO_VIBES)
+
+NAME_WORDS = [
+    'Green', 'Royal', 'Old', 'River', 'Garden', 'Corner', 'Golden', 'Hidden',
+    'Little', 'Grand', 'North', 'South', 'Market', 'Canal', 'Hill', 'Park',
+]
+
+
+def offset_point(lat, lon, north_m, east_m):
+    """Move a point by a distance in meters north and east"""
+    new_lat = lat + north_m / METERS_PER_DEGREE
+    new_lon = lon + east_m / (METERS_PER_DEGREE * math.cos(math.radians(lat)))
+    return new_lat, new_lon
+
+
+def generate_places(count, seed=42):
+    """
+    Generate places spread across CITIES.
+
+    Returns:
+        List of (place_data, vibes, source) tuples as taken by save_places_bulk
+    """
+    rng = random.Random(seed)
+    places = []
+
+    for i in range(count):
+        city, center_lat, center_lon = CITIES[i % len(CITIES)]
+        lat, lon = offset_point(
+            center_lat, center_lon,
+            rng.gauss(0, CITY_SPREAD_METERS), rng.gauss(0, CITY_SPREAD_METERS)
+        )
+        place_type = rng.choice(PLACE_TYPES)
+        name = f"{rng.choice(NAME_WORDS)} {rng.choice(NAME_WORDS)} {place_type.replace('_', ' ').title()}"
+
+        place = {
+            'place_id': f'synthetic-{city}-{i}',
+            'name': name,
+            'latitude': lat,
+            'longitude': lon,
+            'google_type': place_type,
+            'address': f'{rng.randint(1, 300)} {rng.choice(NAME_WORDS)} Street, {city.replace("_", " ").title()}',
+            'rating': round(min(5.0, max(1.0, rng.gauss(4.2, 0.5))), 1),
+            'user_ratings_total': int(rng.expovariate(1 / 400)),
+        }
+        places.append((place, list(PLACE_TYPE_TO_VIBES[place_type]), 'static'))
+
+    return places
+
+
+def generate_indexed_areas(count, seed=42):
+    """Generate (lat, lon, radius) coverage circles around CITIES"""
+    rng = random.Random(seed + 1)
+    areas = []
+    for i in range(count):
+        _, center_lat, center_lon = CITIES[i % len(CITIES)]
+        lat, lon = offset_point(
+            center_lat, center_lon,
+            rng.gauss(0, CITY_SPREAD_METERS), rng.gauss(0, CITY_SPREAD_METERS)
+        )
+        areas.append((lat, lon, rng.choice([600, 800, 1200, 1800, 2400])))
+    return areas
+
+
+def generate_query_points(count, seed=42):
+    """Generate query centers near CITIES"""
+    rng = random.Random(seed + 2)
+    points = []
+    for i in range(count):
+        _, center_lat, center_lon = CITIES[i % len(CITIES)]
+        points.append(offset_point(
+            center_lat, center_lon,
+            rng.gauss(0, CITY_SPREAD_METERS / 2), rng.gauss(0, CITY_SPREAD_METERS / 2)
+        ))
+    return points
+
+
+def generate_route_coordinates(lat, lon, num_points, step_meters=15, seed=42):
+    """
+    Generate a walking-like loop as a list of [lng, lat] coordinates.
+
+    The heading drifts slowly with occasional street-corner turns, then the
+    path closes back towards the start like a circular route.
+    """
+    rng = random.Random(seed + 3)
+    heading = rng.uniform(0, 2 * math.pi)
+    coordinates = [[lon, lat]]
+    cur_lat, cur_lon = lat, lon
+
+    for i in range(1, num_points):
+        if i > num_points * 0.6:
+            # Head home for the last part of the loop
+            heading = math.atan2(lat - cur_lat, (lon - cur_lon) * math.cos(math.radians(lat)))
+        elif rng.random() < 0.08:
+            heading += rng.choice([-1, 1]) * math.pi / 2
+        else:
+            heading += rng.gauss(0, 0.15)
+
+        cur_lat, cur_lon = offset_point(
+            cur_lat, cur_lon,
+            step_meters * math.sin(heading), step_meters * math.cos(heading)
+        )
+        coordinates.append([cur_lon, cur_lat])
+
+    return coordinates
+
+
+def generate_polyline(num_points, seed=42):
+    """Generate an encoded polyline for a synthetic route in the first city"""
+    _, lat, lon = CITIES[0]
+    return encode_polyline(generate_route_coordinates(lat, lon, num_points, seed=seed))
+
+
+def places_to_dicts(places_with_vibes, center_lat, center_lon, radius):
+    """Shape generated places like get_places_by_vibe results around a center"""
+    result = []
+    for place, vibes, source in places_with_vibes:
+        distance = calculate_distance(center_lat, center_lon, place['latitude'], place['longitude'])
+        if distance <= radius:
+            result.append(dict(
+                place, type=place['google_type'], vibes=vibes,
+                categorization_source=source, distance=distance
+            ))
+    result.sort(key=lambda p: p['rating'], reverse=True)
+    return result
@@ -1,4 +1,5 @@
 """Configuration for vibe-based walking routes"""
+import os
 
 # Valid vibes
 VALID_VIBES = ['chill', 'date', 'chaos', 'aesthetic']
@@ -132,3 +133,142 @@ VIBE_CONFIGS = {
         'noise_preference': 'any'
     }
 }
+
+# Maximum number of alternative routes returned for one /api/generate-route call
+MAX_ROUTE_ALTERNATIVES = 5
+
+# Route result cache (see services/route_cache.py)
+ROUTE_CACHE_ENABLED = os.getenv('ROUTE_CACHE_ENABLED', 'true').lower() == 'true'
+ROUTE_CACHE_GRID_METERS = float(os.getenv('ROUTE_CACHE_GRID_METERS', 150))  # Start/destination snapping grid
+ROUTE_CACHE_DURATION_BUCKET = int(os.getenv('ROUTE_CACHE_DURATION_BUCKET', 10))  # Minutes per bucket
+ROUTE_CACHE_MAX_ENTRIES = int(os.getenv('ROUTE_CACHE_MAX_ENTRIES', 1024))
+ROUTE_CACHE_TTL_SECONDS = int(os.getenv('ROUTE_CACHE_TTL_SECONDS', 6 * 60 * 60))
+ROUTE_CACHE_DB_PATH = os.getenv('ROUTE_CACHE_DB_PATH')  # Optional SQLite file for persistence
+
+# Response compression (gzip, or brotli when the brotli package is installed)
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESSION_MIN_BYTES', 1024))
+
+# Batch route generation (see services/batch_service.py)
+BATCH_MAX_ROUTES = int(os.getenv('BATCH_MAX_ROUTES', 5000))  # Route specs accepted per batch
+BATCH_AREA_GRID_METERS = float(os.getenv('BATCH_AREA_GRID_METERS', 1000))  # Specs in one cell share place queries
+BATCH_OPTIMIZER_WORKERS = int(os.getenv('BATCH_OPTIMIZER_WORKERS', os.cpu_count() or 1))  # 0 runs the optimizer inline
+BATCH_DIRECTIONS_CONCURRENCY = int(os.getenv('BATCH_DIRECTIONS_CONCURRENCY', 8))
+BATCH_DIRECTIONS_RATE = float(os.getenv('BATCH_DIRECTIONS_RATE', 10))  # Directions requests per second
+
+# Local vibe classifier run before the OpenRouter call (see services/vibe_classifier.py)
+VIBE_CLASSIFIER_ENABLED = os.getenv('VIBE_CLASSIFIER_ENABLED', 'true').lower() == 'true'
+VIBE_CLASSIFIER_THRESHOLD = float(os.getenv('VIBE_CLASSIFIER_THRESHOLD', 0.7))  # Below this, ask the LLM
+VIBE_CACHE_MAX_ENTRIES = int(os.getenv('VIBE_CACHE_MAX_ENTRIES', 4096))
+VIBE_CACHE_TTL_SECONDS = int(os.getenv('VIBE_CACHE_TTL_SECONDS', 24 * 60 * 60))
+
+# Offline gazetteer for /api/autocomplete and geocoding (see services/gazetteer.py)
+GAZETTEER_IMPORT_PATH = os.getenv('GAZETTEER_IMPORT_PATH')  # Optional CSV: name,latitude,longitude[,kind,weight,address]
+GAZETTEER_REFRESH_SECONDS = int(os.getenv('GAZETTEER_REFRESH_SECONDS', 10 * 60))
+GAZETTEER_AMBIGUOUS_METERS = float(os.getenv('GAZETTEER_AMBIGUOUS_METERS', 30000))  # Same-name entries farther apart go to Google
+GAZETTEER_CLUSTER_METERS = float(os.getenv('GAZETTEER_CLUSTER_METERS', 15000))  # Address localities merged within this distance
+GAZETTEER_MAX_GEOCODED = int(os.getenv('GAZETTEER_MAX_GEOCODED', 10000))  # Google-geocoded names remembered, oldest dropped first
+AUTOCOMPLETE_MAX_RESULTS = int(os.getenv('AUTOCOMPLETE_MAX_RESULTS', 10))
+
+# Clustered viewport browsing for /api/places (see services/place_clusters.py)
+CLUSTER_CELL_PIXELS = int(os.getenv('CLUSTER_CELL_PIXELS', 64))  # Grid cell edge in screen pixels (power of two)
+CLUSTER_MAX_ZOOM = int(os.getenv('CLUSTER_MAX_ZOOM', 20))  # Higher zooms are clustered as this one
+CLUSTER_MAX_RESULTS = int(os.getenv('CLUSTER_MAX_RESULTS', 1000))  # Largest clusters kept past this
+CLUSTER_CACHE_MAX_GRIDS = int(os.getenv('CLUSTER_CACHE_MAX_GRIDS', 64))  # Cached (vibe, zoom) grids
+CLUSTER_REFRESH_SECONDS = int(os.getenv('CLUSTER_REFRESH_SECONDS', 5 * 60))
+
+# Materialized top-K places per (tile, vibe) by rating (see models/database.py)
+PLACE_TILE_METERS = float(os.getenv('PLACE_TILE_METERS', 500))  # Tile edge (north-south)
+PLACE_TILE_TOP_K = int(os.getenv('PLACE_TILE_TOP_K', 50))  # Largest limit answered from the tile lists
+ROUTE_PLACE_LIMIT = int(os.getenv('ROUTE_PLACE_LIMIT', 0))  # Top-rated places a route considers (0 = all)
+
+# Stale-while-revalidate refresh of indexed areas (see services/refresh_queue.py)
+AREA_REFRESH_TTL_SECONDS = int(os.getenv('AREA_REFRESH_TTL_SECONDS', 14 * 24 * 60 * 60))  # Older areas are re-discovered in the background
+AREA_REFRESH_QUOTA_PER_HOUR = float(os.getenv('AREA_REFRESH_QUOTA_PER_HOUR', 60))  # Places API requests refreshes may use (0 disables)
+AREA_REFRESH_QUEUE_SIZE = int(os.getenv('AREA_REFRESH_QUEUE_SIZE', 100))  # Further stale areas are skipped until there is room
+
+# places.db maintenance (see services/maintenance.py)
+DB_JOURNAL_MODE = os.getenv('DB_JOURNAL_MODE', 'WAL')  # WAL lets reads continue during writes and maintenance
+DB_MAINTENANCE_INTERVAL_SECONDS = int(os.getenv('DB_MAINTENANCE_INTERVAL_SECONDS', 0))  # 0 disables the scheduled job
+
+# Outbound request scheduler (see services/upstream.py). Per upstream:
+# requests per second, burst size and calls in flight at once
+UPSTREAM_LIMITS = {
+    name: (
+        float(os.getenv(f'UPSTREAM_{name.upper()}_RATE', rate)),
+        int(os.getenv(f'UPSTREAM_{name.upper()}_BURST', burst)),
+        int(os.getenv(f'UPSTREAM_{name.upper()}_CONCURRENCY', concurrency)),
+    )
+    for name, (rate, burst, concurrency) in {
+        'google_places': (10, 20, 8),
+        'google_directions': (10, 20, 8),
+        'google_geocode': (10, 20, 4),
+        'openrouter': (5, 10, 4),
+        'gemini': (2, 5, 2),
+    }.items()
+}
+# Longest a call waits for its turn, per priority class (highest priority first)
+UPSTREAM_QUEUE_TIMEOUTS = {
+    'interactive': float(os.getenv('UPSTREAM_QUEUE_TIMEOUT_INTERACTIVE', 2)),
+    'batch': float(os.getenv('UPSTREAM_QUEUE_TIMEOUT_BATCH', 30)),
+    'background': float(os.getenv('UPSTREAM_QUEUE_TIMEOUT_BACKGROUND', 120)),
+}
+
+# End-to-end deadline budgets (see utils/deadline.py)
+ROUTE_DEADLINE_SECONDS = float(os.getenv('ROUTE_DEADLINE_SECONDS', 8))  # Latency SLO for /api/generate-route
+INDEX_MIN_SECONDS = float(os.getenv('INDEX_MIN_SECONDS', 4))  # Budget needed to index a new area (else use what's stored)
+DESCRIPTION_MIN_SECONDS = float(os.getenv('DESCRIPTION_MIN_SECONDS', 1.5))  # Budget needed to ask Gemini (else static text)
+GEMINI_TIMEOUT_SECONDS = float(os.getenv('GEMINI_TIMEOUT_SECONDS', 10))
+# Hedged Directions requests: a second copy is sent once the first has taken
+# longer than this percentile of recent Directions latencies
+DIRECTIONS_HEDGE_ENABLED = os.getenv('DIRECTIONS_HEDGE_ENABLED', 'true').lower() == 'true'
+UPSTREAM_HEDGE_PERCENTILE = float(os.getenv('UPSTREAM_HEDGE_PERCENTILE', 0.95))
+UPSTREAM_HEDGE_MIN_SAMPLES = int(os.getenv('UPSTREAM_HEDGE_MIN_SAMPLES', 20))  # Recent calls needed before hedging
+
+# Per-upstream circuit breakers (see services/upstream.py). A breaker opens
+# when at least CIRCUIT_FAILURE_RATE of the last CIRCUIT_WINDOW calls failed
+# (errors, 5xx/429 or slower than CIRCUIT_SLOW_CALL_SECONDS), rejects calls for
+# CIRCUIT_OPEN_SECONDS, then lets one probe call through to decide
+CIRCUIT_BREAKER_ENABLED = os.getenv('CIRCUIT_BREAKER_ENABLED', 'true').lower() == 'true'
+CIRCUIT_WINDOW = int(os.getenv('CIRCUIT_WINDOW', 20))
+CIRCUIT_MIN_CALLS = int(os.getenv('CIRCUIT_MIN_CALLS', 10))  # Calls in the window before it can open
+CIRCUIT_FAILURE_RATE = float(os.getenv('CIRCUIT_FAILURE_RATE', 0.5))
+CIRCUIT_SLOW_CALL_SECONDS = float(os.getenv('CIRCUIT_SLOW_CALL_SECONDS', 5))
+CIRCUIT_OPEN_SECONDS = float(os.getenv('CIRCUIT_OPEN_SECONDS', 30))
+# Expired route cache entries kept to answer from while Directions is down
+ROUTE_CACHE_STALE_SECONDS = int(os.getenv('ROUTE_CACHE_STALE_SECONDS', 24 * 60 * 60))
+
+# Write-behind queue (see models/write_queue.py): all place writes go through
+# one writer thread that groups them into shared transactions
+WRITE_BEHIND_ENABLED = os.getenv('WRITE_BEHIND_ENABLED', 'true').lower() == 'true'
+WRITE_BATCH_MAX_OPS = int(os.getenv('WRITE_BATCH_MAX_OPS', 64))  # Writes committed together at most
+WRITE_BATCH_WAIT_MS = float(os.getenv('WRITE_BATCH_WAIT_MS', 0))  # Extra wait for more writes (0 = commit what's queued)
+WRITE_QUEUE_SIZE = int(os.getenv('WRITE_QUEUE_SIZE', 1000))  # Callers block when this many writes are pending
+DB_BUSY_TIMEOUT_SECONDS = float(os.getenv('DB_BUSY_TIMEOUT_SECONDS', 30))  # Writer's wait for other processes' locks
+
+# Read-only memory-mapped place snapshot (see models/place_snapshot.py). Radius
+# queries read it when the file exists and take only places changed since the
+# export from SQLite; past SNAPSHOT_MAX_DELTA_ROWS changes it is ignored until
+# re-exported. Defaults to places.db.snap next to the database
+PLACE_SNAPSHOT_PATH = os.getenv('PLACE_SNAPSHOT_PATH')
+SNAPSHOT_MAX_DELTA_ROWS = int(os.getenv('SNAPSHOT_MAX_DELTA_ROWS', 1000))
+
+# Ingest-time deduplication (see services/place_dedup.py): a new place within
+# DEDUP_RADIUS_METERS of a stored (or earlier) one with a similar name and a
+# compatible type is stored as an alias of it instead of as a place of its own
+DEDUP_ENABLED = os.getenv('DEDUP_ENABLED', 'true').lower() == 'true'
+DEDUP_RADIUS_METERS = float(os.getenv('DEDUP_RADIUS_METERS', 30))
+DEDUP_NAME_SIMILARITY = float(os.getenv('DEDUP_NAME_SIMILARITY', 0.85))  # difflib ratio of normalized names
+
+# Place storage backend (see models/storage.py): 'sqlite' (places.db, the
+# default) or 'memory' (process-local, nothing persisted)
+PLACE_STORAGE = os.getenv('PLACE_STORAGE', 'sqlite')
+
+# On-demand request profiling (see utils/profiling.py). A request to a
+# profiled endpoint runs under cProfile and tracemalloc when it carries
+# "X-Profile: <PROFILE_TOKEN>" or is picked at PROFILE_SAMPLE_RATE. With no
+# token and a zero rate the hook isn't installed at all
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))  # Fraction of requests profiled without the header
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', 50))  # Oldest profiles are deleted past this many
+PROFILE_TOP_N = int(os.getenv('PROFILE_TOP_N', 25))  # Functions and allocation sites listed in each report
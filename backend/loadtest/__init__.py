@@ -0,0 +1 @@
+"""Local stand-in upstreams and load generation for end-to-end tests"""
@@ -0,0 +1,324 @@
+"""
+Local stand-in for the Google Places, Geocoding, Directions, OpenRouter and Gemini APIs.
+
+Serves plausible, deterministic data (the same request always gets the same
+answer) with configurable latency and error rates, so the backend can be
+load-tested without spending API quota.
+
+Run from the backend directory:
+    python -m loadtest.fake_upstreams --port 8090 --latency 80:0.5 --error-rate 0.01
+
+Then start the backend pointed at it:
+    GOOGLE_PLACES_BASE_URL=http://localhost:8090 \\
+    GOOGLE_MAPS_BASE_URL=http://localhost:8090 \\
+    OPENROUTER_BASE_URL=http://localhost:8090/api/v1 \\
+    GEMINI_API_ENDPOINT=http://localhost:8090 \\
+    GOOGLE_MAPS_API_KEY=fake OPENROUTER_API_KEY=fake GEMINI_API_KEY=fake \\
+    python app.py
+"""
+import argparse
+import json
+import math
+import random
+import re
+import time
+import zlib
+
+from flask import Flask, request, jsonify
+
+from config import ALL_DISCOVERABLE_TYPES, PLACE_TYPE_TO_VIBES, VALID_VIBES
+from services.google_maps_service import encode_polyline
+from utils.geo_utils import calculate_distance
+
+UPSTREAMS = ['places', 'geocode', 'directions', 'openrouter', 'gemini']
+
+METERS_PER_DEGREE = 111320
+
+# Geocoded names land around this point
+GEOCODE_CENTER = (51.5074, -0.1278)
+
+NAME_WORDS = ['Green', 'Royal', 'Old', 'River', 'Garden', 'Corner', 'Golden', 'Hidden', 'Little', 'Grand']
+
+VIBE_KEYWORDS = {
+    'chaos': ['party', 'bar', 'club', 'drink', 'wild', 'night', 'pub'],
+    'date': ['date', 'romantic', 'partner', 'girlfriend', 'boyfriend', 'dinner'],
+    'aesthetic': ['photo', 'instagram', 'pretty', 'beautiful', 'art', 'view'],
+    'chill': ['relax', 'calm', 'quiet', 'peace', 'stress', 'unwind'],
+}
+
+
+class UpstreamProfile:
+    """Latency distribution (log-normal) and error rate for one fake upstream"""
+
+    def __init__(self, median_ms=50.0, sigma=0.4, error_rate=0.0):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+
+    def delay(self, rng):
+        if self.median_ms <= 0:
+            return 0.0
+        return rng.lognormvariate(math.log(self.median_ms), self.sigma) / 1000
+
+    def __repr__(self):
+        return f'{self.median_ms:g}ms sigma={self.sigma:g} errors={self.error_rate:.1%}'
+
+
+def stable_rng(*parts):
+    """Random generator seeded from request content so answers are deterministic"""
+    return random.Random(zlib.crc32(json.dumps(parts, sort_keys=True, default=str).encode()))
+
+
+def offset_point(lat, lon, north_m, east_m):
+    return (
+        lat + north_m / METERS_PER_DEGREE,
+        lon + east_m / (METERS_PER_DEGREE * math.cos(math.radians(lat)))
+    )
+
+
+def create_app(profiles, seed=0):
+    """Build the fake upstream Flask app for the given {upstream: UpstreamProfile}"""
+    app = Flask(__name__)
+    noise = random.Random(seed)
+
+    def simulate(upstream):
+        """Sleep for the upstream's latency; return an error response if one is injected"""
+        profile = profiles[upstream]
+        time.sleep(profile.delay(noise))
+        if noise.random() < profile.error_rate:
+            if upstream in ('geocode', 'directions'):
+                # Maps web services report errors in the body with HTTP 200
+                return jsonify({'status': 'OVER_QUERY_LIMIT', 'error_message': 'Injected error'}), 200
+            return jsonify({'error': {'code': 429, 'message': 'Injected error'}}), 429
+        return None
+
+    @app.route('/v1/places:searchNearby', methods=['POST'])
+    def places_search_nearby():
+        error = simulate('places')
+        if error:
+            return error
+
+        body = request.get_json(force=True) or {}
+        circle = body.get('locationRestriction', {}).get('circle', {})
+        center = circle.get('center', {})
+        lat = center.get('latitude', 0.0)
+        lon = center.get('longitude', 0.0)
+        radius = circle.get('radius', 1000)
+        types = body.get('includedTypes') or ALL_DISCOVERABLE_TYPES
+        max_results = min(body.get('maxResultCount', 20), 20)
+
+        # Snap the center so nearby searches overlap and return the same venues
+        cell = (round(lat, 3), round(lon, 3))
+        rng = stable_rng('places', cell, round(radius, -1), sorted(types))
+
+        places = []
+        for i in range(max_results):
+            distance = radius * math.sqrt(rng.random())
+            bearing = rng.uniform(0, 2 * math.pi)
+            place_lat, place_lon = offset_point(
+                cell[0], cell[1], distance * math.cos(bearing), distance * math.sin(bearing)
+            )
+            place_type = rng.choice(types)
+            name = f"{rng.choice(NAME_WORDS)} {rng.choice(NAME_WORDS)} {place_type.replace('_', ' ').title()}"
+            places.append({
+                'id': f'fake-{cell[0]}-{cell[1]}-{place_type}-{i}',
+                'displayName': {'text': name, 'languageCode': 'en'},
+                'location': {'latitude': place_lat, 'longitude': place_lon},
+                'rating': round(min(5.0, max(1.0, rng.gauss(4.2, 0.5))), 1),
+                'userRatingCount': int(rng.expovariate(1 / 300)),
+                'formattedAddress': f'{rng.randint(1, 300)} {rng.choice(NAME_WORDS)} Street, London',
+                'types': [place_type, 'point_of_interest', 'establishment'],
+                'primaryType': place_type,
+            })
+
+        return jsonify({'places': places})
+
+    @app.route('/maps/api/geocode/json', methods=['GET'])
+    def geocode():
+        error = simulate('geocode')
+        if error:
+            return error
+
+        address = request.args.get('address', '').strip()
+        if not address or 'nowhere' in address.lower():
+            return jsonify({'status': 'ZERO_RESULTS', 'results': []})
+
+        rng = stable_rng('geocode', address.lower())
+        lat, lon = offset_point(
+            GEOCODE_CENTER[0], GEOCODE_CENTER[1], rng.gauss(0, 5000), rng.gauss(0, 5000)
+        )
+        return jsonify({
+            'status': 'OK',
+            'results': [{
+                'formatted_address': f'{address.title()}, London, UK',
+                'geometry': {'location': {'lat': lat, 'lng': lon}},
+                'place_id': f'fake-geocode-{zlib.crc32(address.lower().encode())}',
+            }]
+        })
+
+    @app.route('/maps/api/directions/json', methods=['GET'])
+    def directions():
+        error = simulate('directions')
+        if error:
+            return error
+
+        def parse(value):
+            lat, lon = value.split(',')
+            return float(lat), float(lon)
+
+        try:
+            points = [parse(request.args['origin'])]
+            if request.args.get('waypoints'):
+                points += [parse(wp) for wp in request.args['waypoints'].split('|')]
+            points.append(parse(request.args['destination']))
+        except (KeyError, ValueError):
+            return jsonify({'status': 'INVALID_REQUEST', 'routes': []})
+
+        rng = stable_rng('directions', points)
+        coordinates = []
+        legs = []
+        for (lat1, lon1), (lat2, lon2) in zip(points, points[1:]):
+            # Wiggle a straight segment every ~40 m to look like streets
+            straight = calculate_distance(lat1, lon1, lat2, lon2)
+            num_steps = max(2, int(straight / 40))
+            for i in range(num_steps):
+                t = i / num_steps
+                jitter = 0.00008 if 0 < i < num_steps else 0
+                coordinates.append([
+                    lon1 + (lon2 - lon1) * t + rng.uniform(-jitter, jitter),
+                    lat1 + (lat2 - lat1) * t + rng.uniform(-jitter, jitter)
+                ])
+
+            leg_distance = int(straight * 1.3)
+            leg_duration = int(leg_distance / 1.33)  # ~80 m/min walking
+            half_distance = leg_distance // 2
+            half_duration = leg_duration // 2
+            legs.append({
+                'distance': {'value': leg_distance},
+                'duration': {'value': leg_duration},
+                'steps': [
+                    {
+                        'html_instructions': f'Head <b>{rng.choice(["north", "east", "south", "west"])}</b>',
+                        'distance': {'value': half_distance},
+                        'duration': {'value': half_duration},
+                    },
+                    {
+                        'html_instructions': f'Turn <b>{rng.choice(["left", "right"])}</b> onto <b>{rng.choice(NAME_WORDS)} Street</b>',
+                        'distance': {'value': leg_distance - half_distance},
+                        'duration': {'value': leg_duration - half_duration},
+                        'maneuver': rng.choice(['turn-left', 'turn-right']),
+                    },
+                ]
+            })
+        coordinates.append([points[-1][1], points[-1][0]])
+
+        return jsonify({
+            'status': 'OK',
+            'routes': [{
+                'legs': legs,
+                'overview_polyline': {'points': encode_polyline(coordinates)}
+            }]
+        })
+
+    @app.route('/api/v1/chat/completions', methods=['POST'])
+    def openrouter_chat():
+        error = simulate('openrouter')
+        if error:
+            return error
+
+        body = request.get_json(force=True) or {}
+        prompt = body.get('messages', [{}])[-1].get('content', '')
+
+        if 'JSON array' in prompt:
+            # Place categorization: vibes for an unknown type
+            match = re.search(r'Google type: (\S+)', prompt)
+            place_type = match.group(1) if match else ''
+            vibes = PLACE_TYPE_TO_VIBES.get(place_type) or [stable_rng('categorize', prompt).choice(VALID_VIBES)]
+            content = json.dumps(vibes)
+        else:
+            # Vibe detection: keyword match on the quoted user text
+            match = re.search(r'User says: "(.*)"', prompt)
+            user_text = (match.group(1) if match else prompt).lower()
+            vibe = next(
+                (v for v, words in VIBE_KEYWORDS.items() if any(w in user_text for w in words)),
+                'chill'
+            )
+            location = re.search(r'\b(?:in|at|around|near) ([A-Z][\w\' ]+)', match.group(1) if match else '')
+            content = f"vibe: {vibe}\nlocation: {location.group(1).strip() if location else 'none'}"
+
+        return jsonify({
+            'id': 'fake-completion',
+            'model': body.get('model', 'fake'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}]
+        })
+
+    @app.route('/v1beta/models/<model>:generateContent', methods=['POST'])
+    def gemini_generate(model):
+        error = simulate('gemini')
+        if error:
+            return error
+
+        body = request.get_json(force=True) or {}
+        text = ' '.join(
+            part.get('text', '')
+            for content in body.get('contents', [])
+            for part in content.get('parts', [])
+        )
+        rng = stable_rng('gemini', text)
+        opener = rng.choice(['Wander past', 'Stroll by', 'Take in'])
+        return jsonify({
+            'candidates': [{
+                'content': {'parts': [{'text': f'{opener} some great spots on this walk. Enjoy the vibe!'}], 'role': 'model'},
+                'finishReason': 'STOP',
+                'index': 0,
+            }]
+        })
+
+    return app
+
+
+def parse_latency(value):
+    """Parse 'MEDIAN_MS[:SIGMA]' into (median_ms, sigma)"""
+    median, _, sigma = value.partition(':')
+    return float(median), float(sigma) if sigma else 0.4
+
+
+def build_profiles(args):
+    median_ms, sigma = parse_latency(args.latency)
+    profiles = {name: UpstreamProfile(median_ms, sigma, args.error_rate) for name in UPSTREAMS}
+
+    # Per-upstream overrides: NAME=MEDIAN_MS[:SIGMA][@ERROR_RATE]
+    for override in args.upstream or []:
+        name, _, spec = override.partition('=')
+        if name not in profiles:
+            raise SystemExit(f'Unknown upstream {name!r}; choose from {UPSTREAMS}')
+        latency, _, error_rate = spec.partition('@')
+        median_ms, sigma = parse_latency(latency)
+        profiles[name] = UpstreamProfile(
+            median_ms, sigma, float(error_rate) if error_rate else profiles[name].error_rate
+        )
+
+    return profiles
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency', default='50:0.4',
+                        help='Default latency as MEDIAN_MS[:SIGMA] of a log-normal distribution')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Default fraction of failed calls')
+    parser.add_argument('--upstream', action='append', metavar='NAME=MEDIAN_MS[:SIGMA][@ERROR_RATE]',
+                        help=f'Per-upstream override, NAME is one of {", ".join(UPSTREAMS)}')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for latency and error injection')
+    args = parser.parse_args(argv)
+
+    profiles = build_profiles(args)
+    for name, profile in profiles.items():
+        print(f'{name:<12} {profile}')
+
+    create_app(profiles, args.seed).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
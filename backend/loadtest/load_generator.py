@@ -0,0 +1,199 @@
+"""
+Open-loop load generator for the Touch Grass API.
+
+Issues requests at a fixed target rate (regardless of how fast the server
+answers) and reports throughput and latency percentiles per endpoint.
+
+Run from the backend directory against a server backed by the fake upstreams:
+    python -m loadtest.load_generator --rps 20 --duration 60
+    python -m loadtest.load_generator --mix generate-route=1 --rps 50 -o load.json
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from config import VALID_VIBES
+
+# Start points are spread around these centers
+START_CENTERS = [(51.5074, -0.1278), (51.5136, -0.1365), (51.5079, -0.0877)]
+
+MOOD_TEXTS = [
+    'Party time in Shoreditch!',
+    'I want to relax in Regents Park',
+    'Date night in Kensington tonight',
+    'Looking for pretty photo spots near Southbank',
+    "I'm feeling stressed",
+]
+
+LOCATION_NAMES = ['Camden', 'Soho', 'Greenwich', 'Notting Hill', 'Covent Garden', 'Nowhere Land']
+
+DEFAULT_MIX = 'generate-route=0.7,detect-vibe=0.2,geocode=0.1'
+
+
+def build_request(endpoint, rng):
+    """Return (method, path, json_body) for one request to endpoint"""
+    if endpoint == 'generate-route':
+        center_lat, center_lon = rng.choice(START_CENTERS)
+        body = {
+            'vibe': rng.choice(VALID_VIBES),
+            'latitude': center_lat + rng.uniform(-0.01, 0.01),
+            'longitude': center_lon + rng.uniform(-0.015, 0.015),
+            'duration': rng.choice([20, 30, 45, 60, 90]),
+            'circular': True,
+        }
+        return 'POST', '/api/generate-route', body
+    if endpoint == 'detect-vibe':
+        return 'POST', '/api/detect-vibe', {'text': rng.choice(MOOD_TEXTS)}
+    if endpoint == 'geocode':
+        return 'POST', '/api/geocode', {'location': rng.choice(LOCATION_NAMES)}
+    if endpoint == 'health':
+        return 'GET', '/api/health', None
+    raise ValueError(f'Unknown endpoint {endpoint!r}')
+
+
+def parse_mix(value):
+    """Parse 'endpoint=weight,...' into ([endpoints], [weights])"""
+    endpoints, weights = [], []
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        endpoints.append(name.strip())
+        weights.append(float(weight or 1))
+    return endpoints, weights
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class LoadRun:
+    """Thread-safe collection of per-endpoint latencies and outcomes"""
+
+    def __init__(self):
+        self.samples = {}  # endpoint -> list of (latency_ms, ok, status)
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, latency_ms, ok, status):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append((latency_ms, ok, status))
+
+    def summary(self, elapsed):
+        report = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            latencies = sorted(s[0] for s in samples)
+            statuses = {}
+            for _, _, status in samples:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            report[endpoint] = {
+                'requests': len(samples),
+                'errors': sum(1 for s in samples if not s[1]),
+                'throughput_rps': len(samples) / elapsed if elapsed else 0.0,
+                'p50_ms': percentile(latencies, 0.50),
+                'p90_ms': percentile(latencies, 0.90),
+                'p95_ms': percentile(latencies, 0.95),
+                'p99_ms': percentile(latencies, 0.99),
+                'max_ms': latencies[-1] if latencies else 0.0,
+                'statuses': statuses,
+            }
+        return report
+
+
+def run_load(base_url, rps, duration, mix=DEFAULT_MIX, max_workers=64, timeout=60, seed=0):
+    """
+    Drive the API at rps requests per second for duration seconds.
+
+    Returns:
+        Dict of per-endpoint results plus an 'overall' entry
+    """
+    endpoints, weights = parse_mix(mix)
+    rng = random.Random(seed)
+    run = LoadRun()
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    def fire(endpoint, method, path, body):
+        started = time.perf_counter()
+        try:
+            response = session.request(method, base_url.rstrip('/') + path, json=body, timeout=timeout)
+            ok, status = response.status_code < 400, response.status_code
+        except requests.RequestException as e:
+            ok, status = False, type(e).__name__
+        run.record(endpoint, (time.perf_counter() - started) * 1000, ok, status)
+
+    interval = 1.0 / rps
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        sent = 0
+        while True:
+            next_send = started + sent * interval
+            if next_send - started >= duration:
+                break
+            delay = next_send - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            endpoint = rng.choices(endpoints, weights)[0]
+            executor.submit(fire, endpoint, *build_request(endpoint, rng))
+            sent += 1
+    elapsed = time.perf_counter() - started
+
+    report = run.summary(elapsed)
+    all_latencies = sorted(s[0] for samples in run.samples.values() for s in samples)
+    total = len(all_latencies)
+    report['overall'] = {
+        'requests': total,
+        'errors': sum(r['errors'] for r in report.values()),
+        'throughput_rps': total / elapsed if elapsed else 0.0,
+        'target_rps': rps,
+        'p50_ms': percentile(all_latencies, 0.50),
+        'p95_ms': percentile(all_latencies, 0.95),
+        'p99_ms': percentile(all_latencies, 0.99),
+    }
+    return report
+
+
+def print_report(report):
+    print(f"\n{'endpoint':<16} {'reqs':>6} {'errors':>6} {'rps':>7} {'p50':>9} {'p90':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for endpoint, r in report.items():
+        if endpoint == 'overall':
+            continue
+        print(f"{endpoint:<16} {r['requests']:>6} {r['errors']:>6} {r['throughput_rps']:>7.1f} "
+              f"{r['p50_ms']:>7.1f}ms {r['p90_ms']:>7.1f}ms {r['p95_ms']:>7.1f}ms {r['p99_ms']:>7.1f}ms {r['max_ms']:>7.1f}ms")
+    o = report['overall']
+    print(f"\noverall: {o['requests']} requests, {o['errors']} errors, "
+          f"{o['throughput_rps']:.1f} rps achieved (target {o['target_rps']:g}), "
+          f"p50 {o['p50_ms']:.1f}ms p95 {o['p95_ms']:.1f}ms p99 {o['p99_ms']:.1f}ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://localhost:5001')
+    parser.add_argument('--rps', type=float, default=10.0, help='Target requests per second')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds to run')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Endpoint weights (default {DEFAULT_MIX})')
+    parser.add_argument('--workers', type=int, default=64, help='Maximum in-flight requests')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Per-request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', '-o', help='Write the report to this JSON file')
+    args = parser.parse_args(argv)
+
+    print(f"Driving {args.base_url} at {args.rps:g} rps for {args.duration:g}s ({args.mix})")
+    report = run_load(args.base_url, args.rps, args.duration, args.mix, args.workers, args.timeout, args.seed)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote report to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 """Models package"""
-from .place import Place
+from .place import Place, vibes_to_mask, mask_to_vibes
+from .place_table import PlaceTable
 from .database import get_db, get_connection, init_db
 
-__all__ = ['Place', 'get_db', 'get_connection', 'init_db']
+__all__ = ['Place', 'PlaceTable', 'vibes_to_mask', 'mask_to_vibes', 'get_db', 'get_connection', 'init_db']
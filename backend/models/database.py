@@ -1,15 +1,36 @@
 """SQLite database connection and schema management for place storage"""
 import sqlite3
 import os
+import threading
 from contextlib import contextmanager
 from datetime import datetime
 
-# Database file path - stored in backend directory
-DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'places.db')
+from config import PLACE_TILE_METERS, PLACE_TILE_TOP_K, DB_JOURNAL_MODE
+from utils.geo_utils import tile_for, tile_bounds
+from .place import VIBE_BITS
+
+# Database file path - stored in backend directory unless PLACES_DB_PATH is set
+DB_PATH = os.getenv(
+    'PLACES_DB_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'places.db')
+)
+
+# Tile edge in degrees for the per-tile top-K lists (square in lat/lon)
+TILE_DEGREES = PLACE_TILE_METERS / 111320
+
+# Database paths whose schema has been created in this process
+_initialized_paths = set()
+_init_lock = threading.Lock()
 
 
 def get_connection():
-    """Get a database connection with row factory enabled"""
+    """Get a database connection with row factory enabled (creates the schema on first use)"""
+    if DB_PATH not in _initialized_paths:
+        init_db()
+    return _connect()
+
+
+def _connect():
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     return conn
@@ -30,52 +51,258 @@ def get_db():
 
 
 def init_db():
-    """Initialize database schema"""
-    with get_db() as conn:
-        cursor = conn.cursor()
-
-        # Create places table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS places (
-                place_id TEXT PRIMARY KEY,
-                name TEXT NOT NULL,
-                latitude REAL NOT NULL,
-                longitude REAL NOT NULL,
-                google_type TEXT,
-                address TEXT,
-                rating REAL,
-                user_ratings_total INTEGER,
-                categorization_source TEXT DEFAULT 'static',
-                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # Create place_vibes many-to-many table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS place_vibes (
-                place_id TEXT,
-                vibe TEXT,
-                PRIMARY KEY (place_id, vibe),
-                FOREIGN KEY (place_id) REFERENCES places(place_id) ON DELETE CASCADE
-            )
-        ''')
-
-        # Create indexed_areas table to track which areas have been fetched
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS indexed_areas (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                center_lat REAL NOT NULL,
-                center_lon REAL NOT NULL,
-                radius REAL NOT NULL,
-                indexed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # Create indexes for efficient queries
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_place_vibes_vibe ON place_vibes(vibe)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_places_location ON places(latitude, longitude)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_indexed_areas_location ON indexed_areas(center_lat, center_lon)')
-
-
-# Initialize database on module import
-init_db()
+    """Initialize database schema (idempotent; runs lazily on first connection)"""
+    with _init_lock:
+        path = DB_PATH
+        conn = _connect()
+        try:
+            # auto_vacuum only takes effect on a new database (or after a
+            # VACUUM), so it goes before journal_mode, whose switch to WAL
+            # writes the file header. Journal mode persists in the file.
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute(f'PRAGMA journal_mode = {DB_JOURNAL_MODE}')
+            _create_schema(conn.cursor())
+            conn.commit()
+        finally:
+            conn.close()
+        _initialized_paths.add(path)
+
+
+def _create_schema(cursor):
+    """Create tables and indexes, and migrate older databases"""
+    # Create places table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS places (
+            place_id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            latitude REAL NOT NULL,
+            longitude REAL NOT NULL,
+            google_type TEXT,
+            address TEXT,
+            rating REAL,
+            user_ratings_total INTEGER,
+            categorization_source TEXT DEFAULT 'static',
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            vibe_mask INTEGER NOT NULL DEFAULT 0,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Legacy place_vibes many-to-many table (superseded by places.vibe_mask,
+    # kept so older databases can be migrated)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS place_vibes (
+            place_id TEXT,
+            vibe TEXT,
+            PRIMARY KEY (place_id, vibe),
+            FOREIGN KEY (place_id) REFERENCES places(place_id) ON DELETE CASCADE
+        )
+    ''')
+
+    # Create indexed_areas table to track which areas have been fetched
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS indexed_areas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            center_lat REAL NOT NULL,
+            center_lon REAL NOT NULL,
+            radius REAL NOT NULL,
+            indexed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Duplicate place_ids found at ingest (see services/place_dedup.py) and
+    # the stored place each one stands for; aliases aren't stored as places
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS place_aliases (
+            alias_id TEXT PRIMARY KEY,
+            canonical_id TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Create indexes for efficient queries
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_place_vibes_vibe ON place_vibes(vibe)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_place_aliases_canonical ON place_aliases(canonical_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_places_location ON places(latitude, longitude)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_indexed_areas_location ON indexed_areas(center_lat, center_lon)')
+
+    # Small key/value store for schema-level settings
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    ''')
+
+    # Top PLACE_TILE_TOP_K places by rating per (vibe bit, tile), kept up to
+    # date by sqlite_storage on every save
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS place_tile_top (
+            vibe_bit INTEGER NOT NULL,
+            tile_lat INTEGER NOT NULL,
+            tile_lon INTEGER NOT NULL,
+            rating REAL NOT NULL,
+            place_id TEXT NOT NULL,
+            PRIMARY KEY (vibe_bit, tile_lat, tile_lon, place_id)
+        ) WITHOUT ROWID
+    ''')
+
+    migrate_vibe_mask(cursor)
+    migrate_changed_at(cursor)
+
+    # Places changed since the last snapshot export (see models/place_snapshot.py)
+    cursor.execute('DROP INDEX IF EXISTS idx_places_last_updated')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_places_changed_at ON places(changed_at)')
+
+    # One partial index per vibe: a query filtering on "vibe_mask & <bit>"
+    # plus a lat/lon range scans only that vibe's places in the box
+    for vibe, bit in VIBE_BITS.items():
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS idx_places_vibe_{vibe} '
+            f'ON places(latitude, longitude) WHERE vibe_mask & {bit}'
+        )
+    # Statically categorized places by type, for services/recategorize.py
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_places_static_type ON places(google_type, vibe_mask) "
+        "WHERE categorization_source = 'static'"
+    )
+
+    # Rebuild the tile lists when they are missing or the tiling changed
+    tiling = f'{PLACE_TILE_METERS}:{PLACE_TILE_TOP_K}'
+    row = cursor.execute("SELECT value FROM meta WHERE key = 'tile_top'").fetchone()
+    if not row or row[0] != tiling:
+        rebuild_tile_top(cursor)
+        cursor.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('tile_top', ?)", (tiling,))
+
+
+def rebuild_tile_top(cursor):
+    """Recompute every per-tile top-K list from the places table"""
+    cursor.execute('DELETE FROM place_tile_top')
+    for bit in VIBE_BITS.values():
+        counts = {}
+        rows = []
+        for place_id, lat, lon, rating in cursor.execute(
+            f'SELECT place_id, latitude, longitude, COALESCE(rating, 0) FROM places '
+            f'WHERE vibe_mask & {bit} ORDER BY rating DESC'
+        ).fetchall():
+            tile = tile_for(lat, lon, TILE_DEGREES)
+            if counts.get(tile, 0) < PLACE_TILE_TOP_K:
+                counts[tile] = counts.get(tile, 0) + 1
+                rows.append((bit, tile[0], tile[1], rating, place_id))
+        cursor.executemany(
+            'INSERT INTO place_tile_top (vibe_bit, tile_lat, tile_lon, rating, place_id) VALUES (?, ?, ?, ?, ?)',
+            rows
+        )
+
+
+def refresh_tile_top(cursor, tiles):
+    """
+    Recompute the top-K lists of the given (vibe_bit, tile_lat, tile_lon) tiles.
+
+    Called after places in those tiles were inserted, updated or moved.
+    """
+    for bit, tile_lat, tile_lon in tiles:
+        min_lat, max_lat, min_lon, max_lon = tile_bounds(tile_lat, tile_lon, TILE_DEGREES)
+        cursor.execute(
+            'DELETE FROM place_tile_top WHERE vibe_bit = ? AND tile_lat = ? AND tile_lon = ?',
+            (bit, tile_lat, tile_lon)
+        )
+        # The bit is inlined so the per-vibe partial index is used; the box
+        # is widened slightly and tile_for decides membership exactly
+        rows = cursor.execute(f'''
+            SELECT place_id, latitude, longitude, COALESCE(rating, 0) FROM places
+            WHERE vibe_mask & {bit}
+              AND latitude BETWEEN ? AND ?
+              AND longitude BETWEEN ? AND ?
+            ORDER BY rating DESC
+        ''', (min_lat - 1e-9, max_lat + 1e-9, min_lon - 1e-9, max_lon + 1e-9)).fetchall()
+        top = [
+            (bit, tile_lat, tile_lon, rating, place_id)
+            for place_id, lat, lon, rating in rows
+            if tile_for(lat, lon, TILE_DEGREES) == (tile_lat, tile_lon)
+        ][:PLACE_TILE_TOP_K]
+        cursor.executemany(
+            'INSERT INTO place_tile_top (vibe_bit, tile_lat, tile_lon, rating, place_id) VALUES (?, ?, ?, ?, ?)',
+            top
+        )
+
+
+def merge_tile_top(cursor, added, removed):
+    """
+    Apply known vibe changes to the top-K lists without rescanning places.
+
+    Args:
+        added: {(vibe_bit, tile_lat, tile_lon): [(rating, place_id)]} places that gained the bit
+        removed: {(vibe_bit, tile_lat, tile_lon): {place_id}} places that lost it
+
+    A full list that loses a member can't be refilled from what is known,
+    so those tiles are recomputed with refresh_tile_top.
+
+    Returns:
+        Number of tiles recomputed from the places table
+    """
+    rescan = []
+    deletes = []
+    inserts = []
+    for tile in set(added) | set(removed):
+        current = cursor.execute(
+            'SELECT rating, place_id FROM place_tile_top WHERE vibe_bit = ? AND tile_lat = ? AND tile_lon = ?',
+            tile
+        ).fetchall()
+        gone = removed.get(tile, set())
+        kept = [(rating, place_id) for rating, place_id in current if place_id not in gone]
+        if len(current) >= PLACE_TILE_TOP_K and len(kept) < len(current):
+            rescan.append(tile)
+            continue
+
+        # Only the rows that enter or leave the list are written
+        top = sorted(kept + added.get(tile, []), key=lambda item: -item[0])[:PLACE_TILE_TOP_K]
+        top_ids = {place_id for _, place_id in top}
+        current_ids = {place_id for _, place_id in current}
+        deletes.extend(tile + (place_id,) for place_id in current_ids - top_ids)
+        inserts.extend(tile + (rating, place_id) for rating, place_id in top if place_id not in current_ids)
+
+    cursor.executemany(
+        'DELETE FROM place_tile_top WHERE vibe_bit = ? AND tile_lat = ? AND tile_lon = ? AND place_id = ?', deletes
+    )
+    cursor.executemany(
+        'INSERT INTO place_tile_top (vibe_bit, tile_lat, tile_lon, rating, place_id) VALUES (?, ?, ?, ?, ?)', inserts
+    )
+    refresh_tile_top(cursor, rescan)
+    return len(rescan)
+
+
+def migrate_changed_at(cursor):
+    """
+    Add places.changed_at to older databases, starting from last_updated.
+
+    changed_at moves only when a place's stored content changes;
+    last_updated also moves when a refresh finds the place unchanged.
+    """
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(places)')]
+    if 'changed_at' in columns:
+        return
+
+    # ALTER TABLE can't add a CURRENT_TIMESTAMP default; writes set it explicitly
+    cursor.execute('ALTER TABLE places ADD COLUMN changed_at TIMESTAMP')
+    cursor.execute('UPDATE places SET changed_at = last_updated')
+
+
+def migrate_vibe_mask(cursor):
+    """Add places.vibe_mask to older databases and fill it from place_vibes"""
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(places)')]
+    if 'vibe_mask' in columns:
+        return
+
+    cursor.execute('ALTER TABLE places ADD COLUMN vibe_mask INTEGER NOT NULL DEFAULT 0')
+
+    # Vibe bits are distinct powers of two, so summing distinct bits ORs them
+    bit_case = ' '.join(f"WHEN '{vibe}' THEN {bit}" for vibe, bit in VIBE_BITS.items())
+    cursor.execute(f'''
+        UPDATE places SET vibe_mask = (
+            SELECT COALESCE(SUM(DISTINCT CASE pv.vibe {bit_case} ELSE 0 END), 0)
+            FROM place_vibes pv
+            WHERE pv.place_id = places.place_id
+        )
+    ''')
+
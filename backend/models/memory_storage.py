@@ -0,0 +1,154 @@
+"""
+In-memory place storage.
+
+Places live in a dict and a grid of tiles (the same TILE_DEGREES grid the
+SQLite backend uses), so a radius query only looks at the tiles under the
+circle's bounding box. Nothing is persisted; useful for tests, batch jobs
+and as a baseline when benchmarking storage engines.
+"""
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from models.database import TILE_DEGREES
+from models.place import vibes_to_mask, mask_to_vibes
+from models.place_table import PlaceTable
+from models.storage import PlaceStorage, completed
+from utils.geo_utils import calculate_distance, bounding_box, tile_for
+
+
+class MemoryPlaceStorage(PlaceStorage):
+    """Places and indexed areas in process memory, with a tile grid spatial index"""
+
+    name = 'memory'
+
+    def __init__(self, tile_degrees: float = TILE_DEGREES):
+        self.tile_degrees = tile_degrees
+        self._places = {}  # place_id -> stored row tuple (see _row)
+        self._tiles = {}   # (tile_lat, tile_lon) -> {place_id: row}
+        self._areas = {}   # id -> [center_lat, center_lon, radius, indexed_at]
+        self._aliases = {}  # alias place_id -> canonical place_id
+        self._next_area_id = 1
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _row(place_data: dict, vibes: List[str], source: str) -> tuple:
+        return (
+            place_data['place_id'], place_data['name'], place_data['latitude'], place_data['longitude'],
+            place_data.get('google_type'), place_data.get('address'), place_data.get('rating'),
+            place_data.get('user_ratings_total'), source, vibes_to_mask(vibes)
+        )
+
+    @staticmethod
+    def _place_dict(row: tuple) -> dict:
+        place_id, name, lat, lon, google_type, address, rating, total, source, mask = row
+        return {
+            'place_id': place_id,
+            'name': name,
+            'latitude': lat,
+            'longitude': lon,
+            'google_type': google_type,
+            'address': address,
+            'rating': rating,
+            'user_ratings_total': total,
+            'categorization_source': source,
+            'vibes': mask_to_vibes(mask)
+        }
+
+    def upsert_places(self, places_with_vibes: List[Tuple[dict, List[str], str]], wait: bool = True) -> Future:
+        rows = [self._row(place_data, vibes, source) for place_data, vibes, source in places_with_vibes]
+        with self._lock:
+            for row in rows:
+                place_id = row[0]
+                old = self._places.get(place_id)
+                if old is not None:
+                    tile = self._tiles[tile_for(old[2], old[3], self.tile_degrees)]
+                    del tile[place_id]
+                self._places[place_id] = row
+                self._tiles.setdefault(tile_for(row[2], row[3], self.tile_degrees), {})[place_id] = row
+        return completed()
+
+    def _rows_within(self, lat: float, lon: float, radius: float, bit: int = 0):
+        """(row, distance) for stored places within the radius (with the vibe bit, if given)"""
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius)
+        lat_lo, lon_lo = tile_for(min_lat, min_lon, self.tile_degrees)
+        lat_hi, lon_hi = tile_for(max_lat, max_lon, self.tile_degrees)
+
+        hits = []
+        with self._lock:
+            # Walk whichever is smaller: the tiles under the box or the occupied tiles
+            if (lat_hi - lat_lo + 1) * (lon_hi - lon_lo + 1) <= len(self._tiles):
+                tiles = (self._tiles.get((tile_lat, tile_lon))
+                         for tile_lat in range(lat_lo, lat_hi + 1) for tile_lon in range(lon_lo, lon_hi + 1))
+            else:
+                tiles = (tile for (tile_lat, tile_lon), tile in self._tiles.items()
+                         if lat_lo <= tile_lat <= lat_hi and lon_lo <= tile_lon <= lon_hi)
+            for tile in tiles:
+                if not tile:
+                    continue
+                for row in tile.values():
+                    if bit and not row[9] & bit:
+                        continue
+                    distance = calculate_distance(lat, lon, row[2], row[3])
+                    if distance <= radius:
+                        hits.append((row, distance))
+        return hits
+
+    def places_by_vibe(self, lat: float, lon: float, radius: float, bit: int,
+                       limit: Optional[int] = None) -> PlaceTable:
+        hits = [(row[6] or 0, row, distance) for row, distance in self._rows_within(lat, lon, radius, bit)]
+
+        hits.sort(key=lambda hit: -hit[0])
+        if limit is not None:
+            hits = hits[:limit]
+
+        table = PlaceTable()
+        for _, row, distance in hits:
+            table.append(*row, distance)
+        return table
+
+    def places_near(self, lat: float, lon: float, radius: float) -> List[dict]:
+        hits = sorted(self._rows_within(lat, lon, radius), key=lambda hit: hit[1])
+        return [dict(self._place_dict(row), distance=distance) for row, distance in hits]
+
+    def get_places(self, place_ids: Iterable[str]) -> Dict[str, dict]:
+        with self._lock:
+            rows = [self._places.get(place_id) for place_id in place_ids]
+        return {row[0]: self._place_dict(row) for row in rows if row is not None}
+
+    def all_places(self) -> List[dict]:
+        with self._lock:
+            rows = list(self._places.values())
+        return [self._place_dict(row) for row in rows]
+
+    def get_aliases(self, place_ids: Iterable[str]) -> Dict[str, str]:
+        with self._lock:
+            return {place_id: self._aliases[place_id] for place_id in place_ids if place_id in self._aliases}
+
+    def add_aliases(self, aliases: Dict[str, str], wait: bool = True) -> Future:
+        with self._lock:
+            self._aliases.update(aliases)
+        return completed()
+
+    def indexed_areas(self) -> List[dict]:
+        now = time.time()
+        with self._lock:
+            return [
+                {'id': area_id, 'center_lat': lat, 'center_lon': lon, 'radius': radius,
+                 'age_seconds': now - indexed_at}
+                for area_id, (lat, lon, radius, indexed_at) in self._areas.items()
+            ]
+
+    def mark_area_indexed(self, lat: float, lon: float, radius: float, wait: bool = True) -> Future:
+        with self._lock:
+            self._areas[self._next_area_id] = [lat, lon, radius, time.time()]
+            self._next_area_id += 1
+        return completed()
+
+    def mark_area_refreshed(self, area_id, unchanged_ids: List[str], wait: bool = True) -> Future:
+        with self._lock:
+            area = self._areas.get(area_id)
+            if area is not None:
+                area[3] = time.time()
+        return completed()
@@ -1,12 +1,41 @@
 """Place model for representing places with vibe categorization"""
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 from typing import List, Optional
 from datetime import datetime
 
+from config import VALID_VIBES
 
-@dataclass
+# Each vibe is one bit of a place's vibe mask, in VALID_VIBES order
+VIBE_BITS = {vibe: 1 << i for i, vibe in enumerate(VALID_VIBES)}
+
+# Vibe list for every possible mask, so decoding is a tuple lookup
+_MASK_TO_VIBES = tuple(
+    [vibe for vibe, bit in VIBE_BITS.items() if mask & bit]
+    for mask in range(1 << len(VALID_VIBES))
+)
+
+
+def vibes_to_mask(vibes) -> int:
+    """Encode a list of vibe names as a bitmask (unknown vibes are ignored)"""
+    mask = 0
+    for vibe in vibes or ():
+        mask |= VIBE_BITS.get(vibe, 0)
+    return mask
+
+
+def mask_to_vibes(mask: int) -> List[str]:
+    """Decode a vibe bitmask into a new list of vibe names"""
+    return list(_MASK_TO_VIBES[mask])
+
+
+@dataclass(slots=True)
 class Place:
-    """Represents a place with its vibe categorizations"""
+    """
+    Represents a place with its vibe categorizations.
+
+    Supports read-only dict-style access (place['latitude'], place.get('type'))
+    so it can be passed anywhere the route service expects a place dict.
+    """
     place_id: str
     name: str
     latitude: float
@@ -18,6 +47,7 @@ class Place:
     categorization_source: str = 'static'  # 'static' or 'llm'
     last_updated: Optional[datetime] = None
     vibes: List[str] = field(default_factory=list)
+    distance: Optional[float] = None  # Meters from the query center, when queried by radius
 
     def get_vibes(self) -> List[str]:
         """Returns list of vibes this place belongs to"""
@@ -27,6 +57,22 @@ class Place:
         """Check if place belongs to a specific vibe"""
         return vibe in self.vibes
 
+    def __getitem__(self, key):
+        if key == 'type':
+            return self.google_type
+        if key in _FIELD_NAMES:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key == 'type' or key in _FIELD_NAMES
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
     def to_dict(self) -> dict:
         """Convert to dictionary representation"""
         return {
@@ -42,6 +88,23 @@ class Place:
             'vibes': self.vibes
         }
 
+    def to_response_dict(self) -> dict:
+        """Convert to the dict shape returned by the API for nearby places"""
+        return {
+            'place_id': self.place_id,
+            'name': self.name,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'type': self.google_type,
+            'google_type': self.google_type,
+            'address': self.address,
+            'rating': self.rating or 0,
+            'user_ratings_total': self.user_ratings_total or 0,
+            'categorization_source': self.categorization_source,
+            'vibes': list(self.vibes),
+            'distance': self.distance
+        }
+
     @classmethod
     def from_dict(cls, data: dict) -> 'Place':
         """Create Place from dictionary"""
@@ -55,7 +118,8 @@ class Place:
             rating=data.get('rating'),
             user_ratings_total=data.get('user_ratings_total'),
             categorization_source=data.get('categorization_source', 'static'),
-            vibes=data.get('vibes', [])
+            vibes=data.get('vibes', []),
+            distance=data.get('distance')
         )
 
     @classmethod
@@ -73,3 +137,6 @@ class Place:
             categorization_source=row['categorization_source'],
             vibes=vibes or []
         )
+
+
+_FIELD_NAMES = frozenset(f.name for f in fields(Place))
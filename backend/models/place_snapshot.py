@@ -0,0 +1,301 @@
+"""
+Read-only, memory-mapped snapshot of the places table.
+
+export_snapshot() writes every place to one file of fixed-width columns:
+- coordinates, ratings and rating counts
+- vibe masks
+- string table references for ids, names, addresses, types and sources
+- the string table itself
+- a tile directory
+
+Rows are sorted by tile and then by rating, so each row of tiles covered
+by a query is one contiguous run of rows. Worker processes mmap the file
+and read the columns through memoryviews. Nothing is copied or decoded up
+front, and every process shares the same page cache.
+
+The snapshot records the database time it was exported at. Places changed
+since then (by changed_at) are read from SQLite and take precedence (see
+sqlite_storage.SQLitePlaceStorage.places_by_vibe).
+
+Run from the backend directory:
+    python -m models.place_snapshot
+"""
+import argparse
+import heapq
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+from config import PLACE_SNAPSHOT_PATH
+from models import database
+from models.database import get_db, TILE_DEGREES
+from utils.geo_utils import calculate_distance, bounding_box, tile_for
+
+MAGIC = b'TGSNAP01'
+# magic, byte order, places, strings, tiles, tile degrees, exported_at (SQLite CURRENT_TIMESTAMP)
+HEADER = struct.Struct('<8s1sxxxIIId20s')
+NULL_STRING = 0xFFFFFFFF
+
+# Per-place columns in file order: (name, array typecode)
+COLUMNS = (
+    ('latitudes', 'd'),
+    ('longitudes', 'd'),
+    ('ratings', 'd'),          # 0 when unknown
+    ('ratings_totals', 'q'),   # 0 when unknown
+    ('place_ids', 'I'),        # String table indices (NULL_STRING for None)
+    ('names', 'I'),
+    ('addresses', 'I'),
+    ('google_types', 'I'),
+    ('sources', 'I'),
+    ('vibe_masks', 'B'),
+)
+ITEM_SIZES = {'d': 8, 'q': 8, 'I': 4, 'B': 1, 'Q': 8}
+
+
+def snapshot_path():
+    """Snapshot file for the current database (PLACE_SNAPSHOT_PATH, else next to it)"""
+    return PLACE_SNAPSHOT_PATH or database.DB_PATH + '.snap'
+
+
+def _tile_key(tile_lat, tile_lon):
+    # Orders like (tile_lat, tile_lon) and fits in a signed 64-bit integer
+    return tile_lat * (1 << 32) + tile_lon + (1 << 31)
+
+
+def _aligned(offset):
+    return (offset + 7) & ~7
+
+
+def _layout(count, strings, tiles):
+    """Byte offset of every section, in file order, and the total size before the string blob"""
+    sections = [(name, typecode, count) for name, typecode in COLUMNS] + [
+        ('tile_keys', 'q', tiles),
+        ('tile_starts', 'I', tiles + 1),
+        ('string_offsets', 'Q', strings + 1),
+    ]
+    offsets = {}
+    offset = _aligned(HEADER.size)
+    for name, typecode, length in sections:
+        offsets[name] = (offset, typecode, length)
+        offset = _aligned(offset + ITEM_SIZES[typecode] * length)
+    return offsets, offset
+
+
+def export_snapshot(path=None):
+    """
+    Write a snapshot of every place to path (atomically replacing it).
+
+    Returns:
+        Dict with the path, place/string/tile counts, file size and exported_at
+    """
+    path = path or snapshot_path()
+    with get_db() as conn:
+        # One read transaction, so exported_at and the rows agree
+        conn.execute('BEGIN')
+        exported_at = conn.execute('SELECT CURRENT_TIMESTAMP').fetchone()[0]
+        rows = conn.execute('''
+            SELECT place_id, name, latitude, longitude, google_type, address,
+                   COALESCE(rating, 0), COALESCE(user_ratings_total, 0), categorization_source, vibe_mask
+            FROM places
+        ''').fetchall()
+
+    keyed = []
+    for row in rows:
+        tile = tile_for(row[2], row[3], TILE_DEGREES)
+        keyed.append((_tile_key(*tile), -row[6], row))
+    keyed.sort(key=lambda item: (item[0], item[1]))
+
+    strings = {}
+    blob = bytearray()
+    string_offsets = array('Q', [0])
+
+    def intern(value):
+        if value is None:
+            return NULL_STRING
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(string_offsets) - 1
+            blob.extend(value.encode('utf-8'))
+            string_offsets.append(len(blob))
+        return index
+
+    columns = {name: array(typecode) for name, typecode in COLUMNS}
+    tile_keys = array('q')
+    tile_starts = array('I')
+    for position, (key, _, row) in enumerate(keyed):
+        if not tile_keys or tile_keys[-1] != key:
+            tile_keys.append(key)
+            tile_starts.append(position)
+        place_id, name, lat, lon, google_type, address, rating, total, source, mask = row
+        columns['latitudes'].append(lat)
+        columns['longitudes'].append(lon)
+        columns['ratings'].append(rating)
+        columns['ratings_totals'].append(total)
+        columns['place_ids'].append(intern(place_id))
+        columns['names'].append(intern(name))
+        columns['addresses'].append(intern(address))
+        columns['google_types'].append(intern(google_type))
+        columns['sources'].append(intern(source))
+        columns['vibe_masks'].append(mask or 0)
+    tile_starts.append(len(keyed))
+
+    sections = dict(columns, tile_keys=tile_keys, tile_starts=tile_starts, string_offsets=string_offsets)
+    offsets, blob_offset = _layout(len(keyed), len(string_offsets) - 1, len(tile_keys))
+
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, sys.byteorder[0].encode(), len(keyed), len(string_offsets) - 1,
+                            len(tile_keys), TILE_DEGREES, exported_at.encode()))
+        for name, (offset, _, _) in offsets.items():
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(sections[name].tobytes())
+        f.write(b'\0' * (blob_offset - f.tell()))
+        f.write(blob)
+    # Readers holding the old file keep their mapping; new readers see the new one
+    os.replace(tmp_path, path)
+
+    return {
+        'path': path,
+        'places': len(keyed),
+        'strings': len(string_offsets) - 1,
+        'tiles': len(tile_keys),
+        'bytes': os.path.getsize(path),
+        'exported_at': exported_at,
+    }
+
+
+class PlaceSnapshot:
+    """A mapped snapshot file; columns are memoryviews over the shared mapping"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._stat = os.fstat(f.fileno())
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, byte_order, count, strings, tiles, tile_degrees, exported_at = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a place snapshot')
+        if byte_order != sys.byteorder[0].encode() or tile_degrees != TILE_DEGREES:
+            raise ValueError(f'{path} was exported with a different byte order or tile size')
+
+        self.count = count
+        self.exported_at = exported_at.rstrip(b'\0').decode()
+        offsets, blob_offset = _layout(count, strings, tiles)
+        view = memoryview(self._map)
+        for name, (offset, typecode, length) in offsets.items():
+            setattr(self, name, view[offset:offset + ITEM_SIZES[typecode] * length].cast(typecode))
+        self._blob = view[blob_offset:]
+
+    def is_current(self):
+        """Whether the file on disk is still the one mapped"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size) == (
+            self._stat.st_ino, self._stat.st_mtime_ns, self._stat.st_size)
+
+    def string(self, index):
+        if index == NULL_STRING:
+            return None
+        return str(self._blob[self.string_offsets[index]:self.string_offsets[index + 1]], 'utf-8')
+
+    def _tile_runs(self, lat, lon, radius):
+        """(first, end) row ranges covering the radius's bounding box, one per row of tiles"""
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius)
+        lat_lo, lon_lo = tile_for(min_lat, min_lon, TILE_DEGREES)
+        lat_hi, lon_hi = tile_for(max_lat, max_lon, TILE_DEGREES)
+        for tile_lat in range(lat_lo, lat_hi + 1):
+            first = bisect_left(self.tile_keys, _tile_key(tile_lat, lon_lo))
+            end = bisect_right(self.tile_keys, _tile_key(tile_lat, lon_hi))
+            for tile in range(first, end):
+                yield self.tile_starts[tile], self.tile_starts[tile + 1]
+
+    def top(self, lat, lon, radius, bit, limit=None, skip=()):
+        """
+        Places with the vibe bit within the radius, best rated first.
+
+        Args:
+            limit: Stop after this many (None = all)
+            skip: place_ids to leave out (e.g. changed since the export)
+
+        Returns:
+            List of (rating, row, place_id, distance)
+        """
+        latitudes, longitudes, ratings, masks = self.latitudes, self.longitudes, self.ratings, self.vibe_masks
+        place_ids = self.place_ids
+
+        def tile_rows(first, end):
+            # Rows within a tile are stored best rated first
+            for row in range(first, end):
+                if not masks[row] & bit:
+                    continue
+                distance = calculate_distance(lat, lon, latitudes[row], longitudes[row])
+                if distance > radius:
+                    continue
+                place_id = self.string(place_ids[row])
+                if place_id in skip:
+                    continue
+                yield ratings[row], row, place_id, distance
+
+        tiles = [tile_rows(first, end) for first, end in self._tile_runs(lat, lon, radius)]
+        if limit is None:
+            hits = [hit for tile in tiles for hit in tile]
+            hits.sort(key=lambda hit: -hit[0])
+            return hits
+        hits = []
+        for hit in heapq.merge(*tiles, key=lambda hit: -hit[0]):
+            hits.append(hit)
+            if len(hits) == limit:
+                break
+        return hits
+
+    def append_to(self, table, row, place_id, distance):
+        """Append snapshot row to a PlaceTable"""
+        table.append(
+            place_id, self.string(self.names[row]), self.latitudes[row], self.longitudes[row],
+            self.string(self.google_types[row]), self.string(self.addresses[row]),
+            self.ratings[row], self.ratings_totals[row], self.string(self.sources[row]),
+            self.vibe_masks[row], distance
+        )
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot():
+    """The mapped snapshot for the current database, remapped when the file is replaced (None if absent)"""
+    global _snapshot
+    snapshot = _snapshot
+    path = snapshot_path()
+    if snapshot is not None and snapshot.path == path and snapshot.is_current():
+        return snapshot
+    with _snapshot_lock:
+        if _snapshot is not None and _snapshot.path == path and _snapshot.is_current():
+            return _snapshot
+        try:
+            _snapshot = PlaceSnapshot(path) if os.path.exists(path) else None
+        except (OSError, ValueError) as e:
+            print(f"Ignoring place snapshot: {e}")
+            _snapshot = None
+        return _snapshot
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-o', '--output', help='Snapshot file (default: next to the database)')
+    args = parser.parse_args(argv)
+
+    stats = export_snapshot(args.output)
+    print(f"Wrote {stats['places']} places ({stats['strings']} strings, {stats['tiles']} tiles, "
+          f"{stats['bytes']} bytes) to {stats['path']} as of {stats['exported_at']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Columnar in-memory representation of a set of places"""
+import sys
+from array import array
+from typing import Iterable, List, Optional
+
+from .place import Place, vibes_to_mask, mask_to_vibes
+
+
+class PlaceTable:
+    """
+    Column-oriented set of places.
+
+    Coordinates, ratings and vibe masks live in typed arrays; repeated
+    strings (types, sources) are interned. Query and optimizer code work on
+    the columns or on lightweight Place objects, and JSON dicts are only
+    built at the response boundary with to_dicts().
+    """
+    __slots__ = (
+        'place_ids', 'names', 'addresses', 'google_types', 'sources',
+        'latitudes', 'longitudes', 'ratings', 'ratings_totals', 'vibe_masks', 'distances'
+    )
+
+    def __init__(self):
+        self.place_ids: List[str] = []
+        self.names: List[str] = []
+        self.addresses: List[Optional[str]] = []
+        self.google_types: List[Optional[str]] = []
+        self.sources: List[str] = []
+        self.latitudes = array('d')
+        self.longitudes = array('d')
+        self.ratings = array('d')         # 0 when unknown
+        self.ratings_totals = array('q')  # 0 when unknown
+        self.vibe_masks = array('B')
+        self.distances = array('d')       # Meters from the query center (0 when not queried by radius)
+
+    def __len__(self):
+        return len(self.place_ids)
+
+    def append(self, place_id, name, latitude, longitude, google_type=None, address=None, rating=None,
+               user_ratings_total=None, source='static', vibe_mask=0, distance=0.0):
+        self.place_ids.append(place_id)
+        self.names.append(name)
+        self.addresses.append(address)
+        self.google_types.append(sys.intern(google_type) if google_type else google_type)
+        self.sources.append(sys.intern(source) if source else source)
+        self.latitudes.append(latitude)
+        self.longitudes.append(longitude)
+        self.ratings.append(rating or 0)
+        self.ratings_totals.append(user_ratings_total or 0)
+        self.vibe_masks.append(vibe_mask)
+        self.distances.append(distance or 0.0)
+
+    @classmethod
+    def from_dicts(cls, places: Iterable[dict]) -> 'PlaceTable':
+        """Build a table from place dicts (e.g. results of a direct Places API call)"""
+        table = cls()
+        for p in places:
+            table.append(
+                p['place_id'], p['name'], p['latitude'], p['longitude'],
+                p.get('google_type') or p.get('type'), p.get('address'), p.get('rating'),
+                p.get('user_ratings_total'), p.get('categorization_source') or 'static',
+                vibes_to_mask(p.get('vibes')), p.get('distance')
+            )
+        return table
+
+    def take(self, indices: Iterable[int]) -> 'PlaceTable':
+        """Return a new table with the rows at indices, in that order"""
+        table = PlaceTable()
+        for i in indices:
+            table.append(
+                self.place_ids[i], self.names[i], self.latitudes[i], self.longitudes[i],
+                self.google_types[i], self.addresses[i], self.ratings[i], self.ratings_totals[i],
+                self.sources[i], self.vibe_masks[i], self.distances[i]
+            )
+        return table
+
+    def sorted_by_rating(self) -> 'PlaceTable':
+        """Return a copy ordered by rating, highest first (stable for ties)"""
+        ratings = self.ratings
+        return self.take(sorted(range(len(self)), key=lambda i: -ratings[i]))
+
+    def place(self, i: int) -> Place:
+        """Materialize row i as a Place"""
+        return Place(
+            place_id=self.place_ids[i],
+            name=self.names[i],
+            latitude=self.latitudes[i],
+            longitude=self.longitudes[i],
+            google_type=self.google_types[i],
+            address=self.addresses[i],
+            rating=self.ratings[i],
+            user_ratings_total=self.ratings_totals[i],
+            categorization_source=self.sources[i],
+            vibes=mask_to_vibes(self.vibe_masks[i]),
+            distance=self.distances[i]
+        )
+
+    def places(self) -> List[Place]:
+        """Materialize every row as a Place (e.g. for the waypoint optimizer)"""
+        return [self.place(i) for i in range(len(self))]
+
+    def to_dict(self, i: int) -> dict:
+        """Row i in the API response shape (see Place.to_response_dict)"""
+        google_type = self.google_types[i]
+        return {
+            'place_id': self.place_ids[i],
+            'name': self.names[i],
+            'latitude': self.latitudes[i],
+            'longitude': self.longitudes[i],
+            'type': google_type,
+            'google_type': google_type,
+            'address': self.addresses[i],
+            'rating': self.ratings[i],
+            'user_ratings_total': self.ratings_totals[i],
+            'categorization_source': self.sources[i],
+            'vibes': mask_to_vibes(self.vibe_masks[i]),
+            'distance': self.distances[i]
+        }
+
+    def to_dicts(self, indices: Optional[Iterable[int]] = None) -> List[dict]:
+        """Rows (all, or the given indices) in the API response shape"""
+        if indices is None:
+            indices = range(len(self))
+        return [self.to_dict(i) for i in indices]
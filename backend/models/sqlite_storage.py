@@ -0,0 +1,407 @@
+"""
+SQLite place storage (places.db, see models/database.py).
+
+Radius queries read the memory-mapped snapshot when there is one, else the
+per-tile top-K lists or a plain indexed scan. All writes go through the
+write-behind queue.
+"""
+import heapq
+from concurrent.futures import Future
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import PLACE_TILE_TOP_K, SNAPSHOT_MAX_DELTA_ROWS
+from models.database import get_db, init_db, refresh_tile_top, TILE_DEGREES
+from models.place import VIBE_BITS, vibes_to_mask, mask_to_vibes
+from models.place_snapshot import get_snapshot
+from models.place_table import PlaceTable
+from models.storage import PlaceStorage
+from models.write_queue import write_queue
+from utils.geo_utils import calculate_distance, bounding_box, tile_for, tile_bounds
+
+
+PLACE_COLUMNS = '''place_id, name, latitude, longitude, google_type, address, rating,
+                   user_ratings_total, categorization_source, vibe_mask'''
+
+UPSERT_PLACE_SQL = '''
+    INSERT OR REPLACE INTO places
+    (place_id, name, latitude, longitude, google_type, address, rating, user_ratings_total,
+     categorization_source, vibe_mask, last_updated, changed_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+'''
+
+
+def _place_params(place_data: dict, vibes: List[str], source: str) -> tuple:
+    return (
+        place_data['place_id'],
+        place_data['name'],
+        place_data['latitude'],
+        place_data['longitude'],
+        place_data.get('google_type'),
+        place_data.get('address'),
+        place_data.get('rating'),
+        place_data.get('user_ratings_total'),
+        source,
+        vibes_to_mask(vibes)
+    )
+
+
+def _place_dict(row) -> dict:
+    return {
+        'place_id': row['place_id'],
+        'name': row['name'],
+        'latitude': row['latitude'],
+        'longitude': row['longitude'],
+        'google_type': row['google_type'],
+        'address': row['address'],
+        'rating': row['rating'],
+        'user_ratings_total': row['user_ratings_total'],
+        'categorization_source': row['categorization_source'],
+        'vibes': mask_to_vibes(row['vibe_mask'])
+    }
+
+
+def _write_places(conn, params: List[tuple]) -> None:
+    # Tiles the places are leaving, so their top-K lists are refreshed too
+    place_ids = [p[0] for p in params]
+    old_rows = []
+    for start in range(0, len(place_ids), 500):
+        chunk = place_ids[start:start + 500]
+        old_rows.extend(conn.execute(
+            f'SELECT latitude, longitude, vibe_mask FROM places '
+            f'WHERE place_id IN ({",".join("?" * len(chunk))})',
+            chunk
+        ).fetchall())
+
+    conn.executemany(UPSERT_PLACE_SQL, params)
+
+    touched = set()
+    for lat, lon, mask in [tuple(row) for row in old_rows] + [(p[2], p[3], p[9]) for p in params]:
+        tile = tile_for(lat, lon, TILE_DEGREES)
+        for bit in VIBE_BITS.values():
+            if mask & bit:
+                touched.add((bit, tile[0], tile[1]))
+    refresh_tile_top(conn.cursor(), touched)
+
+
+def _append_row(table: PlaceTable, row, distance: float) -> None:
+    table.append(
+        row['place_id'], row['name'], row['latitude'], row['longitude'],
+        row['google_type'], row['address'], row['rating'], row['user_ratings_total'],
+        row['categorization_source'], row['vibe_mask'], distance
+    )
+
+
+def _get_places_from_snapshot(lat: float, lon: float, radius: float, bit: int,
+                              limit: Optional[int]) -> Optional[PlaceTable]:
+    """
+    Places for a vibe bit within the radius from the snapshot plus SQLite deltas.
+
+    Places whose content changed since the snapshot was exported (by
+    changed_at; refreshes that find a place unchanged don't count) are read
+    from SQLite and replace their snapshot rows; the two rating-ordered
+    lists are merged.
+
+    Returns:
+        PlaceTable, or None without a snapshot or with more than
+        SNAPSHOT_MAX_DELTA_ROWS changes since it was exported
+    """
+    snapshot = get_snapshot()
+    if snapshot is None:
+        return None
+
+    with get_db() as conn:
+        deltas = conn.execute(
+            f'SELECT {PLACE_COLUMNS} FROM places WHERE changed_at >= ? LIMIT ?',
+            (snapshot.exported_at, SNAPSHOT_MAX_DELTA_ROWS + 1)
+        ).fetchall()
+    if len(deltas) > SNAPSHOT_MAX_DELTA_ROWS:
+        return None
+
+    delta_hits = []
+    for row in deltas:
+        if row['vibe_mask'] & bit:
+            distance = calculate_distance(lat, lon, row['latitude'], row['longitude'])
+            if distance <= radius:
+                delta_hits.append((row['rating'] or 0, None, row, distance))
+    delta_hits.sort(key=lambda hit: -hit[0])
+
+    snapshot_hits = snapshot.top(lat, lon, radius, bit, limit, skip={row['place_id'] for row in deltas})
+
+    table = PlaceTable()
+    for rating, index, place, distance in heapq.merge(snapshot_hits, delta_hits, key=lambda hit: -hit[0]):
+        if limit is not None and len(table) >= limit:
+            break
+        if index is None:
+            _append_row(table, place, distance)
+        else:
+            snapshot.append_to(table, index, place, distance)
+    return table
+
+
+def _scan_places_by_vibe(lat: float, lon: float, radius: float, bit: int) -> PlaceTable:
+    """Every place with the vibe bit within the radius, by rating"""
+    table = PlaceTable()
+
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius)
+
+    with get_db() as conn:
+        # The bit is inlined (not a parameter) so SQLite can match the
+        # per-vibe partial index created in init_db
+        rows = conn.execute(f'''
+            SELECT {PLACE_COLUMNS}
+            FROM places
+            WHERE vibe_mask & {bit}
+              AND latitude BETWEEN ? AND ?
+              AND longitude BETWEEN ? AND ?
+            ORDER BY rating DESC
+        ''', (min_lat, max_lat, min_lon, max_lon)).fetchall()
+
+    # Rows arrive sorted by rating (all vibe members are equal, so just use rating)
+    for row in rows:
+        # Filter the box down to the radius
+        distance = calculate_distance(lat, lon, row['latitude'], row['longitude'])
+        if distance <= radius:
+            _append_row(table, row, distance)
+
+    return table
+
+
+# Above this many edge-tile ranges the plain scan is used instead
+MAX_EDGE_RANGES = 200
+
+
+def _get_top_places_from_tiles(lat: float, lon: float, radius: float, bit: int,
+                               limit: int) -> Optional[PlaceTable]:
+    """
+    Top `limit` places for a vibe bit within the radius, using the tile lists.
+
+    Tiles with all four corners inside the circle contribute their stored
+    top-K rows; the remaining tiles along the edge are scanned with a
+    distance filter. Both lists come back sorted by rating and are merged.
+
+    Returns:
+        PlaceTable, or None when no tile lies wholly inside the radius
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius)
+    lat_lo, lon_lo = tile_for(min_lat, min_lon, TILE_DEGREES)
+    lat_hi, lon_hi = tile_for(max_lat, max_lon, TILE_DEGREES)
+
+    # Which grid corners lie inside the circle; a tile is interior when all four do
+    corner_inside = [
+        [
+            calculate_distance(lat, lon, corner_lat * TILE_DEGREES, corner_lon * TILE_DEGREES) <= radius
+            for corner_lon in range(lon_lo, lon_hi + 2)
+        ]
+        for corner_lat in range(lat_lo, lat_hi + 2)
+    ]
+
+    # Per tile row, the interior tiles form one contiguous run (the circle is convex)
+    interior = {}  # tile_lat -> (first, last) interior tile_lon
+    edge_ranges = []  # (min_lat, max_lat, min_lon, max_lon) boxes to scan
+    for tile_lat in range(lat_lo, lat_hi + 1):
+        below, above = corner_inside[tile_lat - lat_lo], corner_inside[tile_lat - lat_lo + 1]
+        inside = [
+            tile_lon for tile_lon in range(lon_lo, lon_hi + 1)
+            if below[tile_lon - lon_lo] and below[tile_lon - lon_lo + 1]
+            and above[tile_lon - lon_lo] and above[tile_lon - lon_lo + 1]
+        ]
+        row_min_lat, row_max_lat, _, _ = tile_bounds(tile_lat, lon_lo, TILE_DEGREES)
+        row_min_lat, row_max_lat = max(row_min_lat, min_lat), min(row_max_lat, max_lat)
+        if not inside:
+            edge_ranges.append((row_min_lat, row_max_lat, min_lon, max_lon))
+            continue
+        interior[tile_lat] = (inside[0], inside[-1])
+        run_min_lon = tile_bounds(tile_lat, inside[0], TILE_DEGREES)[2]
+        run_max_lon = tile_bounds(tile_lat, inside[-1], TILE_DEGREES)[3]
+        if min_lon < run_min_lon:
+            edge_ranges.append((row_min_lat, row_max_lat, min_lon, run_min_lon))
+        if run_max_lon < max_lon:
+            edge_ranges.append((row_min_lat, row_max_lat, run_max_lon, max_lon))
+
+    if not interior or len(edge_ranges) > MAX_EDGE_RANGES:
+        return None
+
+    with get_db() as conn:
+        # Both lists are read lazily in rating order and only the winning
+        # places' full rows are fetched at the end
+        tile_rows = conn.execute('''
+            SELECT rating, place_id, tile_lat, tile_lon FROM place_tile_top
+            WHERE vibe_bit = ?
+              AND tile_lat BETWEEN ? AND ?
+              AND tile_lon BETWEEN ? AND ?
+            ORDER BY rating DESC
+        ''', (bit, min(interior), max(interior), lon_lo, lon_hi))
+
+        edge_rows = iter(())
+        if edge_ranges:
+            edge_rows = conn.execute(
+                ' UNION ALL '.join(
+                    f'SELECT COALESCE(rating, 0), place_id, latitude, longitude FROM places '
+                    f'WHERE vibe_mask & {bit} AND latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?'
+                    for _ in edge_ranges
+                ) + ' ORDER BY 1 DESC',
+                [value for box in edge_ranges for value in box]
+            )
+
+        def in_interior(tile_lat, tile_lon):
+            run = interior.get(tile_lat)
+            return run is not None and run[0] <= tile_lon <= run[1]
+
+        def interior_places():
+            for rating, place_id, tile_lat, tile_lon in tile_rows:
+                if in_interior(tile_lat, tile_lon):
+                    yield rating, place_id
+
+        def edge_places():
+            for rating, place_id, place_lat, place_lon in edge_rows:
+                # Edge boxes touch interior tiles on shared borders; those
+                # places already come from the tile lists
+                if in_interior(*tile_for(place_lat, place_lon, TILE_DEGREES)):
+                    continue
+                if calculate_distance(lat, lon, place_lat, place_lon) <= radius:
+                    yield rating, place_id
+
+        top_ids = []
+        for _, place_id in heapq.merge(interior_places(), edge_places(), key=lambda item: -item[0]):
+            # Boxes sharing an edge can return a place twice
+            if place_id not in top_ids:
+                top_ids.append(place_id)
+                if len(top_ids) == limit:
+                    break
+
+        rows = {
+            row['place_id']: row for row in conn.execute(
+                f'SELECT {PLACE_COLUMNS} FROM places WHERE place_id IN ({",".join("?" * len(top_ids))})',
+                top_ids
+            )
+        } if top_ids else {}
+
+    table = PlaceTable()
+    for place_id in top_ids:
+        row = rows[place_id]
+        _append_row(table, row, calculate_distance(lat, lon, row['latitude'], row['longitude']))
+    return table
+
+
+def _insert_indexed_area(conn, lat: float, lon: float, radius: float) -> None:
+    conn.execute(
+        'INSERT INTO indexed_areas (center_lat, center_lon, radius) VALUES (?, ?, ?)',
+        (lat, lon, radius)
+    )
+
+
+def _touch_refreshed(conn, unchanged_ids: List[str], area_id: int) -> None:
+    conn.executemany(
+        'UPDATE places SET last_updated = CURRENT_TIMESTAMP WHERE place_id = ?',
+        [(place_id,) for place_id in unchanged_ids]
+    )
+    conn.execute('UPDATE indexed_areas SET indexed_at = CURRENT_TIMESTAMP WHERE id = ?', (area_id,))
+
+
+def _write_aliases(conn, aliases: List[Tuple[str, str]]) -> None:
+    conn.executemany('INSERT OR REPLACE INTO place_aliases (alias_id, canonical_id) VALUES (?, ?)', aliases)
+
+
+class SQLitePlaceStorage(PlaceStorage):
+    """Places and indexed areas in places.db"""
+
+    name = 'sqlite'
+
+    def initialize(self) -> None:
+        init_db()
+
+    def _submit(self, op, *args, wait: bool = True) -> Future:
+        future = write_queue.submit(op, *args)
+        if wait:
+            future.result()
+        return future
+
+    def upsert_places(self, places_with_vibes: List[Tuple[dict, List[str], str]], wait: bool = True) -> Future:
+        params = [_place_params(place_data, vibes, source) for place_data, vibes, source in places_with_vibes]
+        return self._submit(_write_places, params, wait=wait)
+
+    def places_by_vibe(self, lat: float, lon: float, radius: float, bit: int,
+                       limit: Optional[int] = None) -> PlaceTable:
+        """
+        Reads the memory-mapped snapshot when there is one (see
+        _get_places_from_snapshot). Otherwise, with a limit of at most
+        PLACE_TILE_TOP_K, tiles lying wholly inside the radius are read from
+        their materialized top-K lists and only the tiles cut by the circle
+        are scanned.
+        """
+        table = _get_places_from_snapshot(lat, lon, radius, bit, limit)
+        if table is not None:
+            return table
+
+        if limit is not None and limit <= PLACE_TILE_TOP_K:
+            table = _get_top_places_from_tiles(lat, lon, radius, bit, limit)
+            if table is not None:
+                return table
+
+        table = _scan_places_by_vibe(lat, lon, radius, bit)
+        if limit is not None and len(table) > limit:
+            table = table.take(range(limit))
+        return table
+
+    def places_near(self, lat: float, lon: float, radius: float) -> List[dict]:
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius)
+        with get_db() as conn:
+            rows = conn.execute(f'''
+                SELECT {PLACE_COLUMNS} FROM places
+                WHERE latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?
+            ''', (min_lat, max_lat, min_lon, max_lon)).fetchall()
+        places = []
+        for row in rows:
+            distance = calculate_distance(lat, lon, row['latitude'], row['longitude'])
+            if distance <= radius:
+                places.append(dict(_place_dict(row), distance=distance))
+        places.sort(key=lambda place: place['distance'])
+        return places
+
+    def get_places(self, place_ids: Iterable[str]) -> Dict[str, dict]:
+        place_ids = list(place_ids)
+        stored = {}
+        with get_db() as conn:
+            for start in range(0, len(place_ids), 500):
+                chunk = place_ids[start:start + 500]
+                for row in conn.execute(
+                    f'SELECT {PLACE_COLUMNS} FROM places WHERE place_id IN ({",".join("?" * len(chunk))})',
+                    chunk
+                ):
+                    stored[row['place_id']] = _place_dict(row)
+        return stored
+
+    def all_places(self) -> List[dict]:
+        with get_db() as conn:
+            rows = conn.execute(f'SELECT {PLACE_COLUMNS} FROM places').fetchall()
+        return [_place_dict(row) for row in rows]
+
+    def get_aliases(self, place_ids: Iterable[str]) -> Dict[str, str]:
+        place_ids = list(place_ids)
+        aliases = {}
+        with get_db() as conn:
+            for start in range(0, len(place_ids), 500):
+                chunk = place_ids[start:start + 500]
+                aliases.update(conn.execute(
+                    f'SELECT alias_id, canonical_id FROM place_aliases WHERE alias_id IN ({",".join("?" * len(chunk))})',
+                    chunk
+                ).fetchall())
+        return aliases
+
+    def add_aliases(self, aliases: Dict[str, str], wait: bool = True) -> Future:
+        return self._submit(_write_aliases, list(aliases.items()), wait=wait)
+
+    def indexed_areas(self) -> List[dict]:
+        with get_db() as conn:
+            areas = conn.execute('''
+                SELECT id, center_lat, center_lon, radius,
+                       (julianday('now') - julianday(indexed_at)) * 86400 AS age_seconds
+                FROM indexed_areas
+            ''').fetchall()
+        return [dict(area) for area in areas]
+
+    def mark_area_indexed(self, lat: float, lon: float, radius: float, wait: bool = True) -> Future:
+        return self._submit(_insert_indexed_area, lat, lon, radius, wait=wait)
+
+    def mark_area_refreshed(self, area_id, unchanged_ids: List[str], wait: bool = True) -> Future:
+        return self._submit(_touch_refreshed, unchanged_ids, area_id, wait=wait)
@@ -0,0 +1,119 @@
+"""
+Place storage interface and backend selection.
+
+place_service talks to a PlaceStorage instead of SQL. A backend handles
+five things:
+- upserting places with their vibes
+- radius queries (per vibe, or any place for deduplication)
+- lookup by id
+- alias links from duplicate place_ids to the stored (canonical) place
+- tracking which areas have been indexed (coverage)
+
+Backends (PLACE_STORAGE):
+- 'sqlite': places.db with tiles, snapshot and write queue (models/sqlite_storage.py)
+- 'memory': process-local dicts with a tile grid index (models/memory_storage.py)
+"""
+import threading
+from concurrent.futures import Future
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import PLACE_STORAGE
+from models.place_table import PlaceTable
+
+
+class PlaceStorage:
+    """
+    Storage backend for places and indexed areas.
+
+    Place dicts returned by get_places/get_place have the keys place_id,
+    name, latitude, longitude, google_type, address, rating,
+    user_ratings_total, categorization_source and vibes. Writes return a
+    Future; with wait=True it has already completed.
+    """
+
+    name = None
+
+    def initialize(self) -> None:
+        """Create whatever the backend needs up front (otherwise done on first use)"""
+
+    def upsert_places(self, places_with_vibes: List[Tuple[dict, List[str], str]], wait: bool = True) -> Future:
+        """Insert or replace places given as (place_data, vibes, source) tuples"""
+        raise NotImplementedError
+
+    def places_by_vibe(self, lat: float, lon: float, radius: float, bit: int,
+                       limit: Optional[int] = None) -> PlaceTable:
+        """Places with the vibe bit within radius meters, best rated first, with distances"""
+        raise NotImplementedError
+
+    def places_near(self, lat: float, lon: float, radius: float) -> List[dict]:
+        """Every stored place within radius meters, whatever its vibes, nearest first (with 'distance')"""
+        raise NotImplementedError
+
+    def get_places(self, place_ids: Iterable[str]) -> Dict[str, dict]:
+        """Stored places by id (ids that aren't stored are left out)"""
+        raise NotImplementedError
+
+    def get_place(self, place_id: str) -> Optional[dict]:
+        return self.get_places([place_id]).get(place_id)
+
+    def all_places(self) -> List[dict]:
+        """Every stored place (e.g. to build the gazetteer)"""
+        raise NotImplementedError
+
+    def get_aliases(self, place_ids: Iterable[str]) -> Dict[str, str]:
+        """Canonical place_id for each of the given ids that is a known alias"""
+        raise NotImplementedError
+
+    def add_aliases(self, aliases: Dict[str, str], wait: bool = True) -> Future:
+        """Record alias place_id -> canonical place_id links"""
+        raise NotImplementedError
+
+    def indexed_areas(self) -> List[dict]:
+        """Every indexed area as a dict with id, center_lat, center_lon, radius and age_seconds"""
+        raise NotImplementedError
+
+    def mark_area_indexed(self, lat: float, lon: float, radius: float, wait: bool = True) -> Future:
+        raise NotImplementedError
+
+    def mark_area_refreshed(self, area_id, unchanged_ids: List[str], wait: bool = True) -> Future:
+        """Reset an area's age and note that the given places were seen unchanged"""
+        raise NotImplementedError
+
+
+def completed(value=None) -> Future:
+    """An already-finished Future, for backends that write synchronously"""
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def create_storage(name: str) -> PlaceStorage:
+    """New storage backend by name ('sqlite' or 'memory')"""
+    if name == 'sqlite':
+        from models.sqlite_storage import SQLitePlaceStorage
+        return SQLitePlaceStorage()
+    if name == 'memory':
+        from models.memory_storage import MemoryPlaceStorage
+        return MemoryPlaceStorage()
+    raise ValueError(f'Unknown place storage: {name}')
+
+
+def get_storage() -> PlaceStorage:
+    """The process-wide storage backend selected by PLACE_STORAGE"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = create_storage(PLACE_STORAGE)
+    return _storage
+
+
+def set_storage(storage: PlaceStorage) -> None:
+    """Swap the process-wide backend (e.g. an in-memory one for a batch job or benchmark)"""
+    global _storage
+    with _storage_lock:
+        _storage = storage
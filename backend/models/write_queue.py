@@ -0,0 +1,143 @@
+"""
+Write-behind queue for the places database.
+
+SQLite allows one writer at a time, so request threads that each open
+their own write transaction end up waiting on each other (and failing
+with 'database is locked' under load). Instead, writes are queued here as
+functions of a connection and applied by a single writer thread, which
+commits whatever has queued up together in one transaction. Every write
+gets a Future; callers that need to read their own writes wait on it.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from config import (
+    WRITE_BEHIND_ENABLED, WRITE_BATCH_MAX_OPS, WRITE_BATCH_WAIT_MS, WRITE_QUEUE_SIZE, DB_BUSY_TIMEOUT_SECONDS
+)
+from models import database
+from utils.metrics import DB_WRITES, DB_WRITE_BATCH_SECONDS, DB_WRITE_BATCH_SIZE
+
+
+class WriteQueue:
+    """
+    Queue of writes drained by one daemon thread in batched transactions.
+
+    Each write runs inside its own savepoint, so a failing write is rolled
+    back and reported on its Future without affecting the rest of the batch.
+    Writes are applied in submission order.
+    """
+
+    def __init__(self, max_batch=WRITE_BATCH_MAX_OPS, batch_wait_ms=WRITE_BATCH_WAIT_MS,
+                 max_pending=WRITE_QUEUE_SIZE, enabled=WRITE_BEHIND_ENABLED):
+        self.max_batch = max(1, max_batch)
+        self.batch_wait = batch_wait_ms / 1000
+        self.enabled = enabled
+        self._ops = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._writer = None
+
+    def submit(self, op, *args):
+        """
+        Queue op(conn, *args) and return a Future of its result.
+
+        Blocks while the queue is full. With the queue disabled the write
+        runs right away in its own transaction.
+        """
+        future = Future()
+        if not self.enabled:
+            try:
+                with database.get_db() as conn:
+                    result = op(conn, *args)
+            except Exception as e:
+                DB_WRITES.inc(outcome='error')
+                future.set_exception(e)
+                return future
+            # Only resolved once committed, as on the writer thread
+            DB_WRITES.inc(outcome='ok')
+            future.set_result(result)
+            return future
+
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._writer.start()
+        self._ops.put((op, args, future))
+        return future
+
+    def pending(self):
+        """Number of writes waiting to be applied"""
+        return self._ops.qsize()
+
+    def _next_batch(self):
+        batch = [self._ops.get()]
+        give_up_at = time.monotonic() + self.batch_wait
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._ops.get_nowait())
+            except queue.Empty:
+                left = give_up_at - time.monotonic()
+                if left <= 0:
+                    break
+                try:
+                    batch.append(self._ops.get(timeout=left))
+                except queue.Empty:
+                    break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._apply(batch)
+            except Exception as e:
+                # The transaction itself failed (e.g. another process held the lock too long)
+                print(f"Error committing {len(batch)} queued writes: {e}")
+                DB_WRITES.inc(len(batch), outcome='error')
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                for _ in batch:
+                    self._ops.task_done()
+
+    def _apply(self, batch):
+        started = time.perf_counter()
+        outcomes = []
+        conn = database.get_connection()
+        # Savepoints and BEGIN IMMEDIATE need manual transaction control
+        conn.isolation_level = None
+        conn.execute(f'PRAGMA busy_timeout = {int(DB_BUSY_TIMEOUT_SECONDS * 1000)}')
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for op, args, _ in batch:
+                conn.execute('SAVEPOINT queued_write')
+                try:
+                    outcomes.append((True, op(conn, *args)))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO queued_write')
+                    outcomes.append((False, e))
+                conn.execute('RELEASE queued_write')
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+        DB_WRITE_BATCH_SECONDS.observe(time.perf_counter() - started)
+        DB_WRITE_BATCH_SIZE.observe(len(batch))
+        for (ok, value), (op, _, future) in zip(outcomes, batch):
+            if ok:
+                DB_WRITES.inc(outcome='ok')
+                future.set_result(value)
+            else:
+                print(f"Error in queued write {op.__name__}: {value}")
+                DB_WRITES.inc(outcome='error')
+                future.set_exception(value)
+
+
+# Shared queue for places.db writes
+write_queue = WriteQueue()
@@ -1,11 +1,144 @@
 """AI service for LLM integrations (OpenRouter and Gemini)"""
-import requests
 import json
 import os
-from config import VIBE_CONFIGS, VALID_VIBES
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from config import (
+    VIBE_CONFIGS, VALID_VIBES, VIBE_CLASSIFIER_ENABLED, VIBE_CLASSIFIER_THRESHOLD,
+    VIBE_CACHE_MAX_ENTRIES, VIBE_CACHE_TTL_SECONDS, GEMINI_TIMEOUT_SECONDS
+)
+from services.upstream import upstream_request, call_upstream
+from services.vibe_classifier import classify_vibe, normalize_text
+from utils.deadline import clamp_timeout
+from utils.metrics import stage, VIBE_DETECTIONS
+from utils.ttl_cache import TTLCache
+
+# API endpoints (base URL can point at a local stand-in, see loadtest/fake_upstreams.py)
+OPENROUTER_BASE_URL = os.getenv('OPENROUTER_BASE_URL', 'https://openrouter.ai/api/v1').rstrip('/')
+OPENROUTER_CHAT_URL = f"{OPENROUTER_BASE_URL}/chat/completions"
+
+# Optional Gemini endpoint override, e.g. http://localhost:8090 (uses the REST transport)
+GEMINI_API_ENDPOINT = os.getenv('GEMINI_API_ENDPOINT')
+GEMINI_MODEL_NAME = 'gemini-pro'
+
+_gemini_model = None
+_gemini_lock = threading.Lock()
+
+# google-generativeai 0.3 has no per-call timeout, so calls run here and are waited on.
+# A call that times out keeps its worker until Gemini answers; once every
+# worker is taken new calls are turned away rather than queued.
+GEMINI_POOL_WORKERS = 4
+_gemini_pool = ThreadPoolExecutor(max_workers=GEMINI_POOL_WORKERS, thread_name_prefix='gemini')
+_gemini_slots = threading.BoundedSemaphore(GEMINI_POOL_WORKERS)
+
+
+class GeminiBusy(Exception):
+    """Every Gemini worker is still busy with an earlier call"""
+
+# Detected vibes keyed on normalized text (in memory only)
+vibe_cache = TTLCache(VIBE_CACHE_MAX_ENTRIES, VIBE_CACHE_TTL_SECONDS)
+
+
+def get_gemini_model():
+    """
+    Return the shared Gemini model, configuring the client on first use.
+
+    google.generativeai is slow to import, so it is only loaded the first
+    time a description is actually generated.
+    """
+    global _gemini_model
+    if _gemini_model is None:
+        with _gemini_lock:
+            if _gemini_model is None:
+                import google.generativeai as genai
+
+                if GEMINI_API_ENDPOINT:
+                    genai.configure(
+                        api_key=os.getenv('GEMINI_API_KEY'),
+                        transport='rest',
+                        client_options={'api_endpoint': GEMINI_API_ENDPOINT}
+                    )
+                else:
+                    genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+                _gemini_model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+    return _gemini_model
+
+
+def _generate_content(model, prompt, timeout):
+    """
+    model.generate_content(prompt), giving up after timeout seconds.
+
+    A call already running when the timeout hits runs on in its worker.
+    Raises GeminiBusy when no worker is free.
+    """
+    if not _gemini_slots.acquire(blocking=False):
+        raise GeminiBusy('gemini: all workers busy')
+    try:
+        future = _gemini_pool.submit(model.generate_content, prompt)
+    except Exception:
+        _gemini_slots.release()
+        raise
+    future.add_done_callback(lambda _: _gemini_slots.release())
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        future.cancel()
+        raise
+
+
+def _vibe_result(vibe, location, source, confidence=None):
+    return {
+        'vibe': vibe,
+        'emoji': VIBE_CONFIGS[vibe]['emoji'],
+        'description': VIBE_CONFIGS[vibe]['description'],
+        'location': location,
+        'source': source,
+        'confidence': confidence
+    }
 
 
 def detect_vibe_from_text(openrouter_api_key, user_text):
+    """
+    Detect vibe and location from user's text description.
+
+    Tries the local classifier first and only calls the OpenRouter LLM when
+    its confidence is below VIBE_CLASSIFIER_THRESHOLD. If the LLM isn't
+    configured or fails, the local guess is returned instead. Results are
+    cached by normalized text; 'source' says where the answer came from.
+    Every call returns a dict of its own, so callers may add to it.
+    """
+    key = normalize_text(user_text)
+    cached = vibe_cache.get(key)
+    if cached:
+        VIBE_DETECTIONS.inc(source='cache')
+        return dict(cached)
+
+    local = None
+    if VIBE_CLASSIFIER_ENABLED:
+        with stage('vibe-classifier'):
+            local = classify_vibe(user_text)
+        if local['confidence'] >= VIBE_CLASSIFIER_THRESHOLD:
+            result = _vibe_result(local['vibe'], local['location'], 'local', round(local['confidence'], 3))
+            VIBE_DETECTIONS.inc(source='local')
+            vibe_cache.put(key, dict(result))
+            return result
+
+    try:
+        result = detect_vibe_with_llm(openrouter_api_key, user_text)
+    except Exception as e:
+        if local is None:
+            raise
+        # Best local guess; not cached so the LLM is tried again next time
+        print(f"Vibe detection falling back to local classifier: {e}")
+        VIBE_DETECTIONS.inc(source='local_fallback')
+        return _vibe_result(local['vibe'], local['location'], 'local', round(local['confidence'], 3))
+
+    VIBE_DETECTIONS.inc(source='llm')
+    vibe_cache.put(key, dict(result))
+    return result
+
+
+def detect_vibe_with_llm(openrouter_api_key, user_text):
     """Detect vibe and location from user's text description using OpenRouter LLM"""
     if not openrouter_api_key:
         raise ValueError('OpenRouter API not configured')
@@ -50,8 +183,8 @@ Examples:
         'max_tokens': 50
     }
 
-    response = requests.post(
-        'https://openrouter.ai/api/v1/chat/completions',
+    response = upstream_request(
+        'openrouter', 'POST', OPENROUTER_CHAT_URL,
         headers=headers,
         json=payload,
         timeout=10
@@ -78,16 +211,11 @@ Examples:
             if loc and loc != 'none':
                 detected_location = loc
 
-    return {
-        'vibe': detected_vibe,
-        'emoji': VIBE_CONFIGS[detected_vibe]['emoji'],
-        'description': VIBE_CONFIGS[detected_vibe]['description'],
-        'location': detected_location
-    }
+    return _vibe_result(detected_vibe, detected_location, 'llm')
 
 
-def generate_route_description(gemini_model, vibe, places):
-    """Generate AI-enhanced description using Gemini"""
+def generate_route_description(vibe, places, gemini_model=None):
+    """Generate AI-enhanced description using Gemini (the shared model unless one is given)"""
     if not places:
         vibe_config = VIBE_CONFIGS.get(vibe, {})
         return vibe_config.get('description', 'A nice walking route')
@@ -100,7 +228,8 @@ def generate_route_description(gemini_model, vibe, places):
     Make it sound inviting and match the {vibe} mood."""
 
     try:
-        response = gemini_model.generate_content(prompt)
+        model = gemini_model or get_gemini_model()
+        response = call_upstream('gemini', _generate_content, model, prompt, clamp_timeout(GEMINI_TIMEOUT_SECONDS))
         return response.text.strip()
     except Exception as e:
         print(f"Gemini API error: {e}")
@@ -147,8 +276,8 @@ Do not include any other text, explanation, or formatting."""
     }
 
     try:
-        response = requests.post(
-            'https://openrouter.ai/api/v1/chat/completions',
+        response = upstream_request(
+            'openrouter', 'POST', OPENROUTER_CHAT_URL,
             headers=headers,
             json=payload,
             timeout=10
@@ -0,0 +1,342 @@
+"""
+Batch route generation.
+
+Generates routes for many route specs at once (e.g. nightly precomputation
+for a partner's start points). Specs are grouped by area so indexing checks
+and place queries are shared, the optimizer runs in a process pool, and
+Directions requests run concurrently under a rate limit. Upstream calls use
+the scheduler's batch priority, behind interactive requests. Results are
+yielded as each route completes.
+"""
+import multiprocessing
+import threading
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from config import (
+    VIBE_CONFIGS, BATCH_AREA_GRID_METERS, BATCH_OPTIMIZER_WORKERS,
+    BATCH_DIRECTIONS_CONCURRENCY, BATCH_DIRECTIONS_RATE, ROUTE_PLACE_LIMIT
+)
+from services import place_service
+from services.ai_service import generate_route_description
+from services.google_maps_service import get_google_directions
+from services.route_cache import route_cache, make_route_key, snap_to_grid
+from services.upstream import upstream_priority
+from services.route_service import (
+    parse_route_spec, calculate_route_parameters, optimize_waypoints, generate_waypoint_candidates, build_route_result
+)
+from utils.geo_utils import calculate_distance
+from utils.metrics import stage, ERRORS, DEGRADED_RESPONSES
+from utils.payload import parse_payload_shape, shape_response
+from utils.rate_limit import TokenBucket
+
+_optimizer_pool = None
+_optimizer_pool_lock = threading.Lock()
+
+
+def get_optimizer_pool():
+    """Shared optimizer process pool, started on first use"""
+    global _optimizer_pool
+    if _optimizer_pool is None:
+        with _optimizer_pool_lock:
+            if _optimizer_pool is None:
+                # spawn, not fork: the web server process is multi-threaded
+                _optimizer_pool = ProcessPoolExecutor(
+                    max_workers=max(1, BATCH_OPTIMIZER_WORKERS),
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+    return _optimizer_pool
+
+
+def _discard_optimizer_pool(pool):
+    """Drop a broken pool so the next batch starts a fresh one"""
+    global _optimizer_pool
+    with _optimizer_pool_lock:
+        if _optimizer_pool is pool:
+            _optimizer_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def plan_waypoints(start_lat, start_lon, places, target_distance, vibe, is_circular,
+                   destination_coords=None, num_routes=1):
+    """
+    Waypoint sets for one route spec (runs in an optimizer worker process).
+
+    Args:
+        places: PlaceTable of candidate places for the vibe
+
+    Returns:
+        List of num_routes waypoint lists (fewer if the pool is too small)
+    """
+    place_list = places.places()
+    if num_routes == 1:
+        return [optimize_waypoints(
+            start_lat, start_lon, place_list, target_distance, vibe, is_circular, destination_coords
+        )]
+
+    candidates = generate_waypoint_candidates(
+        start_lat, start_lon, place_list, target_distance, vibe, is_circular, destination_coords, k=num_routes
+    )
+    return [c['waypoints'] for c in candidates]
+
+
+def group_by_area(jobs, grid_meters=BATCH_AREA_GRID_METERS):
+    """Group route jobs by the grid cell of their start point"""
+    groups = defaultdict(list)
+    for job in jobs:
+        spec = job['spec']
+        groups[snap_to_grid(spec['latitude'], spec['longitude'], grid_meters)].append(job)
+    return list(groups.values())
+
+
+def _error_result(job, message):
+    result = {'index': job['index'], 'error': message}
+    if job.get('id') is not None:
+        result['id'] = job['id']
+    return result
+
+
+def _route_result(job, response, cache_status):
+    result = {'index': job['index'], 'cache': cache_status}
+    if job.get('id') is not None:
+        result['id'] = job['id']
+    result.update(shape_response(response, job['geometry'], job['waypoint_fields']))
+    return result
+
+
+def _load_group_places(group, google_api_key, openrouter_api_key):
+    """
+    Fill in job['places'] for every job in one area group.
+
+    Each start's area is indexed if needed (once one is indexed its
+    neighbours are usually covered), then a single query per vibe around
+    the group's center is narrowed down to each job's own search radius.
+    """
+    for job in group:
+        spec, radius = job['spec'], job['route_params']['search_radius']
+        with upstream_priority('batch'):
+            if not place_service.ensure_area_indexed(
+                google_api_key, openrouter_api_key, spec['latitude'], spec['longitude'], radius
+            ):
+                job['degraded'].append('indexing')
+
+    center_lat = sum(job['spec']['latitude'] for job in group) / len(group)
+    center_lon = sum(job['spec']['longitude'] for job in group) / len(group)
+
+    by_vibe = defaultdict(list)
+    for job in group:
+        by_vibe[job['spec']['vibe']].append(job)
+
+    for vibe, vibe_jobs in by_vibe.items():
+        # Smallest circle around the center that covers every job's search area
+        query_radius = max(
+            calculate_distance(center_lat, center_lon, job['spec']['latitude'], job['spec']['longitude'])
+            + job['route_params']['search_radius']
+            for job in vibe_jobs
+        )
+        with stage('db-query'):
+            shared = place_service.get_place_table_by_vibe(center_lat, center_lon, query_radius, vibe)
+
+        for job in vibe_jobs:
+            spec, radius = job['spec'], job['route_params']['search_radius']
+            places = place_service.filter_place_table(
+                shared, spec['latitude'], spec['longitude'], radius, ROUTE_PLACE_LIMIT or None
+            )
+            if not places:
+                with upstream_priority('batch'):
+                    places = place_service.get_fallback_route_places(
+                        google_api_key, openrouter_api_key, spec['latitude'], spec['longitude'], radius, vibe,
+                        job['degraded']
+                    )
+            job['places'] = places
+
+
+def _fetch_directions(limiter, api_key, waypoints):
+    limiter.acquire()
+    with stage('directions'), upstream_priority('batch'):
+        return get_google_directions(api_key, waypoints)
+
+
+def _finish_route(job, describe):
+    """Build the full response for a job once all its directions are in"""
+    spec, places = job['spec'], job['places']
+    with stage('near-route'):
+        routes = [build_route_result(directions, places) for directions in job['directions'] if directions]
+    if not routes:
+        return None
+
+    primary = routes[0]
+    if describe:
+        with stage('description'), upstream_priority('batch'):
+            description = generate_route_description(spec['vibe'], primary['waypoints'])
+    else:
+        description = VIBE_CONFIGS[spec['vibe']]['description']
+
+    response = {
+        'vibe': spec['vibe'],
+        'description': description,
+        'route': primary['route'],
+        'waypoints': primary['waypoints'],
+        'directions': primary['directions'],
+        'config': VIBE_CONFIGS[spec['vibe']]
+    }
+    if spec['num_routes'] > 1:
+        response['alternatives'] = routes[1:]
+    if job['degraded']:
+        response['degraded'] = list(job['degraded'])
+        for name in job['degraded']:
+            DEGRADED_RESPONSES.inc(stage=name)
+    return response
+
+
+def generate_routes_batch(specs, google_api_key, openrouter_api_key=None, describe=False,
+                          optimizer_workers=None, directions_concurrency=BATCH_DIRECTIONS_CONCURRENCY,
+                          directions_rate=BATCH_DIRECTIONS_RATE):
+    """
+    Generate routes for many specs, yielding one result dict per spec as it completes.
+
+    Each spec takes the same fields as a /api/generate-route body, plus an
+    optional 'id' echoed back in its result. Results arrive out of order and
+    carry the spec's 'index' in the input list. A result has either the
+    usual route response fields (plus 'cache': HIT, MISS or BYPASS) or an
+    'error' message; one bad spec doesn't stop the batch.
+
+    Args:
+        specs: List of route spec dicts
+        google_api_key: Google Maps API key
+        openrouter_api_key: OpenRouter key for categorizing places while indexing
+        describe: Generate an AI description per route; otherwise the vibe's
+            static description is used and results aren't added to the route cache
+        optimizer_workers: 0 runs the optimizer in this process; otherwise the
+            shared process pool is used (defaults to BATCH_OPTIMIZER_WORKERS)
+        directions_concurrency: Directions requests in flight at once
+        directions_rate: Directions requests per second
+    """
+    jobs = []
+    for index, data in enumerate(specs):
+        job = {'index': index, 'id': data.get('id') if isinstance(data, dict) else None}
+        try:
+            if not isinstance(data, dict):
+                raise ValueError('Route spec must be an object')
+            job['spec'] = spec = parse_route_spec(data)
+            job['geometry'], job['waypoint_fields'] = parse_payload_shape(data)
+        except ValueError as e:
+            yield _error_result(job, str(e))
+            continue
+
+        job['cache_key'] = None
+        if route_cache is not None and not data.get('no_cache'):
+            job['cache_key'] = make_route_key(
+                spec['latitude'], spec['longitude'], spec['vibe'], spec['duration'], spec['is_circular'],
+                None if spec['is_circular'] else spec['destination'], spec['num_routes']
+            )
+            cached = route_cache.get(job['cache_key'])
+            if cached:
+                yield _route_result(job, cached, 'HIT')
+                continue
+
+        job['route_params'] = calculate_route_parameters(spec['duration'], spec['vibe'], spec['is_circular'])
+        job['degraded'] = []  # Stages that fell back, as in build_route_response
+        jobs.append(job)
+
+    if not jobs:
+        return
+
+    if optimizer_workers is None:
+        optimizer_workers = BATCH_OPTIMIZER_WORKERS
+    inline = optimizer_workers == 0
+    optimizer = None if inline else get_optimizer_pool()
+    limiter = TokenBucket(directions_rate, capacity=directions_concurrency)
+    pending = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, directions_concurrency)) as io_pool:
+
+        def waypoints_ready(job, waypoint_sets):
+            job['directions'] = [None] * len(waypoint_sets)
+            job['remaining'] = len(waypoint_sets)
+            for i, waypoints in enumerate(waypoint_sets):
+                future = io_pool.submit(_fetch_directions, limiter, google_api_key, waypoints)
+                pending[future] = ('directions', job, i)
+
+        def fail(job, error):
+            ERRORS.inc(endpoint='generate_routes_batch')
+            print(f"Error generating batch route {job['index']}: {error}")
+            return _error_result(job, str(error))
+
+        def drain(block):
+            """Advance finished work; yields completed results"""
+            while pending:
+                done, _ = wait(pending, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+                if not done:
+                    return
+                for future in done:
+                    kind, job, *rest = pending.pop(future)
+                    if job.get('failed'):
+                        continue
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        job['failed'] = True
+                        yield fail(job, e)
+                        continue
+
+                    if kind == 'optimize':
+                        waypoints_ready(job, result)
+                    elif kind == 'directions':
+                        job['directions'][rest[0]] = result
+                        job['remaining'] -= 1
+                        if job['remaining'] == 0:
+                            pending[io_pool.submit(_finish_route, job, describe)] = ('finish', job)
+                    elif result is None:
+                        yield _error_result(job, 'Could not generate route. Try a different location or duration.')
+                    else:
+                        cache_status = 'BYPASS'
+                        if job['cache_key'] and describe and not result.get('degraded'):
+                            route_cache.put(job['cache_key'], result)
+                            cache_status = 'MISS'
+                        yield _route_result(job, result, cache_status)
+
+        try:
+            for group in group_by_area(jobs):
+                try:
+                    _load_group_places(group, google_api_key, openrouter_api_key)
+                except Exception as e:
+                    for job in group:
+                        yield fail(job, e)
+                    continue
+
+                for job in group:
+                    spec = job['spec']
+                    dest_coords = None
+                    if not spec['is_circular'] and spec['destination']:
+                        dest_coords = (spec['destination']['latitude'], spec['destination']['longitude'])
+                    args = (
+                        spec['latitude'], spec['longitude'], job['places'],
+                        job['route_params']['target_distance'], spec['vibe'], spec['is_circular'],
+                        dest_coords, spec['num_routes']
+                    )
+                    if not inline:
+                        try:
+                            pending[optimizer.submit(plan_waypoints, *args)] = ('optimize', job)
+                            continue
+                        except BrokenProcessPool:
+                            # A worker died; finish this batch in-process
+                            _discard_optimizer_pool(optimizer)
+                            inline = True
+
+                    try:
+                        with stage('optimizer'):
+                            waypoints_ready(job, plan_waypoints(*args))
+                    except Exception as e:
+                        job['failed'] = True
+                        yield fail(job, e)
+
+                # Stream whatever has finished so far before starting the next area
+                yield from drain(block=False)
+
+            yield from drain(block=True)
+        finally:
+            # Stop queued work if the consumer goes away early
+            for future in pending:
+                future.cancel()
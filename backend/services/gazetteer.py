@@ -0,0 +1,360 @@
+"""
+Offline gazetteer for location autocomplete and geocoding.
+
+Built in memory from the place names and address localities in place storage,
+plus an optional CSV of extra place names (GAZETTEER_IMPORT_PATH, columns
+name, latitude, longitude and optionally kind, weight, address). Lookups use
+a sorted key array with binary search; names that aren't known, or that
+match several far-apart places, still go to Google geocoding.
+"""
+import csv
+import difflib
+import math
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from config import (
+    GAZETTEER_IMPORT_PATH, GAZETTEER_REFRESH_SECONDS, GAZETTEER_AMBIGUOUS_METERS, GAZETTEER_CLUSTER_METERS,
+    GAZETTEER_MAX_GEOCODED
+)
+from models.storage import get_storage
+from services.google_maps_service import geocode_location
+from services.upstream import circuit_open
+from utils.geo_utils import calculate_distance
+
+# Upper bound on prefix matches ranked per query
+MAX_PREFIX_CANDIDATES = 500
+
+# Fuzzy matching kicks in for queries at least this long
+FUZZY_MIN_LENGTH = 3
+FUZZY_CUTOFF = 0.75
+
+# A far-away same-name entry makes a name ambiguous only if it is at least
+# this popular relative to the best match (stray addresses don't count)
+AMBIGUOUS_WEIGHT_RATIO = 0.2
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+# Postcodes, house numbers and US state codes trailing an address locality
+_POSTCODE_TOKEN = re.compile(r'^(?:[A-Z]{2}|.*\d.*)$')
+
+
+def normalize_name(text):
+    """Search key for a name: accents stripped, case-folded, punctuation collapsed"""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c)).casefold()
+    text = text.replace("'", '').replace('’', '')
+    return _NON_ALNUM.sub(' ', text).strip()
+
+
+def address_localities(address):
+    """
+    Locality names in a formatted address.
+
+    "Dean's Yard, London SW1P 3PA, UK" -> ["London"]: the first part (street)
+    and last part (country) are dropped, as are postcodes and state codes.
+    """
+    parts = [p.strip() for p in (address or '').split(',')]
+    localities = []
+    for part in parts[1:-1]:
+        words = part.split()
+        while words and _POSTCODE_TOKEN.match(words[-1]):
+            words.pop()
+        while words and any(c.isdigit() for c in words[0]):
+            words.pop(0)
+        if words:
+            localities.append(' '.join(words))
+    return localities
+
+
+class Gazetteer:
+    """
+    In-memory place-name index.
+
+    Entries live in parallel columns. Every entry is indexed under its full
+    name and under each later word ("hyde park" and "park"), so prefixes of
+    any word match.
+
+    The sorted keys and their entry indices are held as one (keys, entries)
+    tuple that add() replaces whole, so search() needs no lock: it reads the
+    pair once and never sees a key paired with the wrong entry.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.details = []    # Address or containing locality, for display
+        self.kinds = []      # 'place', 'area', 'imported' or 'geocoded'
+        self.latitudes = array('d')
+        self.longitudes = array('d')
+        self.weights = array('d')
+        # (sorted search keys, entry index per key); negative indices mark keys starting mid-name
+        self._index = ([], [])
+        self._full_keys = {}   # Full normalized name -> entry indices
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def keys(self):
+        """Sorted search keys"""
+        return self._index[0]
+
+    @property
+    def key_entries(self):
+        """Entry index per key (negative when the key starts mid-name)"""
+        return self._index[1]
+
+    def add(self, name, latitude, longitude, kind='place', weight=1.0, detail=None):
+        """
+        Add one entry, keeping the key index sorted.
+
+        Copies the index and swaps the copy in, so it costs O(keys); meant
+        for the odd geocoded name, not bulk loading (use build()).
+        """
+        index = self._append(name, latitude, longitude, kind, weight, detail)
+        keys, key_entries = list(self._index[0]), list(self._index[1])
+        for key, tag in self._index_keys(index):
+            position = bisect_left(keys, key)
+            keys.insert(position, key)
+            key_entries.insert(position, tag)
+        self._index = (keys, key_entries)
+        return index
+
+    def _append(self, name, latitude, longitude, kind, weight, detail):
+        index = len(self.names)
+        self.names.append(name)
+        self.details.append(detail)
+        self.kinds.append(kind)
+        self.latitudes.append(latitude)
+        self.longitudes.append(longitude)
+        self.weights.append(weight)
+        return index
+
+    def _index_keys(self, index):
+        words = normalize_name(self.names[index]).split()
+        if not words:
+            return []
+        self._full_keys.setdefault(' '.join(words), []).append(index)
+        # Entry indices are stored as ~index for keys that start mid-name
+        return [(' '.join(words[i:]), index if i == 0 else ~index) for i in range(len(words))]
+
+    @classmethod
+    def build(cls, entries):
+        """Build from (name, lat, lon, kind, weight, detail) tuples in one sort"""
+        gazetteer = cls()
+        pairs = []
+        for name, latitude, longitude, kind, weight, detail in entries:
+            index = gazetteer._append(name, latitude, longitude, kind, weight, detail)
+            pairs.extend(gazetteer._index_keys(index))
+        pairs.sort()
+        gazetteer._index = ([key for key, _ in pairs], [tag for _, tag in pairs])
+        return gazetteer
+
+    def _suggestion(self, index, score):
+        return {
+            'name': self.names[index],
+            'latitude': self.latitudes[index],
+            'longitude': self.longitudes[index],
+            'kind': self.kinds[index],
+            'detail': self.details[index],
+            'score': round(score, 3),
+        }
+
+    def search(self, query, limit=10, near=None):
+        """
+        Rank entries matching a partial name.
+
+        Exact names rank above prefixes of the whole name, which rank above
+        prefixes of a later word; popular entries and (with near=(lat, lon))
+        nearby ones get a boost. Falls back to fuzzy matching on full names
+        when there are too few prefix matches.
+
+        Returns:
+            List of suggestion dicts, best first
+        """
+        q = normalize_name(query)
+        if not q:
+            return []
+
+        keys, key_entries = self._index
+        scores = {}
+        start = bisect_left(keys, q)
+        for position in range(start, min(start + MAX_PREFIX_CANDIDATES, len(keys))):
+            key = keys[position]
+            if not key.startswith(q):
+                break
+            tag = key_entries[position]
+            index = tag if tag >= 0 else ~tag
+            if tag >= 0:
+                match = 3.0 if key == q else 2.0
+            else:
+                match = 1.0
+            scores[index] = max(scores.get(index, 0.0), match)
+
+        if len(scores) < limit and len(q) >= FUZZY_MIN_LENGTH:
+            # Only full names starting with the same letter are compared
+            lo = bisect_left(keys, q[0])
+            hi = bisect_left(keys, chr(ord(q[0]) + 1))
+            pool = {keys[p] for p in range(lo, hi) if key_entries[p] >= 0}
+            for key in difflib.get_close_matches(q, pool, n=limit, cutoff=FUZZY_CUTOFF):
+                ratio = difflib.SequenceMatcher(None, q, key).ratio()
+                for index in self._full_keys.get(key, []):
+                    scores.setdefault(index, ratio)
+
+        ranked = []
+        for index, match in scores.items():
+            score = match + min(1.0, math.log1p(self.weights[index]) / 10)
+            if near:
+                distance = calculate_distance(near[0], near[1], self.latitudes[index], self.longitudes[index])
+                score += 1.0 / (1.0 + distance / 5000)
+            ranked.append((score, index))
+        ranked.sort(key=lambda item: -item[0])
+        return [self._suggestion(index, score) for score, index in ranked[:limit]]
+
+    def resolve(self, name):
+        """
+        The entry an exact name unambiguously refers to, or None.
+
+        When several entries share the name, an earlier Google answer wins;
+        otherwise the most popular one is used unless a comparably popular
+        one lies more than GAZETTEER_AMBIGUOUS_METERS away.
+        """
+        matches = self._full_keys.get(normalize_name(name))
+        if not matches:
+            return None
+
+        for index in matches:
+            if self.kinds[index] == 'geocoded':
+                return self._suggestion(index, 3.0)
+
+        best = max(matches, key=lambda i: self.weights[i])
+        for index in matches:
+            if self.weights[index] < self.weights[best] * AMBIGUOUS_WEIGHT_RATIO:
+                continue
+            distance = calculate_distance(
+                self.latitudes[best], self.longitudes[best], self.latitudes[index], self.longitudes[index]
+            )
+            if distance > GAZETTEER_AMBIGUOUS_METERS:
+                return None
+        return self._suggestion(best, 3.0)
+
+
+def _cluster_localities(members):
+    """Group (lat, lon, weight) points of one locality name into clusters of nearby points"""
+    clusters = []  # [anchor_lat, anchor_lon, points]
+    for point in members:
+        for cluster in clusters:
+            if calculate_distance(cluster[0], cluster[1], point[0], point[1]) <= GAZETTEER_CLUSTER_METERS:
+                cluster[2].append(point)
+                break
+        else:
+            clusters.append([point[0], point[1], [point]])
+    return [points for _, _, points in clusters]
+
+
+def load_entries(import_path=GAZETTEER_IMPORT_PATH):
+    """Gazetteer entries from the stored places (and the import file, if set)"""
+    entries = []
+    localities = {}  # Display name -> member (lat, lon, weight)
+
+    for row in get_storage().all_places():
+        # Popularity: review count (at least 1 so unreviewed places still count)
+        weight = float(max(1, row['user_ratings_total'] or 0))
+        entries.append((row['name'], row['latitude'], row['longitude'], 'place', weight, row['address']))
+        for locality in address_localities(row['address']):
+            localities.setdefault(locality, []).append((row['latitude'], row['longitude'], weight))
+
+    # An area is as popular as the places in it
+    for locality, members in localities.items():
+        for points in _cluster_localities(members):
+            entries.append((
+                locality,
+                sum(p[0] for p in points) / len(points),
+                sum(p[1] for p in points) / len(points),
+                'area', sum(p[2] for p in points), None
+            ))
+
+    if import_path:
+        with open(import_path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                entries.append((
+                    row['name'], float(row['latitude']), float(row['longitude']),
+                    row.get('kind') or 'imported', float(row.get('weight') or 1.0), row.get('address') or None
+                ))
+
+    return entries
+
+
+_gazetteer = None
+_gazetteer_built_at = 0.0
+_gazetteer_lock = threading.Lock()
+# Names learned from Google geocoding, kept across rebuilds: normalized
+# name -> entry, oldest first, at most GAZETTEER_MAX_GEOCODED of them
+_geocoded_entries = OrderedDict()
+
+
+def get_gazetteer():
+    """Shared gazetteer, built on first use and rebuilt every GAZETTEER_REFRESH_SECONDS"""
+    global _gazetteer, _gazetteer_built_at
+    if _gazetteer is None or time.monotonic() - _gazetteer_built_at > GAZETTEER_REFRESH_SECONDS:
+        with _gazetteer_lock:
+            if _gazetteer is None or time.monotonic() - _gazetteer_built_at > GAZETTEER_REFRESH_SECONDS:
+                _gazetteer = Gazetteer.build(load_entries() + list(_geocoded_entries.values()))
+                _gazetteer_built_at = time.monotonic()
+    return _gazetteer
+
+
+def geocode(api_key, location_name):
+    """
+    Geocode a location name, answering from the gazetteer when it can.
+
+    Unknown or ambiguous names go to Google geocoding; successful Google
+    results are remembered so repeated attempts stay local. While the
+    geocoding circuit breaker is open the best partial match is used.
+
+    Returns:
+        geocode_location-style dict plus 'source' ('gazetteer' or 'google'), or None
+    """
+    gazetteer = get_gazetteer()
+    match = gazetteer.resolve(location_name)
+    if match:
+        return {
+            'latitude': match['latitude'],
+            'longitude': match['longitude'],
+            'formatted_address': match['detail'] or match['name'],
+            'source': 'gazetteer'
+        }
+
+    if circuit_open('google_geocode'):
+        # Google is down: the best partial match beats no answer
+        suggestions = gazetteer.search(location_name, 1)
+        if not suggestions:
+            return None
+        best = suggestions[0]
+        return {
+            'latitude': best['latitude'],
+            'longitude': best['longitude'],
+            'formatted_address': best['detail'] or best['name'],
+            'source': 'gazetteer'
+        }
+
+    geocoded = geocode_location(api_key, location_name)
+    if not geocoded:
+        return None
+
+    entry = (location_name, geocoded['latitude'], geocoded['longitude'], 'geocoded', 1.0,
+             geocoded['formatted_address'])
+    name_key = normalize_name(location_name)
+    with _gazetteer_lock:
+        known = name_key in _geocoded_entries
+        _geocoded_entries[name_key] = entry
+        _geocoded_entries.move_to_end(name_key)
+        while len(_geocoded_entries) > GAZETTEER_MAX_GEOCODED:
+            _geocoded_entries.popitem(last=False)
+        if not known:
+            gazetteer.add(*entry[:3], kind='geocoded', weight=1.0, detail=entry[5])
+    return dict(geocoded, source='google')
@@ -1,16 +1,19 @@
 """Google Maps API integration using Places API (New) and Routes API"""
-import requests
 import os
-from config import VIBE_CONFIGS, ALL_DISCOVERABLE_TYPES
+from config import VIBE_CONFIGS, ALL_DISCOVERABLE_TYPES, DIRECTIONS_HEDGE_ENABLED
+from services.upstream import upstream_request, hedged_request
 from utils.geo_utils import calculate_distance
 
 # Get API key from environment
 GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
 
-# API endpoints
-PLACES_NEARBY_URL = "https://places.googleapis.com/v1/places:searchNearby"
-GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
-DIRECTIONS_URL = "https://maps.googleapis.com/maps/api/directions/json"
+# API endpoints (base URLs can point at local stand-ins, see loadtest/fake_upstreams.py)
+PLACES_BASE_URL = os.getenv('GOOGLE_PLACES_BASE_URL', 'https://places.googleapis.com').rstrip('/')
+MAPS_BASE_URL = os.getenv('GOOGLE_MAPS_BASE_URL', 'https://maps.googleapis.com').rstrip('/')
+
+PLACES_NEARBY_URL = f"{PLACES_BASE_URL}/v1/places:searchNearby"
+GEOCODE_URL = f"{MAPS_BASE_URL}/maps/api/geocode/json"
+DIRECTIONS_URL = f"{MAPS_BASE_URL}/maps/api/directions/json"
 
 
 def geocode_location(api_key, location_name):
@@ -22,8 +25,8 @@ def geocode_location(api_key, location_name):
         return None
 
     try:
-        response = requests.get(
-            GEOCODE_URL,
+        response = upstream_request(
+            'google_geocode', 'GET', GEOCODE_URL,
             params={
                 'address': location_name,
                 'key': api_key
@@ -92,8 +95,8 @@ def search_nearby_places(api_key, lat, lon, radius, included_types):
     }
 
     try:
-        response = requests.post(
-            PLACES_NEARBY_URL,
+        response = upstream_request(
+            'google_places', 'POST', PLACES_NEARBY_URL,
             headers=headers,
             json=body,
             timeout=15
@@ -163,6 +166,15 @@ def get_google_places(api_key, lat, lon, vibe, radius):
     return result_places[:20]
 
 
+# Places API (New) accepts at most 50 included types per request
+DISCOVERY_BATCH_SIZE = 50
+
+
+def discovery_request_count():
+    """Number of Places API requests one discover_all_places call makes"""
+    return -(-len(ALL_DISCOVERABLE_TYPES) // DISCOVERY_BATCH_SIZE)
+
+
 def discover_all_places(api_key, lat, lon, radius):
     """
     Fetch ALL place types in the area using Places API (New).
@@ -175,8 +187,8 @@ def discover_all_places(api_key, lat, lon, radius):
     seen_ids = set()
     all_places = []
 
-    # Batch types into groups to reduce API calls (max 50 types per request)
-    batch_size = 50
+    # Batch types into groups to reduce API calls
+    batch_size = DISCOVERY_BATCH_SIZE
     type_batches = [ALL_DISCOVERABLE_TYPES[i:i+batch_size] for i in range(0, len(ALL_DISCOVERABLE_TYPES), batch_size)]
 
     for type_batch in type_batches:
@@ -227,7 +239,8 @@ def get_google_directions(api_key, waypoints):
         params['waypoints'] = waypoints_str
 
     try:
-        response = requests.get(DIRECTIONS_URL, params=params, timeout=15)
+        request = hedged_request if DIRECTIONS_HEDGE_ENABLED else upstream_request
+        response = request('google_directions', 'GET', DIRECTIONS_URL, params=params, timeout=15)
         data = response.json()
 
         if data.get('status') != 'OK':
@@ -318,3 +331,26 @@ def decode_polyline(encoded):
         decoded.append([lng / 1e5, lat / 1e5])
 
     return decoded
+
+
+def encode_polyline(coordinates):
+    """Encode a list of [lng, lat] coordinates as a Google encoded polyline string."""
+    encoded = []
+    prev_lat = 0
+    prev_lng = 0
+
+    for lng, lat in coordinates:
+        lat_e5 = int(round(lat * 1e5))
+        lng_e5 = int(round(lng * 1e5))
+
+        for delta in (lat_e5 - prev_lat, lng_e5 - prev_lng):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                encoded.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            encoded.append(chr(value + 63))
+
+        prev_lat = lat_e5
+        prev_lng = lng_e5
+
+    return ''.join(encoded)
@@ -0,0 +1,273 @@
+"""
+Maintenance for places.db.
+
+Merges indexed_areas rows whose circle lies inside a fresher one, prunes
+place_vibes, place_tile_top and place_aliases rows left behind by deleted places,
+applies PLACE_TYPE_TO_VIBES changes (see services/recategorize.py),
+refreshes planner statistics, checkpoints the WAL and frees unused pages.
+If a memory-mapped place snapshot exists (or --snapshot is given) it is
+re-exported, so the changes read from SQLite on top of it stay few.
+Every step is a short transaction of its own (WAL readers are never
+blocked), so it is safe to run while the app is serving.
+
+Run from the backend directory:
+    python -m services.maintenance
+    python -m services.maintenance --full-vacuum   # once, to enable incremental vacuum
+    python -m services.maintenance --snapshot      # also export the place snapshot
+
+Set DB_MAINTENANCE_INTERVAL_SECONDS to also run it periodically inside the
+app (see create_app). With several worker processes only the one holding
+a lock file next to places.db runs it.
+"""
+import argparse
+import os
+import statistics
+import threading
+import time
+
+from config import VALID_VIBES, DB_MAINTENANCE_INTERVAL_SECONDS
+from models import database, place_snapshot
+from models.database import get_db
+from models.write_queue import write_queue
+from services import place_service
+from services.recategorize import recategorize
+from utils.geo_utils import calculate_distance
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, every process runs maintenance
+    fcntl = None
+
+# Indexed area centers sampled for the before/after query timings
+LATENCY_SAMPLE_AREAS = 8
+
+
+def database_stats():
+    """File sizes, page counts and row counts of the places database"""
+    wal_path = database.DB_PATH + '-wal'
+    stats = {
+        'file_bytes': os.path.getsize(database.DB_PATH),
+        'wal_bytes': os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+    }
+    with get_db() as conn:
+        stats['page_count'] = conn.execute('PRAGMA page_count').fetchone()[0]
+        stats['freelist_count'] = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        for table in ('places', 'place_vibes', 'place_tile_top', 'place_aliases', 'indexed_areas'):
+            stats[f'{table}_rows'] = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+    return stats
+
+
+def query_latencies(runs=5):
+    """Median milliseconds of the hot place queries at a sample of indexed area centers"""
+    with get_db() as conn:
+        areas = conn.execute(
+            'SELECT center_lat, center_lon, radius FROM indexed_areas ORDER BY id LIMIT ?', (LATENCY_SAMPLE_AREAS,)
+        ).fetchall()
+    if not areas:
+        return {}
+
+    def median_ms(fn):
+        timings = []
+        for _ in range(runs):
+            for area in areas:
+                started = time.perf_counter()
+                fn(area['center_lat'], area['center_lon'], area['radius'])
+                timings.append((time.perf_counter() - started) * 1000)
+        return round(statistics.median(timings), 3)
+
+    latencies = {'find_indexed_area_ms': median_ms(place_service.find_indexed_area)}
+    for vibe in VALID_VIBES:
+        latencies[f'places_by_vibe_{vibe}_ms'] = median_ms(
+            lambda lat, lon, radius: place_service.get_place_table_by_vibe(lat, lon, radius, vibe)
+        )
+    return latencies
+
+
+def merge_indexed_areas(conn):
+    """
+    Delete indexed areas lying wholly inside another area indexed at the same time or later.
+
+    Whatever such an area covered is covered by the containing one, and its
+    freshness is no better, so lookups and refresh scheduling are unchanged.
+
+    Returns:
+        Number of rows deleted
+    """
+    areas = [dict(row) for row in conn.execute(
+        'SELECT id, center_lat, center_lon, radius, indexed_at FROM indexed_areas ORDER BY radius DESC, indexed_at DESC'
+    )]
+    kept = []
+    redundant = []
+    for area in areas:
+        for outer in kept:
+            if outer['indexed_at'] < area['indexed_at']:
+                continue
+            distance = calculate_distance(area['center_lat'], area['center_lon'], outer['center_lat'], outer['center_lon'])
+            if distance + area['radius'] <= outer['radius']:
+                redundant.append((area['id'],))
+                break
+        else:
+            kept.append(area)
+
+    conn.executemany('DELETE FROM indexed_areas WHERE id = ?', redundant)
+    return len(redundant)
+
+
+def prune_orphans(conn):
+    """Delete place_vibes, place_tile_top and place_aliases rows whose place no longer exists"""
+    pruned = {}
+    for table in ('place_vibes', 'place_tile_top'):
+        pruned[table] = conn.execute(
+            f'DELETE FROM {table} WHERE place_id NOT IN (SELECT place_id FROM places)'
+        ).rowcount
+    pruned['place_aliases'] = conn.execute(
+        'DELETE FROM place_aliases WHERE canonical_id NOT IN (SELECT place_id FROM places)'
+    ).rowcount
+    return pruned
+
+
+def run_maintenance(full_vacuum=False, vacuum_pages=0, measure=True, snapshot=False):
+    """
+    Run every maintenance step and report what changed.
+
+    Args:
+        full_vacuum: Rebuild the file with VACUUM (switching it to incremental
+            auto-vacuum if needed). Blocks writers while it runs.
+        vacuum_pages: Free pages to release with incremental vacuum (0 = all)
+        measure: Time the hot queries before and after
+        snapshot: Export the place snapshot even if there isn't one yet
+
+    Returns:
+        Dict with 'before' and 'after' stats (and latencies) plus per-step results
+    """
+    report = {'before': database_stats()}
+    if measure:
+        report['before'].update(query_latencies())
+
+    # Row changes go through the writer like every other write
+    steps = {
+        'areas_merged': write_queue.submit(merge_indexed_areas).result(),
+        'orphans_pruned': write_queue.submit(prune_orphans).result(),
+    }
+    # The snapshot is re-exported below anyway
+    recategorized = recategorize(snapshot=False)
+    steps['recategorized'] = recategorized['updated']
+    if recategorized['unmapped']:
+        # Kept their vibes; `python -m services.recategorize --llm` categorizes them
+        steps['unmapped_types'] = recategorized['unmapped']
+    with get_db() as conn:
+        conn.execute('ANALYZE')
+        conn.execute('PRAGMA optimize')
+
+    # Statements below can't run inside a transaction
+    conn = database.get_connection()
+    conn.isolation_level = None
+    try:
+        auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        if full_vacuum:
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+            steps['vacuum'] = 'full'
+        elif auto_vacuum == 2:
+            conn.execute(f'PRAGMA incremental_vacuum({int(vacuum_pages)})' if vacuum_pages else 'PRAGMA incremental_vacuum')
+            steps['vacuum'] = 'incremental'
+        else:
+            steps['vacuum'] = 'skipped (run once with --full-vacuum to enable incremental vacuum)'
+
+        busy, log_pages, checkpointed = conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+        steps['wal_checkpoint'] = {'busy': bool(busy), 'log_pages': log_pages, 'checkpointed_pages': checkpointed}
+    finally:
+        conn.close()
+
+    if snapshot or os.path.exists(place_snapshot.snapshot_path()):
+        exported = place_snapshot.export_snapshot()
+        steps['snapshot'] = {'places': exported['places'], 'bytes': exported['bytes']}
+
+    report['steps'] = steps
+    report['after'] = database_stats()
+    if measure:
+        report['after'].update(query_latencies())
+    return report
+
+
+def print_report(report):
+    print("Steps:")
+    for name, value in report['steps'].items():
+        print(f"  {name:<20} {value}")
+    print(f"\n  {'':<32} {'before':>12} {'after':>12}")
+    for key, before in report['before'].items():
+        print(f"  {key:<32} {before:>12} {report['after'].get(key, ''):>12}")
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+_leader_file = None
+
+
+def _is_leader():
+    """
+    Whether this process runs the scheduled maintenance.
+
+    The first process to take an exclusive lock on places.db's lock file
+    keeps it until it exits, so pre-forked workers don't all run
+    maintenance; when it exits another worker takes over.
+    """
+    global _leader_file
+    if fcntl is None:
+        return True
+    if _leader_file is not None:
+        return True
+    lock_file = open(database.DB_PATH + '.maintenance.lock', 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _leader_file = lock_file
+    return True
+
+
+def start_maintenance_scheduler(interval=DB_MAINTENANCE_INTERVAL_SECONDS):
+    """
+    Run maintenance every `interval` seconds in a daemon thread (no-op if interval is 0).
+
+    Every process starts the thread, but only the one holding the lock
+    file (see _is_leader) does the work.
+    """
+    global _scheduler
+    if interval <= 0:
+        return
+    with _scheduler_lock:
+        if _scheduler is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    if not _is_leader():
+                        continue
+                    report = run_maintenance(measure=False)
+                    print(f"Database maintenance: {report['steps']}")
+                except Exception as e:
+                    print(f"Error running database maintenance: {e}")
+
+        _scheduler = threading.Thread(target=loop, name='db-maintenance', daemon=True)
+        _scheduler.start()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--full-vacuum', action='store_true',
+                        help='Rebuild the file with VACUUM and enable incremental vacuum (blocks writers meanwhile)')
+    parser.add_argument('--vacuum-pages', type=int, default=0, help='Free pages to release (default: all)')
+    parser.add_argument('--no-measure', action='store_true', help='Skip the before/after query timings')
+    parser.add_argument('--snapshot', action='store_true', help='Export the memory-mapped place snapshot')
+    args = parser.parse_args(argv)
+
+    print(f"Maintaining {database.DB_PATH}\n")
+    print_report(run_maintenance(args.full_vacuum, args.vacuum_pages, not args.no_measure, args.snapshot))
+
+
+if __name__ == '__main__':
+    main()
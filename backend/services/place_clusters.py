@@ -0,0 +1,200 @@
+"""
+Viewport clustering for the /api/places browse layer.
+
+Places are bucketed into a Web Mercator grid of CLUSTER_CELL_PIXELS cells at
+each map zoom. Every occupied cell becomes one cluster: a count, the mean
+position and the best-rated place in it. A response therefore has at most
+one cluster per cell of the viewport, whatever the zoom and however many
+places it covers.
+
+Grids are built per (vibe, zoom) on first use and kept (least recently used
+first out, CLUSTER_CACHE_MAX_GRIDS). The whole index is rebuilt from place
+storage every CLUSTER_REFRESH_SECONDS, in the background so no request
+waits for it (only the very first build does).
+"""
+import math
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from config import (
+    VALID_VIBES, CLUSTER_CELL_PIXELS, CLUSTER_MAX_ZOOM, CLUSTER_CACHE_MAX_GRIDS, CLUSTER_REFRESH_SECONDS
+)
+from models.storage import get_storage
+
+TILE_PIXELS = 256
+# Web Mercator stops here; places nearer the poles are clamped to it
+MAX_LATITUDE = 85.05112878
+
+
+def mercator(lat, lon):
+    """Position on the world map as fractions (0-1) from the top left corner"""
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = (lon + 180.0) / 360.0
+    sin_lat = math.sin(math.radians(lat))
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return min(max(x, 0.0), 1.0 - 1e-12), min(max(y, 0.0), 1.0 - 1e-12)
+
+
+def cells_per_side(zoom):
+    """Grid cells across the world map at a zoom level"""
+    return max(1, (TILE_PIXELS << zoom) // CLUSTER_CELL_PIXELS)
+
+
+def _compact_place(place):
+    return {
+        'place_id': place['place_id'],
+        'name': place['name'],
+        'latitude': place['latitude'],
+        'longitude': place['longitude'],
+        'rating': place['rating'],
+        'google_type': place['google_type'],
+    }
+
+
+class PlaceClusterIndex:
+    """Places per vibe in Mercator coordinates, with cached per-zoom cluster grids"""
+
+    def __init__(self, places):
+        # Best rated first, so the first place seen in a cell is its top place
+        places = sorted(places, key=lambda p: -(p.get('rating') or 0))
+        self.places = [_compact_place(p) for p in places]
+        self._points = {vibe: (array('d'), array('d'), array('I')) for vibe in VALID_VIBES}  # xs, ys, place indices
+        for i, place in enumerate(places):
+            x, y = mercator(place['latitude'], place['longitude'])
+            for vibe in place['vibes']:
+                xs, ys, indices = self._points[vibe]
+                xs.append(x)
+                ys.append(y)
+                indices.append(i)
+        self._grids = OrderedDict()  # (vibe, zoom) -> {(cell_x, cell_y): [count, sum_lat, sum_lon, top index]}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.places)
+
+    def _build_grid(self, vibe, zoom):
+        side = cells_per_side(zoom)
+        xs, ys, indices = self._points[vibe]
+        places = self.places
+        grid = {}
+        for x, y, index in zip(xs, ys, indices):
+            cell = (int(x * side), int(y * side))
+            place = places[index]
+            entry = grid.get(cell)
+            if entry is None:
+                grid[cell] = [1, place['latitude'], place['longitude'], index]
+            else:
+                entry[0] += 1
+                entry[1] += place['latitude']
+                entry[2] += place['longitude']
+        return grid
+
+    def grid(self, vibe, zoom):
+        """Cluster grid for a vibe at a zoom level, built on first use"""
+        key = (vibe, zoom)
+        with self._lock:
+            grid = self._grids.get(key)
+            if grid is not None:
+                self._grids.move_to_end(key)
+                return grid
+        grid = self._build_grid(vibe, zoom)
+        with self._lock:
+            self._grids[key] = grid
+            while len(self._grids) > CLUSTER_CACHE_MAX_GRIDS:
+                self._grids.popitem(last=False)
+        return grid
+
+    def clusters(self, vibe, zoom, min_lat, min_lon, max_lat, max_lon, limit=None):
+        """
+        Clusters of the vibe's places inside a bounding box at a zoom level.
+
+        A box with min_lon > max_lon crosses the antimeridian.
+
+        Returns:
+            (clusters, truncated): cluster dicts with latitude, longitude,
+            count and top_place, largest first when cut to limit
+        """
+        zoom = max(0, min(int(zoom), CLUSTER_MAX_ZOOM))
+        grid = self.grid(vibe, zoom)
+        side = cells_per_side(zoom)
+
+        west, north = mercator(max_lat, min_lon)
+        east, south = mercator(min_lat, max_lon)
+        y_range = (int(north * side), int(south * side))
+        if min_lon <= max_lon:
+            x_ranges = [(int(west * side), int(east * side))]
+        else:
+            x_ranges = [(int(west * side), side - 1), (0, int(east * side))]
+
+        entries = []
+        for x_lo, x_hi in x_ranges:
+            # Walk whichever is smaller: the cells in the box or the occupied cells
+            if (x_hi - x_lo + 1) * (y_range[1] - y_range[0] + 1) <= len(grid):
+                for cell_x in range(x_lo, x_hi + 1):
+                    for cell_y in range(y_range[0], y_range[1] + 1):
+                        entry = grid.get((cell_x, cell_y))
+                        if entry is not None:
+                            entries.append(entry)
+            else:
+                entries.extend(
+                    entry for (cell_x, cell_y), entry in grid.items()
+                    if x_lo <= cell_x <= x_hi and y_range[0] <= cell_y <= y_range[1]
+                )
+
+        truncated = limit is not None and len(entries) > limit
+        if truncated:
+            entries.sort(key=lambda entry: -entry[0])
+            entries = entries[:limit]
+
+        return [
+            {
+                'latitude': round(sum_lat / count, 6),
+                'longitude': round(sum_lon / count, 6),
+                'count': count,
+                'top_place': self.places[top],
+            }
+            for count, sum_lat, sum_lon, top in entries
+        ], truncated
+
+
+_index = None
+_index_built_at = 0.0
+_index_lock = threading.Lock()
+_rebuilding = False
+
+
+def _build():
+    global _index, _index_built_at
+    _index = PlaceClusterIndex(get_storage().all_places())
+    _index_built_at = time.monotonic()
+
+
+def _rebuild_in_background():
+    global _rebuilding
+    try:
+        _build()
+    except Exception as e:
+        print(f"Cluster index rebuild failed: {e}")
+    finally:
+        _rebuilding = False
+
+
+def get_cluster_index():
+    """
+    Shared cluster index, built on first use. Once older than
+    CLUSTER_REFRESH_SECONDS it is rebuilt in a background thread while
+    requests keep using the old one.
+    """
+    global _rebuilding
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _build()
+    elif time.monotonic() - _index_built_at > CLUSTER_REFRESH_SECONDS and not _rebuilding:
+        with _index_lock:
+            if not _rebuilding:
+                _rebuilding = True
+                threading.Thread(target=_rebuild_in_background, name='cluster-index', daemon=True).start()
+    return _index
@@ -0,0 +1,151 @@
+"""
+Ingest-time deduplication of discovered places.
+
+Discovery often returns one venue under several place_ids, or several
+storefronts of a chain a few meters apart. A new place is a duplicate when a
+place within DEDUP_RADIUS_METERS has a similar name and a compatible type
+(see same_venue), so "Hyde Park Cafe" isn't folded into Hyde Park.
+Candidates come from a spatial hash of the batch itself and from place
+storage. Duplicates are not stored or categorized. Each is recorded as an
+alias of the place it duplicates, so radius queries return one entry per
+physical place and the alias id still resolves.
+"""
+import difflib
+from typing import Dict, List, Optional, Tuple
+
+from config import DEDUP_ENABLED, DEDUP_RADIUS_METERS, DEDUP_NAME_SIMILARITY, PLACE_TYPE_TO_VIBES
+from models.storage import get_storage
+from services.gazetteer import normalize_name
+from utils.geo_utils import calculate_distance, bounding_box, tile_for
+from utils.metrics import DUPLICATE_PLACES
+
+# A name that is the start of the other (e.g. "Starbucks" and "Starbucks
+# Coffee") matches if it has at least this many characters or two words,
+# and the rest of the longer name only says what kind of venue it is
+MIN_PREFIX_NAME_LENGTH = 6
+GENERIC_NAME_WORDS = frozenset({
+    'bar', 'bakery', 'bistro', 'cafe', 'coffee', 'company', 'co', 'espresso', 'grill', 'house',
+    'inn', 'kitchen', 'limited', 'ltd', 'pub', 'restaurant', 'roasters', 'tavern',
+})
+
+
+def similar_names(a: str, b: str, allow_prefix: bool = True) -> bool:
+    """Whether two place names plausibly name the same venue"""
+    a, b = normalize_name(a or ''), normalize_name(b or '')
+    if not a or not b:
+        return False
+    if a == b:
+        return True
+    shorter, longer = sorted((a.split(), b.split()), key=len)
+    if (allow_prefix and longer[:len(shorter)] == shorter
+            and (len(shorter) >= 2 or len(shorter[0]) >= MIN_PREFIX_NAME_LENGTH)
+            and all(word in GENERIC_NAME_WORDS for word in longer[len(shorter):])):
+        return True
+    return difflib.SequenceMatcher(None, a, b).ratio() >= DEDUP_NAME_SIMILARITY
+
+
+def _known_type(google_type: Optional[str]) -> bool:
+    return bool(google_type) and google_type != 'unknown'
+
+
+def same_venue(place: dict, other: dict) -> bool:
+    """
+    Whether two nearby places are one venue.
+
+    Places of the same type (or with no type to compare) need similar
+    names. Places of different types need overlapping static vibes (e.g.
+    'museum' and 'tourist_attraction') and names that are near-identical
+    as a whole, since a cafe named after the park it is in shares its
+    name's prefix.
+    """
+    type_a, type_b = place.get('google_type'), other.get('google_type')
+    if type_a == type_b or not _known_type(type_a) or not _known_type(type_b):
+        return similar_names(place['name'], other['name'])
+    shared_vibes = set(PLACE_TYPE_TO_VIBES.get(type_a, ())) & set(PLACE_TYPE_TO_VIBES.get(type_b, ()))
+    return bool(shared_vibes) and similar_names(place['name'], other['name'], allow_prefix=False)
+
+
+class SpatialHash:
+    """Places bucketed into square cells about `radius` meters tall, for near-neighbour lookups"""
+
+    def __init__(self, radius: float):
+        self.radius = radius
+        self.cell_degrees = radius / 111320
+        self._cells = {}
+
+    def add(self, place: dict) -> None:
+        cell = tile_for(place['latitude'], place['longitude'], self.cell_degrees)
+        self._cells.setdefault(cell, []).append(place)
+
+    def near(self, lat: float, lon: float) -> List[Tuple[float, dict]]:
+        """(distance, place) for added places within the radius, nearest first"""
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, self.radius)
+        lat_lo, lon_lo = tile_for(min_lat, min_lon, self.cell_degrees)
+        lat_hi, lon_hi = tile_for(max_lat, max_lon, self.cell_degrees)
+        hits = []
+        for tile_lat in range(lat_lo, lat_hi + 1):
+            for tile_lon in range(lon_lo, lon_hi + 1):
+                for place in self._cells.get((tile_lat, tile_lon), ()):
+                    distance = calculate_distance(lat, lon, place['latitude'], place['longitude'])
+                    if distance <= self.radius:
+                        hits.append((distance, place))
+        hits.sort(key=lambda hit: hit[0])
+        return hits
+
+
+def _find_duplicate(place: dict, batch: SpatialHash, storage) -> Tuple[Optional[str], str]:
+    """(canonical place_id, where it was found) for a new place, or (None, '')"""
+    for _, other in batch.near(place['latitude'], place['longitude']):
+        if same_venue(place, other):
+            return other['place_id'], 'batch'
+    for other in storage.places_near(place['latitude'], place['longitude'], DEDUP_RADIUS_METERS):
+        if same_venue(place, other):
+            return other['place_id'], 'stored'
+    return None, ''
+
+
+def dedupe_places(places: List[dict]) -> Tuple[List[dict], Dict[str, str]]:
+    """
+    Split discovered places into the ones to store and the duplicates.
+
+    Places already stored are always kept (they are their own canonical
+    place). Among new duplicates, the one with the most ratings is kept.
+
+    Returns:
+        (places to store in their original order, {alias place_id: canonical place_id})
+        for the new duplicates; known aliases are dropped from the first
+        and left out of the second
+    """
+    if not DEDUP_ENABLED or not places:
+        return places, {}
+
+    storage = get_storage()
+    place_ids = [place['place_id'] for place in places]
+    known_aliases = storage.get_aliases(place_ids)
+    stored = storage.get_places(place_ids)
+
+    batch = SpatialHash(DEDUP_RADIUS_METERS)
+    for place in places:
+        if place['place_id'] in stored:
+            batch.add(place)
+
+    new_places = [p for p in places if p['place_id'] not in stored and p['place_id'] not in known_aliases]
+    new_places.sort(key=lambda place: -(place.get('user_ratings_total') or 0))
+
+    aliases = {}
+    seen = set()
+    for place in new_places:
+        # Discovery can list the same place_id twice
+        if place['place_id'] in seen:
+            continue
+        seen.add(place['place_id'])
+        canonical_id, match = _find_duplicate(place, batch, storage)
+        if canonical_id is None:
+            batch.add(place)
+        else:
+            aliases[place['place_id']] = canonical_id
+            DUPLICATE_PLACES.inc(match=match)
+    if known_aliases:
+        DUPLICATE_PLACES.inc(len(known_aliases), match='alias')
+
+    return [p for p in places if p['place_id'] not in aliases and p['place_id'] not in known_aliases], aliases
@@ -1,92 +1,50 @@
 """Place service for managing place storage, retrieval, and categorization"""
-from typing import List, Tuple, Optional, Dict, Any
-from models.database import get_db
-from models.place import Place
-from config import PLACE_TYPE_TO_VIBES
+from concurrent.futures import Future
+from typing import List, Tuple, Optional
+from models.place import VIBE_BITS
+from models.place_table import PlaceTable
+from models.storage import get_storage
+from config import (
+    PLACE_TYPE_TO_VIBES, ROUTE_PLACE_LIMIT, AREA_REFRESH_TTL_SECONDS, INDEX_MIN_SECONDS
+)
 from services.ai_service import categorize_place_with_llm
+from services.google_maps_service import discover_all_places, get_google_places, discovery_request_count
+from services.place_dedup import dedupe_places
+from services.refresh_queue import area_refresh_queue
+from services.upstream import circuit_open
 from utils.geo_utils import calculate_distance
+from utils.deadline import expired, has_budget
+from utils.metrics import stage
 
 
 def save_place(place_data: dict, vibes: List[str], source: str = 'static') -> None:
     """
-    Insert or update a place and its vibe associations.
+    Insert or update a place and its vibes.
 
     Args:
         place_data: Dictionary with place information
         vibes: List of vibe strings the place belongs to
         source: 'static' or 'llm' indicating how vibes were determined
     """
-    with get_db() as conn:
-        cursor = conn.cursor()
-
-        # Insert or replace place
-        cursor.execute('''
-            INSERT OR REPLACE INTO places
-            (place_id, name, latitude, longitude, google_type, address, rating, user_ratings_total, categorization_source, last_updated)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-        ''', (
-            place_data['place_id'],
-            place_data['name'],
-            place_data['latitude'],
-            place_data['longitude'],
-            place_data.get('google_type'),
-            place_data.get('address'),
-            place_data.get('rating'),
-            place_data.get('user_ratings_total'),
-            source
-        ))
-
-        # Delete existing vibe associations
-        cursor.execute('DELETE FROM place_vibes WHERE place_id = ?', (place_data['place_id'],))
-
-        # Insert new vibe associations
-        for vibe in vibes:
-            cursor.execute(
-                'INSERT OR IGNORE INTO place_vibes (place_id, vibe) VALUES (?, ?)',
-                (place_data['place_id'], vibe)
-            )
+    save_places_bulk([(place_data, vibes, source)])
 
 
-def save_places_bulk(places_with_vibes: List[Tuple[dict, List[str], str]]) -> None:
+def save_places_bulk(places_with_vibes: List[Tuple[dict, List[str], str]], wait: bool = True) -> Future:
     """
     Batch insert multiple places with their vibes.
 
     Args:
         places_with_vibes: List of tuples (place_data, vibes, source)
+        wait: Block until the places are stored (needed to read them back)
+
+    Returns:
+        Future of the write
     """
-    with get_db() as conn:
-        cursor = conn.cursor()
-
-        for place_data, vibes, source in places_with_vibes:
-            # Insert or replace place
-            cursor.execute('''
-                INSERT OR REPLACE INTO places
-                (place_id, name, latitude, longitude, google_type, address, rating, user_ratings_total, categorization_source, last_updated)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-            ''', (
-                place_data['place_id'],
-                place_data['name'],
-                place_data['latitude'],
-                place_data['longitude'],
-                place_data.get('google_type'),
-                place_data.get('address'),
-                place_data.get('rating'),
-                place_data.get('user_ratings_total'),
-                source
-            ))
-
-            # Delete existing vibe associations
-            cursor.execute('DELETE FROM place_vibes WHERE place_id = ?', (place_data['place_id'],))
-
-            # Insert new vibe associations
-            for vibe in vibes:
-                cursor.execute(
-                    'INSERT OR IGNORE INTO place_vibes (place_id, vibe) VALUES (?, ?)',
-                    (place_data['place_id'], vibe)
-                )
-
-
-def get_places_by_vibe(lat: float, lon: float, radius: float, vibe: str) -> List[dict]:
+    return get_storage().upsert_places(places_with_vibes, wait)
+
+
+def get_places_by_vibe(lat: float, lon: float, radius: float, vibe: str,
+                       limit: Optional[int] = None) -> List[dict]:
     """
     Query places that belong to a specific vibe within a radius.
 
@@ -95,65 +53,55 @@ def get_places_by_vibe(lat: float, lon: float, radius: float, vibe: str) -> List
         lon: Center longitude
         radius: Search radius in meters
         vibe: Vibe to filter by
+        limit: Return only the this many top-rated places
 
     Returns:
         List of place dictionaries with distance calculated
     """
-    with get_db() as conn:
-        cursor = conn.cursor()
-
-        # Get all places that have the requested vibe
-        cursor.execute('''
-            SELECT DISTINCT p.place_id, p.name, p.latitude, p.longitude, p.google_type,
-                   p.address, p.rating, p.user_ratings_total, p.categorization_source
-            FROM places p
-            JOIN place_vibes pv ON p.place_id = pv.place_id
-            WHERE pv.vibe = ?
-        ''', (vibe,))
-
-        rows = cursor.fetchall()
-        places = []
-
-        for row in rows:
-            # Calculate distance
-            distance = calculate_distance(lat, lon, row['latitude'], row['longitude'])
-
-            # Filter by radius
-            if distance <= radius:
-                # Get all vibes for this place
-                cursor.execute(
-                    'SELECT vibe FROM place_vibes WHERE place_id = ?',
-                    (row['place_id'],)
-                )
-                vibes = [v['vibe'] for v in cursor.fetchall()]
-
-                places.append({
-                    'place_id': row['place_id'],
-                    'name': row['name'],
-                    'latitude': row['latitude'],
-                    'longitude': row['longitude'],
-                    'type': row['google_type'],
-                    'google_type': row['google_type'],
-                    'address': row['address'],
-                    'rating': row['rating'] or 0,
-                    'user_ratings_total': row['user_ratings_total'] or 0,
-                    'categorization_source': row['categorization_source'],
-                    'vibes': vibes,
-                    'distance': distance
-                })
-
-        # Sort by rating (all vibe members are equal, so just use rating)
-        places.sort(key=lambda x: x['rating'], reverse=True)
+    return get_place_table_by_vibe(lat, lon, radius, vibe, limit).to_dicts()
 
-        return places
+
+def get_place_table_by_vibe(lat: float, lon: float, radius: float, vibe: str,
+                            limit: Optional[int] = None) -> PlaceTable:
+    """
+    Same query as get_places_by_vibe, returned as a columnar PlaceTable.
+
+    Returns:
+        PlaceTable sorted by rating (highest first) with distances filled in
+    """
+    bit = VIBE_BITS.get(vibe)
+    if not bit:
+        return PlaceTable()
+    return get_storage().places_by_vibe(lat, lon, radius, bit, limit)
+
+
+def filter_place_table(table: PlaceTable, lat: float, lon: float, radius: float,
+                       limit: Optional[int] = None) -> PlaceTable:
+    """
+    Narrow a PlaceTable to the places within radius of (lat, lon).
+
+    Keeps the table's order and replaces distances with distances from (lat, lon),
+    so one wide query can be shared by several nearby starting points.
+    With a limit, stops after that many places.
+    """
+    result = PlaceTable()
+    for i in range(len(table)):
+        if limit is not None and len(result) >= limit:
+            break
+        distance = calculate_distance(lat, lon, table.latitudes[i], table.longitudes[i])
+        if distance <= radius:
+            result.append(
+                table.place_ids[i], table.names[i], table.latitudes[i], table.longitudes[i],
+                table.google_types[i], table.addresses[i], table.ratings[i], table.ratings_totals[i],
+                table.sources[i], table.vibe_masks[i], distance
+            )
+    return result
 
 
 def get_vibes_for_place(place_id: str) -> List[str]:
     """Get all vibes associated with a place."""
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT vibe FROM place_vibes WHERE place_id = ?', (place_id,))
-        return [row['vibe'] for row in cursor.fetchall()]
+    place = get_storage().get_place(place_id)
+    return place['vibes'] if place else []
 
 
 def categorize_place(place: dict, openrouter_api_key: str = None) -> Tuple[List[str], str]:
@@ -190,12 +138,13 @@ def categorize_place(place: dict, openrouter_api_key: str = None) -> Tuple[List[
     return [], 'static'
 
 
-def is_area_indexed(lat: float, lon: float, radius: float, tolerance: float = 0.5) -> bool:
+def find_indexed_area(lat: float, lon: float, radius: float, tolerance: float = 0.5) -> Optional[dict]:
     """
-    Check if an area has already been indexed.
+    Find the freshest indexed area covering the requested one.
 
-    Uses a tolerance factor to determine overlap. If an existing indexed area
-    covers most of the requested area, returns True.
+    Uses a tolerance factor to determine overlap: an existing area covers the
+    request if the request's center is inside it and its radius is at least
+    radius * tolerance.
 
     Args:
         lat: Center latitude
@@ -204,65 +153,219 @@ def is_area_indexed(lat: float, lon: float, radius: float, tolerance: float = 0.
         tolerance: Fraction of radius that must overlap (0.5 = 50%)
 
     Returns:
-        True if area is sufficiently indexed
+        Dict with the area's id, center_lat, center_lon, radius and
+        age_seconds, or None if the area isn't indexed
     """
-    with get_db() as conn:
-        cursor = conn.cursor()
+    best = None
+    for area in get_storage().indexed_areas():
+        # Calculate distance between centers
+        center_distance = calculate_distance(lat, lon, area['center_lat'], area['center_lon'])
 
-        # Get all indexed areas
-        cursor.execute('SELECT center_lat, center_lon, radius FROM indexed_areas')
-        areas = cursor.fetchall()
+        # If the new area's center is within the old area's radius,
+        # and the old area's radius is >= the new radius * tolerance,
+        # it covers the request
+        if center_distance <= area['radius'] and area['radius'] >= radius * tolerance:
+            if best is None or area['age_seconds'] < best['age_seconds']:
+                best = area
 
-        for area in areas:
-            # Calculate distance between centers
-            center_distance = calculate_distance(lat, lon, area['center_lat'], area['center_lon'])
+    return best
 
-            # If the new area's center is within the old area's radius,
-            # and the old area's radius is >= the new radius * tolerance,
-            # consider it indexed
-            if center_distance <= area['radius'] and area['radius'] >= radius * tolerance:
-                return True
 
-        return False
+def is_area_indexed(lat: float, lon: float, radius: float, tolerance: float = 0.5) -> bool:
+    """
+    Check if an area has already been indexed.
+
+    Returns:
+        True if area is sufficiently indexed (see find_indexed_area)
+    """
+    return find_indexed_area(lat, lon, radius, tolerance) is not None
 
 
-def mark_area_indexed(lat: float, lon: float, radius: float) -> None:
+def mark_area_indexed(lat: float, lon: float, radius: float, wait: bool = True) -> Future:
     """Mark an area as indexed."""
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            'INSERT INTO indexed_areas (center_lat, center_lon, radius) VALUES (?, ?, ?)',
-            (lat, lon, radius)
+    return get_storage().mark_area_indexed(lat, lon, radius, wait)
+
+
+def index_area(google_api_key: str, openrouter_api_key: Optional[str],
+               lat: float, lon: float, radius: float) -> None:
+    """Discover, categorize and store every place in an area, then mark it indexed."""
+    # Discover all places in area
+    with stage('discovery'):
+        raw_places = discover_all_places(google_api_key, lat, lon, radius)
+
+    # Drop duplicates of places already stored or found earlier in this batch
+    with stage('dedup'):
+        raw_places, aliases = dedupe_places(raw_places)
+
+    # Categorize each place (static mapping or LLM for unknown types)
+    with stage('categorization'):
+        places_to_save = []
+        for place in raw_places:
+            vibes, source = categorize_place(place, openrouter_api_key)
+            places_to_save.append((place, vibes, source))
+
+    with stage('db-write'):
+        # Bulk save to database (waited on: the request reads these places next)
+        if places_to_save:
+            save_places_bulk(places_to_save)
+        if aliases:
+            get_storage().add_aliases(aliases, wait=False)
+
+        # Mark area as indexed, unless the deadline or an open breaker cut discovery short
+        if not expired() and not circuit_open('google_places'):
+            mark_area_indexed(lat, lon, radius)
+
+
+def ensure_area_indexed(google_api_key: str, openrouter_api_key: Optional[str],
+                        lat: float, lon: float, radius: float) -> bool:
+    """
+    Index an area if it isn't yet; if it is but is older than
+    AREA_REFRESH_TTL_SECONDS, keep it and queue a background refresh.
+
+    A new area that can't be indexed within the request's remaining budget
+    (INDEX_MIN_SECONDS), or while the Places circuit breaker is open, is
+    indexed in the background instead, and the request makes do with the
+    places already stored.
+
+    Returns:
+        False if indexing was deferred (the stored places may be sparse), else True
+    """
+    with stage('index-check'):
+        area = find_indexed_area(lat, lon, radius)
+    if area is None:
+        if has_budget(INDEX_MIN_SECONDS) and not circuit_open('google_places'):
+            index_area(google_api_key, openrouter_api_key, lat, lon, radius)
+        else:
+            area_refresh_queue.schedule(
+                ('index', lat, lon, radius), discovery_request_count(),
+                index_area, google_api_key, openrouter_api_key, lat, lon, radius
+            )
+            return False
+    elif area['age_seconds'] > AREA_REFRESH_TTL_SECONDS and google_api_key:
+        area_refresh_queue.schedule(
+            area['id'], discovery_request_count(), refresh_area, google_api_key, openrouter_api_key, area
         )
+    return True
+
+
+def refresh_area(google_api_key: str, openrouter_api_key: Optional[str], area: dict) -> dict:
+    """
+    Re-discover an indexed area and store only what changed.
+
+    Places whose name and type are unchanged keep their vibes (no LLM call);
+    unchanged places only get their last_updated bumped. Places missing from
+    the new results are kept, since discovery returns at most 20 places per
+    request and absence doesn't mean a place closed. Duplicates of other
+    places are recorded as aliases (see place_dedup).
+
+    Returns:
+        Counts of 'discovered', 'duplicate', 'new', 'changed' and 'unchanged' places
+    """
+    raw_places = discover_all_places(google_api_key, area['center_lat'], area['center_lon'], area['radius'])
+    stats = {'discovered': len(raw_places), 'duplicate': 0, 'new': 0, 'changed': 0, 'unchanged': 0}
+    if not raw_places:
+        # Most likely an upstream failure; leave the area stale so it is retried
+        return stats
+
+    unique_places, aliases = dedupe_places(raw_places)
+    stats['duplicate'] = len(raw_places) - len(unique_places)
+    raw_places = unique_places
+
+    stored = get_storage().get_places(p['place_id'] for p in raw_places)
+
+    to_save = []
+    unchanged_ids = []
+    for place in raw_places:
+        row = stored.get(place['place_id'])
+        if row is None:
+            stats['new'] += 1
+            vibes, source = categorize_place(place, openrouter_api_key)
+            to_save.append((place, vibes, source))
+            continue
+
+        if (row['name'], row['google_type']) != (place['name'], place.get('google_type')):
+            stats['changed'] += 1
+            vibes, source = categorize_place(place, openrouter_api_key)
+            to_save.append((place, vibes, source))
+        elif (row['latitude'], row['longitude'], row['address'], row['rating'], row['user_ratings_total']) != (
+                place['latitude'], place['longitude'], place.get('address'), place.get('rating'),
+                place.get('user_ratings_total')):
+            stats['changed'] += 1
+            to_save.append((place, row['vibes'], row['categorization_source']))
+        else:
+            stats['unchanged'] += 1
+            unchanged_ids.append(place['place_id'])
+
+    # Nobody reads these back right away, so the refresh doesn't wait for the writer
+    if to_save:
+        save_places_bulk(to_save, wait=False)
+    if aliases:
+        get_storage().add_aliases(aliases, wait=False)
+    get_storage().mark_area_refreshed(area['id'], unchanged_ids, wait=False)
+
+    print(f"Refreshed area {area['id']}: {stats}")
+    return stats
+
+
+def get_route_places(google_api_key: str, openrouter_api_key: Optional[str],
+                     lat: float, lon: float, radius: float, vibe: str,
+                     degraded: Optional[List[str]] = None) -> PlaceTable:
+    """
+    Get the places for a route, indexing the area first if needed.
+
+    Widens the search to twice the radius when the area has no places for
+    the vibe, and finally falls back to a direct Places API search. When
+    indexing is deferred (see ensure_area_indexed) 'indexing' is appended
+    to `degraded`, if given.
+    """
+    # Index the area if it isn't in our database yet (stale areas refresh in the background)
+    if not ensure_area_indexed(google_api_key, openrouter_api_key, lat, lon, radius):
+        _mark_degraded(degraded, 'indexing')
+
+    # Query places for the requested vibe from database
+    with stage('db-query'):
+        places = get_place_table_by_vibe(lat, lon, radius, vibe, ROUTE_PLACE_LIMIT or None)
+    if places:
+        return places
+
+    return get_fallback_route_places(google_api_key, openrouter_api_key, lat, lon, radius, vibe, degraded)
+
+
+def _mark_degraded(degraded, name):
+    if degraded is not None and name not in degraded:
+        degraded.append(name)
+
+
+def get_fallback_route_places(google_api_key: str, openrouter_api_key: Optional[str],
+                              lat: float, lon: float, radius: float, vibe: str,
+                              degraded: Optional[List[str]] = None) -> PlaceTable:
+    """Places for a route whose own radius had none: a wider area, then the Places API."""
+    # Expand search radius
+    expanded_radius = min(radius * 2, 10000)
+
+    # Check if expanded area needs indexing
+    if not ensure_area_indexed(google_api_key, openrouter_api_key, lat, lon, expanded_radius):
+        _mark_degraded(degraded, 'indexing')
+
+    with stage('db-query'):
+        places = get_place_table_by_vibe(lat, lon, expanded_radius, vibe, ROUTE_PLACE_LIMIT or None)
+    if places:
+        return places
+
+    # Fallback to direct API call if still no places
+    with stage('discovery'):
+        fallback_places = get_google_places(google_api_key, lat, lon, vibe, radius)
+        if not fallback_places:
+            fallback_places = get_google_places(google_api_key, lat, lon, vibe, expanded_radius)
+    return PlaceTable.from_dicts(fallback_places)
 
 
 def get_place_by_id(place_id: str) -> Optional[dict]:
-    """Get a single place by its ID."""
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT place_id, name, latitude, longitude, google_type,
-                   address, rating, user_ratings_total, categorization_source
-            FROM places WHERE place_id = ?
-        ''', (place_id,))
-
-        row = cursor.fetchone()
-        if not row:
-            return None
-
-        # Get vibes
-        cursor.execute('SELECT vibe FROM place_vibes WHERE place_id = ?', (place_id,))
-        vibes = [v['vibe'] for v in cursor.fetchall()]
-
-        return {
-            'place_id': row['place_id'],
-            'name': row['name'],
-            'latitude': row['latitude'],
-            'longitude': row['longitude'],
-            'google_type': row['google_type'],
-            'address': row['address'],
-            'rating': row['rating'],
-            'user_ratings_total': row['user_ratings_total'],
-            'categorization_source': row['categorization_source'],
-            'vibes': vibes
-        }
+    """Get a single place by its ID (an alias ID gets the place it duplicates)."""
+    storage = get_storage()
+    place = storage.get_place(place_id)
+    if place is None:
+        canonical_id = storage.get_aliases([place_id]).get(place_id)
+        if canonical_id is not None:
+            place = storage.get_place(canonical_id)
+    return place
@@ -0,0 +1,215 @@
+"""
+Apply PLACE_TYPE_TO_VIBES changes to places already in places.db.
+
+The mapping last applied is stored in the meta table as a fingerprint (each
+type's vibe mask). A run diffs the current mapping against it. For every
+type whose vibes changed, one UPDATE sets the new mask on that type's
+statically categorized places that don't already have it. LLM-categorized
+places are never touched, and types whose vibes didn't change aren't even
+read. A database without a fingerprint has every mapped type checked once.
+Unchanged rows are skipped by the WHERE clause, so a rerun is cheap and
+safe.
+
+A type removed from the mapping (or mapped to no vibes) is one
+place_service.categorize_place would now send to the LLM, so its places are
+not cleared.
+They keep their vibes and are reported as unmapped on every run. The type
+stays in the fingerprint until none are left. --llm categorizes them with
+the LLM (OPENROUTER_API_KEY), as ingest would.
+
+The changed places are merged into the per-tile top-K lists they gained or
+lost a vibe in; only full lists that lost a member are recomputed from the
+places table. The updates, the tile lists and the new fingerprint are one
+write through the write queue, so readers never see them half applied. An
+existing place snapshot is re-exported afterwards. Scheduled maintenance
+runs it too.
+
+Run from the backend directory:
+    python -m services.recategorize
+    python -m services.recategorize --dry-run   # only count what would change
+    python -m services.recategorize --llm       # also send unmapped types' places to the LLM
+"""
+import argparse
+import json
+import os
+import time
+
+from config import PLACE_TYPE_TO_VIBES
+from models import place_snapshot
+from models.database import get_db, merge_tile_top, TILE_DEGREES
+from models.place import VIBE_BITS, vibes_to_mask
+from models.storage import get_storage
+from models.write_queue import write_queue
+from services.ai_service import categorize_place_with_llm
+from utils.geo_utils import tile_for
+
+FINGERPRINT_KEY = 'place_type_to_vibes'
+
+
+def type_masks(mapping=None):
+    """Vibe mask per place type (types mapped to no vibes are left out, as if unmapped)"""
+    mapping = PLACE_TYPE_TO_VIBES if mapping is None else mapping
+    masks = {place_type: vibes_to_mask(vibes) for place_type, vibes in mapping.items()}
+    return {place_type: mask for place_type, mask in masks.items() if mask}
+
+
+def stored_fingerprint():
+    """Type masks the places were last categorized with (None if never recorded)"""
+    with get_db() as conn:
+        row = conn.execute('SELECT value FROM meta WHERE key = ?', (FINGERPRINT_KEY,)).fetchone()
+    return json.loads(row['value']) if row else None
+
+
+def changed_types(current, previous):
+    """{place_type: new mask} for every type whose mask differs (0 = now unmapped)"""
+    if previous is None:
+        return dict(current)
+    return {
+        place_type: current.get(place_type, 0)
+        for place_type in set(current) | set(previous)
+        if current.get(place_type, 0) != previous.get(place_type, 0)
+    }
+
+
+def _update_type(conn, google_type, mask, added, removed):
+    """Give google_type's static places the new mask, noting the tile list changes"""
+    rows = conn.execute('''
+        SELECT place_id, latitude, longitude, COALESCE(rating, 0), vibe_mask FROM places
+        WHERE categorization_source = 'static' AND google_type = ? AND vibe_mask != ?
+    ''', (google_type, mask)).fetchall()
+    if not rows:
+        return 0
+
+    for place_id, lat, lon, rating, old_mask in rows:
+        tile_lat, tile_lon = tile_for(lat, lon, TILE_DEGREES)
+        for bit in VIBE_BITS.values():
+            if mask & bit and not old_mask & bit:
+                added.setdefault((bit, tile_lat, tile_lon), []).append((rating, place_id))
+            elif old_mask & bit and not mask & bit:
+                removed.setdefault((bit, tile_lat, tile_lon), set()).add(place_id)
+
+    return conn.execute('''
+        UPDATE places SET vibe_mask = ?, last_updated = CURRENT_TIMESTAMP, changed_at = CURRENT_TIMESTAMP
+        WHERE categorization_source = 'static' AND google_type = ? AND vibe_mask != ?
+    ''', (mask, google_type, mask)).rowcount
+
+
+def _count_type(conn, google_type, mask):
+    return conn.execute('''
+        SELECT COUNT(*) FROM places
+        WHERE categorization_source = 'static' AND google_type = ? AND vibe_mask != ?
+    ''', (google_type, mask)).fetchone()[0]
+
+
+def _apply(conn, remapped, unmapped, current, previous):
+    """Update every remapped type, fix the tile lists and record the fingerprint, in one transaction"""
+    added, removed = {}, {}
+    updated = {google_type: _update_type(conn, google_type, mask, added, removed)
+               for google_type, mask in sorted(remapped.items())}
+    rescanned = merge_tile_top(conn.cursor(), added, removed)
+
+    # Unmapped types with places still carrying their old vibes stay in the
+    # fingerprint, so the next run reports them again
+    left = {google_type: _count_type(conn, google_type, 0) for google_type in sorted(unmapped)}
+    left = {google_type: count for google_type, count in left.items() if count}
+    fingerprint = dict(current, **{google_type: previous[google_type] for google_type in left})
+    conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                 (FINGERPRINT_KEY, json.dumps(fingerprint, sort_keys=True)))
+    return updated, left, {'changed': len(set(added) | set(removed)), 'rescanned': rescanned}
+
+
+def categorize_unmapped(google_types, openrouter_api_key):
+    """
+    Categorize the static places of types no longer in the mapping with the LLM.
+
+    Places the LLM gives no vibes for keep theirs.
+
+    Returns:
+        Number of places recategorized
+    """
+    with get_db() as conn:
+        place_ids = [row[0] for google_type in sorted(google_types) for row in conn.execute(
+            "SELECT place_id FROM places WHERE categorization_source = 'static' AND google_type = ? AND vibe_mask != 0",
+            (google_type,)
+        )]
+    to_save = []
+    for place in get_storage().get_places(place_ids).values():
+        vibes = categorize_place_with_llm(openrouter_api_key, place['name'], place['google_type'])
+        if vibes:
+            to_save.append((place, vibes, 'llm'))
+    if to_save:
+        get_storage().upsert_places(to_save)
+    return len(to_save)
+
+
+def recategorize(mapping=None, dry_run=False, snapshot=True, openrouter_api_key=None):
+    """
+    Bring statically categorized places in line with the mapping.
+
+    Args:
+        mapping: Type -> vibes mapping to apply (default PLACE_TYPE_TO_VIBES)
+        dry_run: Only count the places that would change
+        snapshot: Re-export an existing place snapshot after changes
+        openrouter_api_key: Categorize the places of unmapped types with the
+            LLM (otherwise they keep their vibes)
+
+    Returns:
+        Dict with 'types' ({google_type: places updated} for remapped types),
+        'updated' (total), 'unmapped' ({google_type: places left with their
+        old vibes}), 'llm' (places the LLM recategorized), 'tiles' (top-K
+        lists changed and rescanned) and 'seconds'
+    """
+    started = time.perf_counter()
+    current = type_masks(mapping)
+    previous = stored_fingerprint()
+    changed = changed_types(current, previous)
+    remapped = {google_type: mask for google_type, mask in changed.items() if mask}
+    unmapped = {google_type for google_type, mask in changed.items() if not mask}
+
+    report = {'types': {}, 'updated': 0, 'unmapped': {}, 'llm': 0, 'tiles': {'changed': 0, 'rescanned': 0}}
+    if dry_run:
+        with get_db() as conn:
+            report['types'] = {t: _count_type(conn, t, mask) for t, mask in sorted(remapped.items())}
+            counts = {t: _count_type(conn, t, 0) for t in sorted(unmapped)}
+        report['unmapped'] = {t: count for t, count in counts.items() if count}
+    elif changed or previous is None:
+        if unmapped and openrouter_api_key:
+            report['llm'] = categorize_unmapped(unmapped, openrouter_api_key)
+        report['types'], report['unmapped'], report['tiles'] = write_queue.submit(
+            _apply, remapped, unmapped, current, previous or {}).result()
+        changed_places = any(report['types'].values()) or report['llm']
+        if snapshot and changed_places and os.path.exists(place_snapshot.snapshot_path()):
+            place_snapshot.export_snapshot()
+
+    report['updated'] = sum(report['types'].values())
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+    parser.add_argument('--llm', action='store_true',
+                        help="Categorize unmapped types' places with the LLM (needs OPENROUTER_API_KEY)")
+    args = parser.parse_args(argv)
+
+    api_key = None
+    if args.llm and not args.dry_run:
+        api_key = os.getenv('OPENROUTER_API_KEY')
+        if not api_key:
+            parser.error('--llm needs OPENROUTER_API_KEY')
+
+    report = recategorize(dry_run=args.dry_run, openrouter_api_key=api_key)
+    verb = 'Would update' if args.dry_run else 'Updated'
+    for google_type, count in report['types'].items():
+        print(f"  {google_type:<28} {count}")
+    print(f"{verb} {report['updated']} places across {len(report['types'])} changed types "
+          f"in {report['seconds']}s")
+    if report['llm']:
+        print(f"The LLM recategorized {report['llm']} places of unmapped types")
+    for google_type, count in report['unmapped'].items():
+        print(f"  {google_type} is no longer mapped: {count} places keep their vibes (--llm categorizes them)")
+
+
+if __name__ == '__main__':
+    main()
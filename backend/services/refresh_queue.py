@@ -0,0 +1,87 @@
+"""
+Background refresh queue for stale indexed areas.
+
+Requests that hit a stale area are still answered from the database; the
+area is queued here and re-discovered by a single worker thread. Each job
+declares how many upstream requests it will make and waits for that much
+of an hourly quota first, and its calls run in the scheduler's background
+priority class, so refresh traffic stays a small, bounded share of the API
+budget and never delays user requests.
+"""
+import queue
+import threading
+
+from config import AREA_REFRESH_QUOTA_PER_HOUR, AREA_REFRESH_QUEUE_SIZE
+from services.upstream import upstream_priority
+from utils.metrics import AREA_REFRESHES
+from utils.rate_limit import TokenBucket
+
+
+class RefreshQueue:
+    """
+    Deduplicating job queue drained by one daemon thread under a quota.
+
+    Jobs are keyed (e.g. by area id) so an area that is hit again while its
+    refresh is pending is not queued twice.
+    """
+
+    def __init__(self, quota_per_hour, max_pending):
+        self.quota_per_hour = quota_per_hour
+        # Up to ten minutes' worth of quota can be spent in a burst
+        self.quota = TokenBucket(quota_per_hour / 3600, capacity=max(1.0, quota_per_hour / 6))
+        self._jobs = queue.Queue(maxsize=max_pending)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def schedule(self, key, cost, func, *args):
+        """
+        Queue func(*args) unless a job with this key is already pending.
+
+        Args:
+            key: Deduplication key
+            cost: Upstream requests the job will make (taken from the quota)
+
+        Returns:
+            True if the job was queued
+        """
+        if self.quota_per_hour <= 0:
+            return False
+        with self._lock:
+            if key in self._pending:
+                return False
+            try:
+                self._jobs.put_nowait((key, cost, func, args))
+            except queue.Full:
+                AREA_REFRESHES.inc(outcome='dropped')
+                return False
+            self._pending.add(key)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='area-refresh', daemon=True)
+                self._worker.start()
+        return True
+
+    def pending(self):
+        """Number of jobs waiting or running"""
+        with self._lock:
+            return len(self._pending)
+
+    def _run(self):
+        while True:
+            key, cost, func, args = self._jobs.get()
+            try:
+                # A job larger than the bucket would never fit; let it take a full bucket
+                self.quota.acquire(min(cost, self.quota.capacity))
+                with upstream_priority('background'):
+                    func(*args)
+                AREA_REFRESHES.inc(outcome='refreshed')
+            except Exception as e:
+                AREA_REFRESHES.inc(outcome='error')
+                print(f"Error refreshing {key}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+                self._jobs.task_done()
+
+
+area_refresh_queue = RefreshQueue(AREA_REFRESH_QUOTA_PER_HOUR, AREA_REFRESH_QUEUE_SIZE)
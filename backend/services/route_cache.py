@@ -0,0 +1,143 @@
+"""Route result cache keyed on snapped start, vibe and duration"""
+import json
+import math
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from config import (
+    ROUTE_CACHE_ENABLED, ROUTE_CACHE_GRID_METERS, ROUTE_CACHE_DURATION_BUCKET,
+    ROUTE_CACHE_MAX_ENTRIES, ROUTE_CACHE_TTL_SECONDS, ROUTE_CACHE_DB_PATH, ROUTE_CACHE_STALE_SECONDS
+)
+from utils.ttl_cache import TTLCache
+
+METERS_PER_DEGREE = 111320
+
+
+def snap_to_grid(lat: float, lon: float, grid_meters: float = ROUTE_CACHE_GRID_METERS) -> tuple:
+    """
+    Snap a coordinate to a grid cell of roughly grid_meters on each side.
+
+    Returns:
+        (lat_cell, lon_cell) integer cell indices
+    """
+    lat_step = grid_meters / METERS_PER_DEGREE
+    lat_cell = round(lat / lat_step)
+    # Use the cell's latitude so every point in a cell gets the same longitude step
+    cell_lat = lat_cell * lat_step
+    lon_step = grid_meters / (METERS_PER_DEGREE * max(math.cos(math.radians(cell_lat)), 0.01))
+    return lat_cell, round(lon / lon_step)
+
+
+def make_route_key(lat: float, lon: float, vibe: str, duration: int, is_circular: bool,
+                   destination: Optional[dict] = None, num_routes: int = 1) -> str:
+    """Build the cache key for a /api/generate-route request"""
+    lat_cell, lon_cell = snap_to_grid(lat, lon)
+    duration_bucket = int(duration) // ROUTE_CACHE_DURATION_BUCKET
+
+    if destination:
+        dest_cell = '%d:%d' % snap_to_grid(destination['latitude'], destination['longitude'])
+    else:
+        dest_cell = '-'
+
+    return f"{vibe}|{'loop' if is_circular else 'oneway'}|{lat_cell}:{lon_cell}|{duration_bucket}|{dest_cell}|{num_routes}"
+
+
+class RouteCache(TTLCache):
+    """
+    Thread-safe LRU cache with TTL for full route responses.
+
+    Entries live in memory; when db_path is set they are also written to a
+    SQLite table so they survive restarts and are shared between workers.
+    Expired entries are kept for another stale_seconds so get(allow_stale=True)
+    can still answer when the upstreams are down.
+    """
+
+    def __init__(self, max_entries: int = ROUTE_CACHE_MAX_ENTRIES, ttl_seconds: int = ROUTE_CACHE_TTL_SECONDS,
+                 db_path: Optional[str] = ROUTE_CACHE_DB_PATH, stale_seconds: int = ROUTE_CACHE_STALE_SECONDS):
+        super().__init__(max_entries, ttl_seconds)
+        self.stale_seconds = stale_seconds
+        self.db_path = db_path
+
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS route_cache (
+                        cache_key TEXT PRIMARY KEY,
+                        payload TEXT NOT NULL,
+                        created_at REAL NOT NULL
+                    )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_route_cache_created ON route_cache(created_at)')
+
+    @contextmanager
+    def _connect(self):
+        """Connection to the persisted cache, committed (or rolled back) and closed on exit"""
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def get(self, key: str, allow_stale: bool = False) -> Optional[dict]:
+        """Return the cached response for key, or None if missing or expired (or past its stale period)"""
+        now = time.time()
+        max_age = self.ttl_seconds + (self.stale_seconds if allow_stale else 0)
+
+        payload = self._lookup(key, max_age, self.ttl_seconds + self.stale_seconds)
+        if payload is not None:
+            return payload
+        if not self.db_path:
+            return None
+
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    'SELECT payload, created_at FROM route_cache WHERE cache_key = ? AND created_at >= ?',
+                    (key, now - max_age)
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Route cache read error: {e}")
+            return None
+
+        if not row:
+            return None
+
+        payload = json.loads(row[0])
+        self._remember(key, row[1], payload)
+        return payload
+
+    def put(self, key: str, payload: dict) -> None:
+        """Store a response under key"""
+        now = time.time()
+        self._remember(key, now, payload)
+
+        if not self.db_path:
+            return
+
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO route_cache (cache_key, payload, created_at) VALUES (?, ?, ?)',
+                    (key, json.dumps(payload), now)
+                )
+                conn.execute('DELETE FROM route_cache WHERE created_at < ?',
+                             (now - self.ttl_seconds - self.stale_seconds,))
+        except sqlite3.Error as e:
+            print(f"Route cache write error: {e}")
+
+    def clear(self) -> None:
+        """Drop every entry (memory and persisted)"""
+        super().clear()
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute('DELETE FROM route_cache')
+
+
+# Shared cache used by the Flask app
+route_cache = RouteCache() if ROUTE_CACHE_ENABLED else None
@@ -1,6 +1,18 @@
 """Route optimization and calculation service"""
-from config import VIBE_CONFIGS
-from utils.geo_utils import calculate_distance, calculate_angle
+from config import VIBE_CONFIGS, MAX_ROUTE_ALTERNATIVES
+from models.place import Place
+from models.place_table import PlaceTable
+from services.google_maps_service import encode_polyline
+from utils.geo_utils import calculate_distance, calculate_angle, degree_margins
+
+# Streets are ~1.4x straight-line distance
+ROUTING_OVERHEAD = 1.4
+
+# Ranking weight of the vibe score against the relative length error
+VIBE_SCORE_WEIGHT = 0.5
+
+# How many optimizer variants to try per requested candidate
+CANDIDATE_OVERSAMPLE = 3
 
 
 def find_places_near_route(route_coordinates, all_places, max_distance=100):
@@ -9,28 +21,41 @@ def find_places_near_route(route_coordinates, all_places, max_distance=100):
 
     Args:
         route_coordinates: List of [lon, lat] coordinates forming the route
-        all_places: List of all available places
+        all_places: PlaceTable, or list of place dicts / Place objects
         max_distance: Maximum distance in meters from route to consider a place "on path"
 
     Returns:
-        List of places that are near the route, sorted by relevance
+        List of place dicts (response shape) near the route, sorted by relevance
     """
     if not route_coordinates or not all_places:
         return []
 
+    # Sample route points (at most ~50 to reduce computation)
+    sample_interval = max(1, len(route_coordinates) // 50)
+    sampled_coords = route_coordinates[::sample_interval]
+
+    # Places outside the sampled points' bounding box (grown by max_distance)
+    # can't be within max_distance of any of them, so skip them cheaply
+    lats = [c[1] for c in sampled_coords]
+    lat_margin, lon_margin = degree_margins(max(abs(min(lats)), abs(max(lats))), max_distance)
+    min_lat, max_lat = min(lats) - lat_margin, max(lats) + lat_margin
+    min_lon = min(c[0] for c in sampled_coords) - lon_margin
+    max_lon = max(c[0] for c in sampled_coords) + lon_margin
+
+    is_table = isinstance(all_places, PlaceTable)
+    if is_table:
+        positions = zip(range(len(all_places)), all_places.latitudes, all_places.longitudes)
+    else:
+        positions = ((i, p.get('latitude'), p.get('longitude')) for i, p in enumerate(all_places))
+
     places_with_min_distance = []
 
     # For each place, find the minimum distance to any point on the route
-    for place in all_places:
-        place_lat = place.get('latitude')
-        place_lon = place.get('longitude')
-
+    for index, place_lat, place_lon in positions:
         if not place_lat or not place_lon:
             continue
-
-        # Sample route points (every 10th point to reduce computation)
-        sample_interval = max(1, len(route_coordinates) // 50)
-        sampled_coords = route_coordinates[::sample_interval]
+        if not (min_lat <= place_lat <= max_lat and min_lon <= place_lon <= max_lon):
+            continue
 
         # Find minimum distance to route
         min_dist = float('inf')
@@ -45,7 +70,12 @@ def find_places_near_route(route_coordinates, all_places, max_distance=100):
 
         # Only include places within max_distance of the route
         if min_dist <= max_distance:
-            place_copy = place.copy()
+            if is_table:
+                place_copy = all_places.to_dict(index)
+            elif isinstance(all_places[index], Place):
+                place_copy = all_places[index].to_response_dict()
+            else:
+                place_copy = all_places[index].copy()
             place_copy['distance_to_route'] = min_dist
             place_copy['route_position'] = closest_route_index / len(route_coordinates)  # 0 to 1
             places_with_min_distance.append(place_copy)
@@ -77,6 +107,65 @@ def score_place_for_vibe(place, vibe):
     return (place.get('rating') or 3.0) * 10
 
 
+def parse_route_spec(data):
+    """
+    Validate a route request (a /api/generate-route body or one batch entry).
+
+    Returns:
+        Dict with vibe, latitude, longitude, is_circular, destination,
+        duration and num_routes, defaults filled in
+
+    Raises:
+        ValueError: with a client-facing message if the spec is invalid
+    """
+    vibe = data.get('vibe', 'chill')
+    latitude = data.get('latitude')
+    longitude = data.get('longitude')
+    is_circular = data.get('circular', True)
+    destination = data.get('destination')  # For one-way routes
+
+    # Number of alternative routes to return (shares all upstream work)
+    try:
+        num_routes = int(data.get('k', 1))
+    except (ValueError, TypeError):
+        num_routes = 1
+    num_routes = max(1, min(num_routes, MAX_ROUTE_ALTERNATIVES))
+
+    # Handle duration - required for circular routes, optional for one-way
+    duration = data.get('duration')
+    if duration is not None:
+        try:
+            duration = int(duration)
+        except (ValueError, TypeError):
+            duration = 30  # Default if invalid
+    else:
+        duration = 30  # Default duration
+
+    if not latitude or not longitude:
+        raise ValueError('Location (latitude, longitude) is required')
+
+    # For one-way routes, validate destination
+    if not is_circular and not destination:
+        raise ValueError('Destination is required for one-way routes')
+
+    if vibe not in VIBE_CONFIGS:
+        raise ValueError(f'Invalid vibe. Choose from: {list(VIBE_CONFIGS.keys())}')
+
+    # Only validate duration for circular routes
+    if is_circular and (duration < 10 or duration > 120):
+        raise ValueError('Duration must be between 10 and 120 minutes')
+
+    return {
+        'vibe': vibe,
+        'latitude': latitude,
+        'longitude': longitude,
+        'is_circular': is_circular,
+        'destination': destination,
+        'duration': duration,
+        'num_routes': num_routes
+    }
+
+
 def calculate_route_parameters(duration_minutes, vibe, is_circular):
     """Calculate target distance and search radius based on duration"""
     vibe_config = VIBE_CONFIGS[vibe]
@@ -100,7 +189,7 @@ def calculate_route_parameters(duration_minutes, vibe, is_circular):
     }
 
 
-def optimize_waypoints(start_lat, start_lon, places, target_distance, vibe, is_circular, destination_coords=None):
+def optimize_waypoints(start_lat, start_lon, places, target_distance, vibe, is_circular, destination_coords=None, variant=None):
     """Select optimal waypoints based on route type.
 
     Places should already be filtered to the requested vibe (from place_service).
@@ -114,6 +203,8 @@ def optimize_waypoints(start_lat, start_lon, places, target_distance, vibe, is_c
         vibe: Vibe string
         is_circular: Whether route should be circular
         destination_coords: Optional (lat, lon) tuple for one-way route destination
+        variant: Optional integer selecting an alternative waypoint set
+            (used by generate_waypoint_candidates; None keeps the default pick)
     """
     if not places:
         return create_simple_circular_route(start_lat, start_lon, target_distance)
@@ -168,7 +259,13 @@ def optimize_waypoints(start_lat, start_lon, places, target_distance, vibe, is_c
             if not top_candidates:
                 top_candidates = [p for p, score in scored_places[:5]]
 
-            vibe_index = hash(vibe) % len(top_candidates)
+            if variant is None:
+                vibe_index = hash(vibe) % len(top_candidates)
+                loop_direction = 1
+            else:
+                # Rotate through the top candidates, then walk the loop the other way
+                vibe_index = variant % len(top_candidates)
+                loop_direction = -1 if (variant // len(top_candidates)) % 2 else 1
             waypoint1 = top_candidates[vibe_index]
             angle1 = calculate_angle(start_lat, start_lon, waypoint1['latitude'], waypoint1['longitude'])
             selected_waypoints.append(waypoint1)
@@ -178,7 +275,7 @@ def optimize_waypoints(start_lat, start_lon, places, target_distance, vibe, is_c
             remaining = [p for p, s in scored_places if p != waypoint1 and s > 0]
             if remaining:
                 # Find waypoint closest to 120 degrees from first
-                target_angle_2 = (angle1 + 120) % 360
+                target_angle_2 = (angle1 + 120 * loop_direction) % 360
                 waypoint2 = min(
                     remaining,
                     key=lambda p: min(
@@ -193,7 +290,7 @@ def optimize_waypoints(start_lat, start_lon, places, target_distance, vibe, is_c
                 # Select third waypoint ~120 degrees from second (240 degrees from first)
                 remaining2 = [p for p in remaining if p != waypoint2]
                 if remaining2:
-                    target_angle_3 = (angle1 + 240) % 360
+                    target_angle_3 = (angle1 + 240 * loop_direction) % 360
                     waypoint3 = min(
                         remaining2,
                         key=lambda p: min(
@@ -287,13 +384,15 @@ def optimize_waypoints(start_lat, start_lon, places, target_distance, vibe, is_c
                 endpoint_candidates = top_candidates[:3] if len(top_candidates) >= 3 else top_candidates
 
                 # Pick endpoint close to target distance
-                endpoint = min(
+                endpoint_candidates = sorted(
                     endpoint_candidates,
                     key=lambda p: abs(
                         calculate_distance(start_lat, start_lon, p['latitude'], p['longitude'])
                         - target_endpoint_dist
                     )
                 )
+                endpoint_index = 0 if variant is None else variant % len(endpoint_candidates)
+                endpoint = endpoint_candidates[endpoint_index]
 
                 # Remove endpoint from scored places
                 remaining_places = [(p, s) for p, s in scored_places if p != endpoint]
@@ -313,13 +412,20 @@ def optimize_waypoints(start_lat, start_lon, places, target_distance, vibe, is_c
             mid_lat = (start_lat + endpoint['latitude']) / 2
             mid_lon = (start_lon + endpoint['longitude']) / 2
 
-            nearest = min(
+            by_midpoint_distance = sorted(
                 remaining_places,
                 key=lambda x: calculate_distance(
                     mid_lat, mid_lon, x[0]['latitude'], x[0]['longitude']
                 )
-            )[0]
-            intermediates.append(nearest)
+            )
+            # Variants step outwards from the place nearest the midpoint
+            if variant is None:
+                intermediate_index = 0
+            elif destination_coords:
+                intermediate_index = variant % len(by_midpoint_distance)
+            else:
+                intermediate_index = (variant // 3) % len(by_midpoint_distance)
+            intermediates.append(by_midpoint_distance[intermediate_index][0])
 
         if endpoint:
             waypoints = [(start_lat, start_lon)] + [
@@ -332,6 +438,122 @@ def optimize_waypoints(start_lat, start_lon, places, target_distance, vibe, is_c
     return waypoints
 
 
+def estimate_route_length(waypoints):
+    """Estimate the walking distance of a waypoint sequence in meters"""
+    straight_line = sum(
+        calculate_distance(a[0], a[1], b[0], b[1])
+        for a, b in zip(waypoints, waypoints[1:])
+    )
+    return straight_line * ROUTING_OVERHEAD
+
+
+def generate_waypoint_candidates(start_lat, start_lon, places, target_distance, vibe, is_circular,
+                                 destination_coords=None, k=3):
+    """
+    Build up to k diverse waypoint sets from one candidate pool.
+
+    Runs the optimizer with different variants, drops duplicate sets and
+    ranks the rest by estimated length error and vibe score. Sets that share
+    stops with an already chosen set are only used to fill remaining slots.
+
+    Args:
+        start_lat: Starting latitude
+        start_lon: Starting longitude
+        places: List of places to choose from (already filtered to the vibe)
+        target_distance: Target route distance in meters
+        vibe: Vibe string
+        is_circular: Whether route should be circular
+        destination_coords: Optional (lat, lon) tuple for one-way route destination
+        k: Number of candidates to return
+
+    Returns:
+        List of candidate dicts (best first) with 'waypoints',
+        'estimated_distance', 'length_error' and 'vibe_score'
+    """
+    places_by_coord = {(p['latitude'], p['longitude']): p for p in places}
+
+    seen = set()
+    candidates = []
+    for variant in range(max(1, k) * CANDIDATE_OVERSAMPLE):
+        waypoints = optimize_waypoints(
+            start_lat, start_lon, places, target_distance, vibe,
+            is_circular, destination_coords, variant=variant
+        )
+        key = tuple(waypoints)
+        if key in seen:
+            continue
+        seen.add(key)
+
+        estimated_distance = estimate_route_length(waypoints)
+        length_error = abs(estimated_distance - target_distance) / target_distance if target_distance else 0
+
+        stops = [places_by_coord[wp] for wp in waypoints[1:-1] if wp in places_by_coord]
+        if stops:
+            # Normalise to 0-1 (a 5-star place in the vibe scores 50)
+            vibe_score = sum(
+                score_place_for_vibe(p, vibe) if p.get('vibes') else (p.get('rating') or 3.0) * 10
+                for p in stops
+            ) / len(stops) / 50
+        else:
+            vibe_score = 0
+
+        candidates.append({
+            'waypoints': waypoints,
+            'estimated_distance': estimated_distance,
+            'length_error': length_error,
+            'vibe_score': vibe_score
+        })
+
+    candidates.sort(key=lambda c: c['length_error'] - VIBE_SCORE_WEIGHT * c['vibe_score'])
+
+    # Prefer sets that don't reuse stops from sets already picked
+    selected = []
+    used_stops = set()
+    for candidate in candidates:
+        stops = set(candidate['waypoints'][1:-1])
+        if stops & used_stops:
+            continue
+        selected.append(candidate)
+        used_stops |= stops
+        if len(selected) == k:
+            return selected
+
+    for candidate in candidates:
+        if candidate not in selected:
+            selected.append(candidate)
+            if len(selected) == k:
+                break
+
+    return selected
+
+
+def build_route_result(directions, places):
+    """Shape a Directions result and its nearby places (a PlaceTable) into a response route"""
+    # Find places that are actually close to the generated route path
+    # This ensures "places along the way" are truly on the path
+    route_coordinates = directions['coordinates']
+    places_on_route = find_places_near_route(route_coordinates, places, max_distance=150)
+
+    # If we found places on route, use those; otherwise fall back to nearby places
+    waypoints_to_display = places_on_route if places_on_route else places.to_dicts(range(min(10, len(places))))
+
+    # Limit to top 10 places
+    waypoints_to_display = waypoints_to_display[:10]
+
+    return {
+        'route': {
+            'coordinates': directions['coordinates'],
+            'distance': directions['distance'],
+            'duration': directions['duration'],
+            'polyline': directions['polyline']
+        },
+        'waypoints': waypoints_to_display,
+        'directions': {
+            'steps': directions['steps']
+        }
+    }
+
+
 def create_simple_circular_route(lat, lon, target_distance):
     """Create a simple circular route when no POIs available"""
     # Account for routing overhead: actual routes are ~1.4x straight-line
@@ -346,3 +568,30 @@ def create_simple_circular_route(lat, lon, target_distance):
         (lat, lon)  # Back to start
     ]
     return waypoints
+
+
+def straight_line_directions(waypoints):
+    """
+    Directions-shaped result joining the waypoints with straight lines.
+
+    Used when the Directions API is unavailable or out of time; distance
+    and duration are estimated with the usual routing overhead.
+    """
+    coordinates = [[lon, lat] for lat, lon in waypoints]
+    steps = []
+    for a, b in zip(waypoints, waypoints[1:]):
+        leg = calculate_distance(a[0], a[1], b[0], b[1]) * ROUTING_OVERHEAD
+        steps.append({
+            'instruction': 'Walk towards the next stop',
+            'distance': int(leg),
+            'duration': int(leg / 80),  # 5 km/h
+            'maneuver': 'straight'
+        })
+    distance = sum(step['distance'] for step in steps)
+    return {
+        'coordinates': coordinates,
+        'distance': distance,
+        'duration': int(distance / 80),
+        'steps': steps,
+        'polyline': encode_polyline(coordinates)
+    }
@@ -0,0 +1,428 @@
+"""
+Single entry point for outbound calls to upstream APIs.
+
+Every call goes through a per-upstream scheduler: a token bucket keeps the
+request rate under UPSTREAM_LIMITS, a concurrency cap bounds calls in
+flight, and waiting calls are served by priority class (interactive before
+batch before background). A call that can't get its turn within its
+class's UPSTREAM_QUEUE_TIMEOUTS fails fast with UpstreamQueueTimeout
+instead of piling onto an overloaded upstream.
+
+Queue waits and HTTP timeouts are also clamped to the request's deadline
+budget (utils/deadline.py), and hedged_request() can race a second copy
+of a slow request against the first.
+
+Each upstream also has a circuit breaker. While it is open, calls fail
+immediately with CircuitOpen, and callers answer from local data instead
+of waiting out timeouts against an upstream that is down.
+"""
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import requests
+
+from config import (
+    UPSTREAM_LIMITS, UPSTREAM_QUEUE_TIMEOUTS, UPSTREAM_HEDGE_PERCENTILE, UPSTREAM_HEDGE_MIN_SAMPLES,
+    CIRCUIT_BREAKER_ENABLED, CIRCUIT_WINDOW, CIRCUIT_MIN_CALLS, CIRCUIT_FAILURE_RATE, CIRCUIT_SLOW_CALL_SECONDS,
+    CIRCUIT_OPEN_SECONDS
+)
+from utils.deadline import DeadlineExceeded, clamp_timeout, expired, remaining
+from utils.metrics import (
+    UPSTREAM_CALLS, UPSTREAM_SECONDS, UPSTREAM_QUEUE_DEPTH, UPSTREAM_QUEUE_SECONDS, UPSTREAM_HEDGES,
+    UPSTREAM_CIRCUIT_STATE, UPSTREAM_CIRCUIT_OPENS
+)
+from utils.rate_limit import TokenBucket
+
+# Successful call latencies kept per upstream for hedging decisions
+LATENCY_WINDOW = 200
+
+# Priority classes, highest first
+PRIORITIES = tuple(UPSTREAM_QUEUE_TIMEOUTS)
+
+# Priority of outbound calls made by the current request or job
+_priority = ContextVar('upstream_priority', default=PRIORITIES[0])
+
+
+@contextmanager
+def upstream_priority(priority):
+    """Run the enclosed upstream calls in the given priority class"""
+    if priority not in UPSTREAM_QUEUE_TIMEOUTS:
+        raise ValueError(f'Unknown upstream priority: {priority}')
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class UpstreamQueueTimeout(Exception):
+    """An outbound call didn't get its turn before its queue timeout"""
+
+
+class UpstreamLimiter:
+    """
+    Rate limit, concurrency cap and priority queue for one upstream.
+
+    Waiters are ordered by (priority, arrival); only the head of the queue
+    may take a token and a slot, so a burst of background calls can never
+    get ahead of an interactive one that arrives later.
+    """
+
+    def __init__(self, name, rate, burst, concurrency):
+        self.name = name
+        self.bucket = TokenBucket(rate, capacity=burst) if rate > 0 else None
+        self.concurrency = max(1, concurrency)
+        self.active = 0
+        self._waiters = []  # Heap of (priority rank, sequence)
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def acquire(self, priority, timeout):
+        """Wait for a token and a free slot; raises UpstreamQueueTimeout after timeout seconds"""
+        entry = (PRIORITIES.index(priority), next(self._sequence))
+        started = time.monotonic()
+        give_up_at = started + timeout
+
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            UPSTREAM_QUEUE_DEPTH.inc(upstream=self.name, priority=priority)
+            try:
+                while True:
+                    wait = None
+                    if self._waiters[0] == entry and self.active < self.concurrency:
+                        if self.bucket is None or self.bucket.try_acquire():
+                            heapq.heappop(self._waiters)
+                            self.active += 1
+                            # The next waiter may be able to go too
+                            self._cond.notify_all()
+                            break
+                        wait = self.bucket.time_until()
+
+                    left = give_up_at - time.monotonic()
+                    if left <= 0:
+                        self._waiters.remove(entry)
+                        heapq.heapify(self._waiters)
+                        self._cond.notify_all()
+                        raise UpstreamQueueTimeout(
+                            f'{self.name}: no {priority} slot within {timeout:.1f}s')
+                    self._cond.wait(left if wait is None else min(wait, left))
+            finally:
+                UPSTREAM_QUEUE_DEPTH.dec(upstream=self.name, priority=priority)
+
+        UPSTREAM_QUEUE_SECONDS.observe(time.monotonic() - started, upstream=self.name, priority=priority)
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def throttled(self):
+        """The upstream answered 429: spend the banked burst so callers slow down"""
+        if self.bucket is not None:
+            self.bucket.drain()
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(upstream):
+    """Scheduler for an upstream (created on first use; unknown upstreams are unlimited)"""
+    limiter = _limiters.get(upstream)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(upstream)
+            if limiter is None:
+                rate, burst, concurrency = UPSTREAM_LIMITS.get(upstream, (0, 1, 1000))
+                limiter = _limiters[upstream] = UpstreamLimiter(upstream, rate, burst, concurrency)
+    return limiter
+
+
+class CircuitOpen(Exception):
+    """An upstream's circuit breaker is rejecting calls"""
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker for one upstream.
+
+    Closed: calls go through and their outcomes fill a window of the last
+    CIRCUIT_WINDOW calls; once CIRCUIT_MIN_CALLS are in and at least
+    CIRCUIT_FAILURE_RATE of them failed (error, 5xx/429 or slower than
+    CIRCUIT_SLOW_CALL_SECONDS), the breaker opens. Open: calls are rejected
+    for CIRCUIT_OPEN_SECONDS. Half-open: a single probe call is let through;
+    success closes the breaker, failure opens it again.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name):
+        self.name = name
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self._outcomes = deque(maxlen=CIRCUIT_WINDOW)  # True for failed calls
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _set_state(self, state):
+        self.state = state
+        UPSTREAM_CIRCUIT_STATE.set(self._STATE_VALUES[state], upstream=self.name)
+
+    def _open(self):
+        self._set_state(self.OPEN)
+        self.opened_at = time.monotonic()
+        self._outcomes.clear()
+        self._probing = False
+        UPSTREAM_CIRCUIT_OPENS.inc(upstream=self.name)
+        print(f"Circuit breaker for {self.name} opened")
+
+    def _cooling_down(self):
+        return time.monotonic() - self.opened_at < CIRCUIT_OPEN_SECONDS
+
+    def is_open(self):
+        """Whether a call made now would be rejected (doesn't use up the half-open probe)"""
+        with self._lock:
+            if self.state == self.OPEN:
+                return self._cooling_down()
+            return self.state == self.HALF_OPEN and self._probing
+
+    def allow(self):
+        """Whether a call may go ahead now; in half-open state this claims the probe"""
+        with self._lock:
+            if self.state == self.OPEN:
+                if self._cooling_down():
+                    return False
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def abandon(self):
+        """An allowed call says nothing about the upstream (it timed out in the queue or hit the deadline)"""
+        with self._lock:
+            self._probing = False
+
+    def record(self, failed):
+        """Record the outcome of an allowed call"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                if failed:
+                    self._open()
+                else:
+                    self._set_state(self.CLOSED)
+                    self._probing = False
+                    print(f"Circuit breaker for {self.name} closed")
+                return
+            if self.state == self.OPEN:
+                # A call that started before the breaker opened
+                return
+            self._outcomes.append(failed)
+            if len(self._outcomes) >= CIRCUIT_MIN_CALLS and \
+                    sum(self._outcomes) >= CIRCUIT_FAILURE_RATE * len(self._outcomes):
+                self._open()
+
+    def snapshot(self):
+        """State and recent failure rate, as shown by /api/health"""
+        with self._lock:
+            calls = len(self._outcomes)
+            info = {
+                'state': self.state,
+                'recent_calls': calls,
+                'failure_rate': round(sum(self._outcomes) / calls, 3) if calls else 0.0,
+            }
+            if self.state == self.OPEN:
+                info['retry_in'] = round(max(0.0, CIRCUIT_OPEN_SECONDS - (time.monotonic() - self.opened_at)), 1)
+        return info
+
+
+_breakers = {}
+
+
+def get_breaker(upstream):
+    """Circuit breaker for an upstream (created on first use)"""
+    breaker = _breakers.get(upstream)
+    if breaker is None:
+        with _limiters_lock:
+            breaker = _breakers.setdefault(upstream, CircuitBreaker(upstream))
+    return breaker
+
+
+def circuit_open(upstream):
+    """Whether calls to the upstream are currently being rejected, so callers can go local up front"""
+    return CIRCUIT_BREAKER_ENABLED and get_breaker(upstream).is_open()
+
+
+def circuit_states():
+    """Breaker snapshot for every configured (or already used) upstream"""
+    names = sorted(set(UPSTREAM_LIMITS) | set(_breakers))
+    return {name: get_breaker(name).snapshot() for name in names}
+
+
+_latencies = {}  # upstream -> deque of recent successful call durations
+_latencies_lock = threading.Lock()
+
+
+def _record_latency(upstream, seconds):
+    with _latencies_lock:
+        _latencies.setdefault(upstream, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+
+def latency_percentile(upstream, percentile):
+    """Percentile of the upstream's recent successful call latencies, or None with too few samples"""
+    with _latencies_lock:
+        samples = sorted(_latencies.get(upstream, ()))
+    if len(samples) < UPSTREAM_HEDGE_MIN_SAMPLES:
+        return None
+    return samples[min(len(samples) - 1, int(len(samples) * percentile))]
+
+
+def _server_failure(result):
+    """Whether a result is an HTTP response the upstream failed (5xx or 429)"""
+    status = getattr(result, 'status_code', None)
+    return bool(status and (status >= 500 or status == 429))
+
+
+def call_upstream(upstream, fn, *args, **kwargs):
+    """
+    Call fn(*args, **kwargs) as a request to the named upstream.
+
+    Checks the upstream's circuit breaker, then waits for its scheduler
+    (see the module docstring). Counts the call by outcome and records its
+    latency. HTTP responses with a 4xx/5xx status are counted as
+    'http_error'; exceptions are counted as 'error' and re-raised, calls
+    rejected by an open breaker as 'circuit_open', calls that time out in
+    the queue as 'queue_timeout' and calls made after the deadline as
+    'deadline'.
+
+    An exception raised once the request's deadline has passed is most
+    likely the timeout this process clamped to that deadline, shorter than
+    the upstream's usual one. It is counted as 'deadline' and doesn't count
+    against the breaker.
+    """
+    breaker = get_breaker(upstream) if CIRCUIT_BREAKER_ENABLED else None
+    if breaker is not None and not breaker.allow():
+        UPSTREAM_CALLS.inc(upstream=upstream, outcome='circuit_open')
+        raise CircuitOpen(f'{upstream}: circuit open')
+
+    priority = _priority.get()
+    limiter = get_limiter(upstream)
+    try:
+        limiter.acquire(priority, clamp_timeout(UPSTREAM_QUEUE_TIMEOUTS[priority]))
+    except (DeadlineExceeded, UpstreamQueueTimeout) as e:
+        if breaker is not None:
+            breaker.abandon()
+        outcome = 'deadline' if isinstance(e, DeadlineExceeded) else 'queue_timeout'
+        UPSTREAM_CALLS.inc(upstream=upstream, outcome=outcome)
+        raise
+
+    started = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+    except Exception:
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, upstream=upstream)
+        # Cut short by our own deadline: says nothing about the upstream's health
+        cut_short = expired()
+        UPSTREAM_CALLS.inc(upstream=upstream, outcome='deadline' if cut_short else 'error')
+        if breaker is not None:
+            if cut_short:
+                breaker.abandon()
+            else:
+                breaker.record(True)
+        raise
+    finally:
+        limiter.release()
+
+    elapsed = time.perf_counter() - started
+    UPSTREAM_SECONDS.observe(elapsed, upstream=upstream)
+    status = getattr(result, 'status_code', None)
+    if status == 429:
+        limiter.throttled()
+    failed = status and status >= 400
+    if not failed:
+        _record_latency(upstream, elapsed)
+    if breaker is not None:
+        # Other 4xx are the request's fault, not the upstream's
+        breaker.record(_server_failure(result) or elapsed > CIRCUIT_SLOW_CALL_SECONDS)
+    UPSTREAM_CALLS.inc(upstream=upstream, outcome='http_error' if failed else 'ok')
+    return result
+
+
+def upstream_request(upstream, method, url, **kwargs):
+    """Issue an HTTP request to the named upstream (see call_upstream); the timeout is clamped to the deadline"""
+    try:
+        kwargs['timeout'] = clamp_timeout(kwargs.get('timeout'))
+    except DeadlineExceeded:
+        UPSTREAM_CALLS.inc(upstream=upstream, outcome='deadline')
+        raise
+    return call_upstream(upstream, requests.request, method, url, **kwargs)
+
+
+_hedge_pool = None
+_hedge_pool_lock = threading.Lock()
+
+
+def _get_hedge_pool():
+    global _hedge_pool
+    if _hedge_pool is None:
+        with _hedge_pool_lock:
+            if _hedge_pool is None:
+                _hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix='hedge')
+    return _hedge_pool
+
+
+def hedged_request(upstream, method, url, **kwargs):
+    """
+    upstream_request that sends a second copy if the first is slow.
+
+    Once the first request has run longer than UPSTREAM_HEDGE_PERCENTILE of
+    the upstream's recent latencies (and there's budget left to wait), an
+    identical request is sent and the first successful answer wins; a
+    5xx/429 response or an exception is only returned (or raised) once both
+    copies have failed. The loser is left to finish in the background. Only
+    use this for idempotent reads.
+    """
+    hedge_after = latency_percentile(upstream, UPSTREAM_HEDGE_PERCENTILE)
+    left = remaining()
+    if hedge_after is None or (left is not None and left <= hedge_after):
+        return upstream_request(upstream, method, url, **kwargs)
+
+    pool = _get_hedge_pool()
+    # Each copy runs with this request's priority and deadline
+    first = pool.submit(contextvars.copy_context().run, upstream_request, upstream, method, url, **kwargs)
+    done, _ = wait([first], timeout=hedge_after)
+    if done:
+        return first.result()
+
+    second = pool.submit(contextvars.copy_context().run, upstream_request, upstream, method, url, **kwargs)
+    copies = {first: 'first', second: 'second'}
+    pending = set(copies)
+    failed_response = None
+    error = None
+    while pending:
+        done, pending = wait(pending, timeout=remaining(), return_when=FIRST_COMPLETED)
+        if not done:
+            raise DeadlineExceeded(f'{upstream}: no response before the deadline')
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                error = e
+                continue
+            if _server_failure(result):
+                failed_response = failed_response or result
+                continue
+            UPSTREAM_HEDGES.inc(upstream=upstream, winner=copies[future])
+            return result
+    if failed_response is not None:
+        return failed_response
+    raise error
@@ -0,0 +1,265 @@
+"""
+Local vibe classifier used before falling back to the LLM.
+
+Combines a keyword lexicon with a small TF-IDF + logistic regression model
+trained on data/vibe_examples.jsonl, and pulls the location out of phrases
+like "in Shoreditch". Obvious inputs are answered locally in well under a
+millisecond; anything below the confidence threshold goes to OpenRouter.
+
+Retrain the shipped model after editing the examples:
+    python -m services.vibe_classifier
+"""
+import json
+import math
+import os
+import random
+import re
+import threading
+from collections import Counter
+
+from config import VALID_VIBES
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+EXAMPLES_PATH = os.path.join(DATA_DIR, 'vibe_examples.jsonl')
+MODEL_PATH = os.path.join(DATA_DIR, 'vibe_model.json')
+
+# Keyword patterns per vibe; each distinct pattern that matches adds
+# LEXICON_WEIGHT to that vibe's log-odds
+LEXICON = {
+    'chill': [
+        r'\bchill(?:ing|ed)?\b', r'\brelax(?:ing|ed)?\b', r'\bunwind\b', r'\bcalm(?:ing)?\b', r'\bpeace(?:ful)?\b',
+        r'\bquiet\b', r'\bde-?stress\b', r'\bstress(?:ed)?\b', r'\bmeditat\w*', r'\btranquil\b', r'\bserene\b',
+        r'\bdecompress\b', r'\brecharge\b', r'\bzen\b', r'\banxi\w*', r'\bmindful\b', r'\bgentle\b', r'\blazy\b',
+        r'\bbreathe?r?\b', r'\boverwhelmed\b', r'\bburnt? out\b', r'\bwind down\b', r'\bclear my head\b',
+    ],
+    'date': [
+        r'\bdate\b', r'\bromantic\b', r'\bromance\b', r'\bpartner\b', r'\bgirlfriend\b', r'\bboyfriend\b',
+        r'\bwife\b', r'\bhusband\b', r'\bfianc[eé]e?\b', r'\banniversary\b', r'\bbae\b', r'\bcrush\b',
+        r'\bvalentines?\b', r"\bvalentine's\b", r'\bcouples?\b', r"\bcouple's\b", r'\bpropose\b',
+        r'\bhoneymoon\b', r'\bintimate\b', r'\bfor two\b', r'\bholding hands\b', r'\bcandlelit\b',
+    ],
+    'chaos': [
+        r'\bpart(?:y|ying|ies)\b', r'\bwild\b', r'\bcrazy\b', r'\bchao(?:s|tic)\b', r'\bnightlife\b',
+        r'\bbars?\b', r'\bpubs?\b', r'\bclub(?:s|bing)?\b', r'\bdrinks?\b', r'\bdrinking\b', r'\bdrunk\b',
+        r'\brave\b', r'\bcrawl\b', r'\bbar hop\w*', r'\bturn up\b', r'\blit\b', r'\browdy\b', r'\bshots\b',
+        r'\bbeers?\b', r'\bcocktails?\b', r'\brage\b', r'\bnight out\b', r'\bgoing out\b', r'\bstag\b', r'\bhen\b',
+    ],
+    'aesthetic': [
+        r'\bphoto\w*', r'\bpictures?\b', r'\bpics?\b', r'\binsta\w*', r'\baesthetic\b', r'\bpretty\b',
+        r'\barchitecture\b', r'\bart(?:sy)?\b', r'\bgaller(?:y|ies)\b', r'\bmurals?\b', r'\bstreet art\b',
+        r'\bgraffiti\b', r'\bcamera\b', r'\bgolden hour\b', r'\bmuseums?\b', r'\bpicturesque\b',
+        r'\bfeed\b', r'\bvlog\b', r'\btiktok\b', r'\bcontent\b', r'\bshots for\b', r'\blandmarks?\b',
+    ],
+}
+LEXICON_WEIGHT = 1.5
+
+_LEXICON_PATTERNS = {vibe: [re.compile(p) for p in patterns] for vibe, patterns in LEXICON.items()}
+
+# "in Shoreditch", "around the East Village", "near Regent's Park"
+_LOCATION_PATTERN = re.compile(
+    r"\b(?i:in|at|around|near|through|by|along|across|round|towards|from)\s+(?:(?i:the)\s+)?"
+    r"([A-Z][\w'’.-]*(?:\s+(?:(?:of|on|upon)\s+)?[A-Z][\w'’.-]*)*)"
+)
+# Capitalized words that follow a preposition but aren't places
+_NOT_LOCATIONS = {
+    'i', 'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday', 'today',
+    'tonight', 'tomorrow', 'christmas', 'easter', 'instagram', 'tiktok', 'valentine', "valentine's",
+}
+
+# A lowercase word straight after a preposition ("party in hackney") may be a
+# place the pattern above can't confirm; such inputs go to the LLM
+_LOWERCASE_PLACE = re.compile(r"\b(?:in|at|around|near|through|along|across|towards)\s+([a-z][\w'’-]*)")
+_NOT_PLACE_WORDS = {
+    'the', 'a', 'an', 'my', 'your', 'our', 'his', 'her', 'their', 'this', 'that', 'these', 'those', 'some',
+    'any', 'me', 'us', 'him', 'them', 'it', 'least', 'all', 'once', 'first', 'last', 'most', 'night', 'home',
+    'bed', 'peace', 'style', 'myself', 'work', 'school', 'town', 'nature', 'lunch', 'lunchtime', 'daylight',
+    'silence', 'public', 'general', 'order', 'between', 'front', 'time', 'case', 'love', 'search',
+}
+AMBIGUOUS_LOCATION_PENALTY = 0.5
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+def normalize_text(text):
+    """Cache key form of a description: case-folded with collapsed whitespace"""
+    return ' '.join(text.split()).casefold()
+
+
+def tokenize(text):
+    """Lowercase word unigrams plus adjacent-word bigrams"""
+    words = _TOKEN_PATTERN.findall(text.casefold())
+    return words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+
+
+def lexicon_hits(text):
+    """Number of distinct lexicon patterns matching text, per vibe"""
+    lowered = text.casefold()
+    return Counter({
+        vibe: sum(1 for pattern in patterns if pattern.search(lowered))
+        for vibe, patterns in _LEXICON_PATTERNS.items()
+    })
+
+
+def extract_location(text):
+    """
+    Find a place name in text.
+
+    Returns:
+        (location or None, ambiguous) where ambiguous means a lowercase word
+        after a preposition might be a place the pattern couldn't confirm
+    """
+    for match in _LOCATION_PATTERN.finditer(text):
+        location = match.group(1).rstrip('.!?')
+        if location.split()[0].casefold() not in _NOT_LOCATIONS:
+            return location, False
+
+    for match in _LOWERCASE_PLACE.finditer(text):
+        if match.group(1) not in _NOT_PLACE_WORDS and not match.group(1).isdigit():
+            return None, True
+    return None, False
+
+
+def _softmax(logits):
+    top = max(logits.values())
+    exps = {k: math.exp(v - top) for k, v in logits.items()}
+    total = sum(exps.values())
+    return {k: v / total for k, v in exps.items()}
+
+
+class VibeModel:
+    """Multinomial logistic regression over sublinear TF-IDF features"""
+    __slots__ = ('classes', 'idf', 'weights', 'bias')
+
+    def __init__(self, classes, idf, weights, bias):
+        self.classes = classes  # Vibe per weight column
+        self.idf = idf          # term -> inverse document frequency
+        self.weights = weights  # term -> [weight per class]
+        self.bias = bias        # [bias per class]
+
+    def vectorize(self, text):
+        """L2-normalized TF-IDF features of text (terms outside the vocabulary dropped)"""
+        counts = Counter(t for t in tokenize(text) if t in self.idf)
+        features = {t: (1 + math.log(c)) * self.idf[t] for t, c in counts.items()}
+        norm = math.sqrt(sum(v * v for v in features.values())) or 1.0
+        return {t: v / norm for t, v in features.items()}
+
+    def logits(self, text):
+        return dict(zip(self.classes, self._raw_logits(self.vectorize(text))))
+
+    def predict_proba(self, text):
+        return _softmax(self.logits(text))
+
+    @classmethod
+    def train(cls, examples, epochs=40, learning_rate=0.5, l2=1e-4, seed=0):
+        """
+        Fit the model with SGD.
+
+        Args:
+            examples: List of {'text', 'vibe'} dicts
+        """
+        classes = list(VALID_VIBES)
+        documents = [set(tokenize(e['text'])) for e in examples]
+        doc_freq = Counter(t for doc in documents for t in doc)
+        num_docs = len(examples)
+        idf = {t: math.log((1 + num_docs) / (1 + df)) + 1 for t, df in doc_freq.items()}
+
+        model = cls(classes, idf, {t: [0.0] * len(classes) for t in idf}, [0.0] * len(classes))
+        data = [(model.vectorize(e['text']), classes.index(e['vibe'])) for e in examples]
+
+        rng = random.Random(seed)
+        for epoch in range(epochs):
+            rng.shuffle(data)
+            rate = learning_rate / (1 + epoch * 0.1)
+            for features, label in data:
+                probs = _softmax(dict(enumerate(model._raw_logits(features))))
+                for i in range(len(classes)):
+                    gradient = probs[i] - (1.0 if i == label else 0.0)
+                    model.bias[i] -= rate * gradient
+                    for term, value in features.items():
+                        row = model.weights[term]
+                        row[i] -= rate * (gradient * value + l2 * row[i])
+        return model
+
+    def _raw_logits(self, features):
+        scores = list(self.bias)
+        for term, value in features.items():
+            for i, w in enumerate(self.weights[term]):
+                scores[i] += w * value
+        return scores
+
+    def to_dict(self):
+        return {
+            'classes': self.classes,
+            'idf': self.idf,
+            'weights': {t: [round(w, 5) for w in row] for t, row in self.weights.items()},
+            'bias': self.bias,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['classes'], data['idf'], data['weights'], data['bias'])
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, separators=(',', ':'), sort_keys=True)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+def load_examples(path=EXAMPLES_PATH):
+    """Labeled examples ({'text', 'vibe', 'location'} per line)"""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """Shared model, loaded from MODEL_PATH (or trained from the examples) on first use"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                if os.path.exists(MODEL_PATH):
+                    _model = VibeModel.load(MODEL_PATH)
+                else:
+                    _model = VibeModel.train(load_examples())
+    return _model
+
+
+def classify_vibe(text, model=None):
+    """
+    Classify a description locally.
+
+    Returns:
+        Dict with 'vibe', 'location', 'confidence' (0-1) and per-vibe 'scores'
+    """
+    model = model or get_model()
+    logits = model.logits(text)
+    hits = lexicon_hits(text)
+    scores = _softmax({vibe: logit + LEXICON_WEIGHT * hits[vibe] for vibe, logit in logits.items()})
+
+    vibe = max(scores, key=scores.get)
+    confidence = scores[vibe]
+
+    location, ambiguous = extract_location(text)
+    if ambiguous:
+        confidence *= AMBIGUOUS_LOCATION_PENALTY
+
+    return {
+        'vibe': vibe,
+        'location': location,
+        'confidence': confidence,
+        'scores': scores,
+    }
+
+
+if __name__ == '__main__':
+    examples = load_examples()
+    VibeModel.train(examples).save(MODEL_PATH)
+    print(f"Trained on {len(examples)} examples, wrote {MODEL_PATH}")
@@ -0,0 +1,66 @@
+"""
+Per-request deadline budgets.
+
+A request handler opens a budget with `with deadline(seconds):`; every
+stage below it asks how much time is left instead of using its own fixed
+timeout. Upstream calls are clamped to the remaining budget (see
+services/upstream.py) and stages that can degrade check `has_budget()`
+before starting optional work.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Absolute time.monotonic() deadline of the current request, or None
+_deadline = ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out"""
+
+
+@contextmanager
+def deadline(seconds):
+    """Run the enclosed code with at most `seconds` left (a tighter outer deadline wins)"""
+    until = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(until if outer is None else min(until, outer))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Seconds left in the current budget (None when there is no deadline)"""
+    until = _deadline.get()
+    if until is None:
+        return None
+    return max(0.0, until - time.monotonic())
+
+
+def expired():
+    """Whether the current budget has run out"""
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def has_budget(seconds):
+    """Whether at least `seconds` are left (always true without a deadline)"""
+    left = remaining()
+    return left is None or left >= seconds
+
+
+def clamp_timeout(timeout):
+    """
+    Shrink a timeout to the remaining budget.
+
+    Raises:
+        DeadlineExceeded: if the budget is already spent
+    """
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded('Request deadline exceeded')
+    return left if timeout is None else min(timeout, left)
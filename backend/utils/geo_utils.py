@@ -2,13 +2,20 @@
 import math
 from math import radians, cos, sin, asin, sqrt, atan2
 
+EARTH_RADIUS_METERS = 6371000
+# Length of one degree of latitude on the sphere calculate_distance uses
+METERS_PER_DEGREE = EARTH_RADIUS_METERS * math.pi / 180
+# Extra degrees on every box margin, so float rounding can't drop a point
+# lying exactly on the radius
+BOX_EPSILON_DEGREES = 1e-9
+
 
 def calculate_distance(lat1, lon1, lat2, lon2):
     """
     Calculate distance between two points using Haversine formula
     Returns distance in meters
     """
-    R = 6371000  # Earth radius in meters
+    R = EARTH_RADIUS_METERS
 
     lat1_rad = radians(lat1)
     lat2_rad = radians(lat2)
@@ -27,3 +34,46 @@ def calculate_angle(lat1, lon1, lat2, lon2):
     dlat = lat2 - lat1
     angle = math.degrees(math.atan2(dlat, dlon))
     return (angle + 360) % 360
+
+
+def degree_margins(lat, meters):
+    """
+    Degrees of latitude and longitude covering `meters` in every direction
+    from any point at latitude `lat` (longitude measured where the circle
+    is widest, so it is never cut off).
+
+    Returns:
+        (lat_margin, lon_margin)
+    """
+    lat_margin = meters / METERS_PER_DEGREE + BOX_EPSILON_DEGREES
+    widest_lat = min(abs(lat) + lat_margin, 89.0)
+    lon_margin = meters / (METERS_PER_DEGREE * cos(radians(widest_lat))) + BOX_EPSILON_DEGREES
+    return lat_margin, lon_margin
+
+
+def bounding_box(lat, lon, radius):
+    """
+    Latitude/longitude box that contains every point within radius meters
+    (as measured by calculate_distance).
+
+    Returns:
+        (min_lat, max_lat, min_lon, max_lon)
+    """
+    lat_margin, lon_margin = degree_margins(lat, radius)
+    return lat - lat_margin, lat + lat_margin, lon - lon_margin, lon + lon_margin
+
+
+def tile_for(lat, lon, tile_degrees):
+    """(tile_lat, tile_lon) indices of the square lat/lon grid cell containing a point"""
+    return math.floor(lat / tile_degrees), math.floor(lon / tile_degrees)
+
+
+def tile_bounds(tile_lat, tile_lon, tile_degrees):
+    """
+    Box covered by a grid cell from tile_for.
+
+    Returns:
+        (min_lat, max_lat, min_lon, max_lon); the max edges belong to the next cell
+    """
+    return (tile_lat * tile_degrees, (tile_lat + 1) * tile_degrees,
+            tile_lon * tile_degrees, (tile_lon + 1) * tile_degrees)
@@ -0,0 +1,208 @@
+"""In-process metrics (counters, histograms) and per-request stage timing"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+# Default latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+
+# (stage, seconds) pairs recorded during the current request, or None outside one
+_request_timings = ContextVar('request_timings', default=None)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs) + '}'
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(name, '') for name in self.labelnames), 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {value}')
+        return lines
+
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    """Fixed-bucket histogram with optional labels"""
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def quantile(self, fraction, **labels):
+        """Estimate a quantile from the buckets (upper bound of the bucket it falls in)"""
+        series = self._series.get(tuple(labels.get(name, '') for name in self.labelnames))
+        if not series or not series[-1]:
+            return None
+        target = fraction * series[-1]
+        running = 0
+        for bound, count in zip(self.buckets, series):
+            running += count
+            if running >= target:
+                return bound
+        return self.buckets[-1]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in items:
+            running = 0
+            for bound, count in zip(self.buckets, series):
+                running += count
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, ("le", bound))} {running}')
+            running += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, ("le", "+Inf"))} {running}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}')
+        return lines
+
+
+def render_prometheus():
+    """Render every registered metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# Shared metrics
+STAGE_SECONDS = Histogram(
+    'touchgrass_stage_duration_seconds', 'Time spent in each route generation stage', ['stage'])
+REQUEST_SECONDS = Histogram(
+    'touchgrass_request_duration_seconds', 'API request latency', ['endpoint', 'status'])
+UPSTREAM_CALLS = Counter(
+    'touchgrass_upstream_calls_total', 'Outbound calls to upstream APIs', ['upstream', 'outcome'])
+UPSTREAM_SECONDS = Histogram(
+    'touchgrass_upstream_duration_seconds', 'Outbound call latency', ['upstream'])
+ERRORS = Counter(
+    'touchgrass_errors_total', 'Unhandled errors by endpoint', ['endpoint'])
+ROUTE_CACHE_REQUESTS = Counter(
+    'touchgrass_route_cache_requests_total', 'Route cache lookups by result', ['status'])
+VIBE_DETECTIONS = Counter(
+    'touchgrass_vibe_detections_total', 'Vibe detections by where the answer came from', ['source'])
+AREA_REFRESHES = Counter(
+    'touchgrass_area_refreshes_total', 'Background re-discoveries of stale indexed areas', ['outcome'])
+UPSTREAM_QUEUE_DEPTH = Gauge(
+    'touchgrass_upstream_queue_depth', 'Outbound calls waiting for their turn', ['upstream', 'priority'])
+UPSTREAM_QUEUE_SECONDS = Histogram(
+    'touchgrass_upstream_queue_wait_seconds', 'Time outbound calls waited in the scheduler', ['upstream', 'priority'])
+UPSTREAM_HEDGES = Counter(
+    'touchgrass_upstream_hedges_total', 'Hedged second requests by which copy answered first', ['upstream', 'winner'])
+DEGRADED_RESPONSES = Counter(
+    'touchgrass_degraded_responses_total', 'Responses that skipped or replaced a stage to stay in budget', ['stage'])
+UPSTREAM_CIRCUIT_STATE = Gauge(
+    'touchgrass_upstream_circuit_state', 'Circuit breaker state (0 closed, 1 half-open, 2 open)', ['upstream'])
+UPSTREAM_CIRCUIT_OPENS = Counter(
+    'touchgrass_upstream_circuit_opens_total', 'Times a circuit breaker opened', ['upstream'])
+DB_WRITES = Counter(
+    'touchgrass_db_writes_total', 'Writes applied by the write-behind queue', ['outcome'])
+DB_WRITE_BATCH_SECONDS = Histogram(
+    'touchgrass_db_write_batch_seconds', 'Time to apply and commit one batch of queued writes')
+DB_WRITE_BATCH_SIZE = Histogram(
+    'touchgrass_db_write_batch_size', 'Writes committed per transaction', buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+DUPLICATE_PLACES = Counter(
+    'touchgrass_duplicate_places_total', 'Discovered places stored as aliases of another place', ['match'])
+PROFILED_REQUESTS = Counter(
+    'touchgrass_profiled_requests_total', 'Requests run under the profiler by what triggered it', ['endpoint', 'trigger'])
+
+
+class stage:
+    """
+    Context manager timing one stage of a request.
+
+    Records into STAGE_SECONDS and, inside a request started with
+    begin_request_timing(), into that request's Server-Timing entries.
+    """
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        STAGE_SECONDS.observe(elapsed, stage=self.name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((self.name, elapsed))
+        return False
+
+
+def begin_request_timing():
+    """Start collecting stage timings for the current request"""
+    return _request_timings.set([])
+
+
+def end_request_timing(token):
+    """Stop collecting and return the (stage, seconds) pairs for the request"""
+    timings = _request_timings.get() or []
+    _request_timings.reset(token)
+    return timings
+
+
+def server_timing_header(timings):
+    """Format stage timings as a Server-Timing header value (durations in ms)"""
+    return ', '.join(f'{name};dur={seconds * 1000:.1f}' for name, seconds in timings)
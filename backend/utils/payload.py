@@ -0,0 +1,147 @@
+"""Compact route payloads: geometry encodings, field projection and compression"""
+import gzip
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip is used when brotli isn't installed
+    brotli = None
+
+GEOMETRY_MODES = ('full', 'polyline', 'delta')
+
+# Waypoint fields kept in compact mode ('type' already carries google_type)
+COMPACT_WAYPOINT_FIELDS = (
+    'place_id', 'name', 'latitude', 'longitude', 'type', 'rating', 'vibes', 'route_position'
+)
+
+# Every field a waypoint can have (the Place response shape plus route placement)
+WAYPOINT_FIELDS = (
+    'place_id', 'name', 'latitude', 'longitude', 'type', 'google_type', 'address', 'rating',
+    'user_ratings_total', 'categorization_source', 'vibes', 'distance', 'distance_to_route', 'route_position'
+)
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def encode_delta_coordinates(coordinates, precision=5):
+    """
+    Quantize [lng, lat] coordinates and delta-encode them.
+
+    Returns a flat list of integers: the first point scaled by 10^precision,
+    then the difference to the previous point for each following point.
+    Decode with a running sum divided by 10^precision.
+    """
+    scale = 10 ** precision
+    flat = []
+    prev_lng = 0
+    prev_lat = 0
+    for lng, lat in coordinates:
+        q_lng = int(round(lng * scale))
+        q_lat = int(round(lat * scale))
+        flat.append(q_lng - prev_lng)
+        flat.append(q_lat - prev_lat)
+        prev_lng = q_lng
+        prev_lat = q_lat
+    return flat
+
+
+def decode_delta_coordinates(flat, precision=5):
+    """Inverse of encode_delta_coordinates"""
+    scale = 10 ** precision
+    coordinates = []
+    lng = 0
+    lat = 0
+    for i in range(0, len(flat), 2):
+        lng += flat[i]
+        lat += flat[i + 1]
+        coordinates.append([lng / scale, lat / scale])
+    return coordinates
+
+
+def project_waypoints(waypoints, fields):
+    """Keep only the given fields of each waypoint dict"""
+    return [{k: wp[k] for k in fields if k in wp} for wp in waypoints]
+
+
+def shape_route(route_result, geometry='full', waypoint_fields=None):
+    """
+    Return a copy of a route result ({'route', 'waypoints', ...}) in the requested shape.
+
+    Args:
+        route_result: Dict with 'route' (coordinates/polyline/distance/duration) and 'waypoints'
+        geometry: 'full' (coordinates and polyline), 'polyline' (encoded polyline
+            only) or 'delta' (quantized delta-encoded coordinates only)
+        waypoint_fields: Optional list of waypoint fields to keep
+    """
+    shaped = dict(route_result)
+    route = dict(route_result['route'])
+
+    if geometry == 'polyline':
+        route.pop('coordinates', None)
+    elif geometry == 'delta':
+        route['coordinates_delta'] = encode_delta_coordinates(route.pop('coordinates', []))
+        route['coordinates_precision'] = 5
+        route.pop('polyline', None)
+
+    shaped['route'] = route
+    if waypoint_fields:
+        shaped['waypoints'] = project_waypoints(route_result['waypoints'], waypoint_fields)
+    return shaped
+
+
+def parse_payload_shape(data):
+    """
+    Read the requested response shape from a route request body.
+
+    Returns:
+        (geometry, waypoint_fields)
+
+    Raises:
+        ValueError: if the geometry mode is unknown or waypoint_fields isn't a
+            list of known waypoint fields
+    """
+    # Compact mode drops duplicated geometry and unused waypoint fields
+    compact = bool(data.get('compact'))
+    geometry = data.get('geometry', 'polyline' if compact else 'full')
+    waypoint_fields = data.get('waypoint_fields', COMPACT_WAYPOINT_FIELDS if compact else None)
+    if geometry not in GEOMETRY_MODES:
+        raise ValueError(f'Invalid geometry. Choose from: {list(GEOMETRY_MODES)}')
+    if waypoint_fields is not None:
+        if not isinstance(waypoint_fields, (list, tuple)) or not all(
+                isinstance(field, str) for field in waypoint_fields):
+            raise ValueError('waypoint_fields must be a list of field names')
+        unknown = [field for field in waypoint_fields if field not in WAYPOINT_FIELDS]
+        if unknown:
+            raise ValueError(f'Unknown waypoint_fields {unknown}. Choose from: {list(WAYPOINT_FIELDS)}')
+    return geometry, waypoint_fields
+
+
+def shape_response(response, geometry='full', waypoint_fields=None):
+    """Apply the requested geometry/waypoint shape to a full route response and its alternatives"""
+    if geometry == 'full' and not waypoint_fields:
+        return response
+
+    shaped = shape_route(response, geometry, waypoint_fields)
+    if 'alternatives' in response:
+        shaped['alternatives'] = [
+            shape_route(alternative, geometry, waypoint_fields)
+            for alternative in response['alternatives']
+        ]
+    return shaped
+
+
+def choose_encoding(accept_encoding):
+    """Pick 'br' or 'gzip' from an Accept-Encoding header, or None"""
+    accepted = {part.split(';')[0].strip().lower() for part in (accept_encoding or '').split(',')}
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress_body(data, encoding):
+    """Compress bytes with the given content encoding"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
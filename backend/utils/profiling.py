@@ -0,0 +1,203 @@
+"""
+On-demand profiling of single requests.
+
+`@profiled('generate_route')` wraps a view. A request is profiled when it
+sends `X-Profile: <PROFILE_TOKEN>` or is picked at PROFILE_SAMPLE_RATE. It
+then runs under cProfile and tracemalloc, and two files are written to
+PROFILE_DIR: `<id>.prof` (pstats data, for `python -m pstats` or snakeviz)
+and `<id>.txt` (the slowest functions and the top allocation sites). The
+response carries an X-Profile header with the id and a one-line summary.
+
+cProfile sees the request's own thread; work it hands to a thread pool
+shows up as time spent waiting on it. tracemalloc traces the whole process,
+so one request is profiled at a time and any overlapping it run normally.
+With no token and a zero sample rate the decorator returns the view as is,
+so requests pay nothing for the hook.
+"""
+import cProfile
+import functools
+import hmac
+import io
+import os
+import pstats
+import random
+import sysconfig
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+from flask import request, make_response
+
+from config import PROFILE_TOKEN, PROFILE_SAMPLE_RATE, PROFILE_DIR, PROFILE_MAX_FILES, PROFILE_TOP_N
+from utils.metrics import PROFILED_REQUESTS
+
+PROFILE_HEADER = 'X-Profile'
+# Report paths are shown relative to the first of these they are inside
+_PATH_ROOTS = (
+    sysconfig.get_paths()['purelib'],
+    sysconfig.get_paths()['stdlib'],
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+)
+
+# tracemalloc is process-wide, so only one request is profiled at a time
+_profile_lock = threading.Lock()
+
+
+def profiling_enabled():
+    """Whether any request can be profiled (a token or a sample rate is set)"""
+    return bool(PROFILE_TOKEN) or PROFILE_SAMPLE_RATE > 0
+
+
+def _trigger():
+    """Why the current request should be profiled ('header' or 'sample'), or None"""
+    token = request.headers.get(PROFILE_HEADER)
+    if token and PROFILE_TOKEN and hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode()):
+        return 'header'
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return 'sample'
+    return None
+
+
+def _short_path(path):
+    """Path relative to site-packages, the standard library or the backend directory"""
+    for root in _PATH_ROOTS:
+        if path.startswith(root + os.sep):
+            return os.path.relpath(path, root)
+    return path
+
+
+def _allocation_sites(snapshot, baseline):
+    """(bytes, blocks, 'file:line') still allocated by the request, largest first"""
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ])
+    if baseline is None:
+        sites = [(stat.size, stat.count, stat.traceback[0]) for stat in snapshot.statistics('lineno')]
+    else:
+        # Tracing was already on: only what the request added counts
+        sites = [(stat.size_diff, stat.count_diff, stat.traceback[0])
+                 for stat in snapshot.compare_to(baseline, 'lineno') if stat.size_diff > 0]
+    sites.sort(key=lambda site: -site[0])
+    return [(size, count, f'{_short_path(frame.filename)}:{frame.lineno}')
+            for size, count, frame in sites[:PROFILE_TOP_N]]
+
+
+def _slowest_function(stats):
+    """'function (file:line) ms' for the function with the most time spent in itself"""
+    if not stats.stats:
+        return ''
+    (filename, lineno, name), (_, _, own_seconds, _, _) = max(stats.stats.items(), key=lambda item: item[1][2])
+    where = f'{_short_path(filename)}:{lineno}' if lineno else filename
+    return f'{name} ({where}) {own_seconds * 1000:.1f}ms'
+
+
+def _prune_profiles():
+    """Delete the oldest profiles past PROFILE_MAX_FILES"""
+    profiles = sorted(
+        (os.path.join(PROFILE_DIR, name) for name in os.listdir(PROFILE_DIR) if name.endswith('.prof')),
+        key=os.path.getmtime
+    )
+    for path in profiles[:max(0, len(profiles) - PROFILE_MAX_FILES)]:
+        for stale in (path, path[:-len('.prof')] + '.txt'):
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+
+def _write_report(profile_id, endpoint, trigger, status, seconds, peak, stats, sites):
+    """Write <id>.prof and <id>.txt to PROFILE_DIR"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, profile_id)
+    stats.dump_stats(base + '.prof')
+
+    listing = io.StringIO()
+    pstats.Stats(base + '.prof', stream=listing).sort_stats('cumulative').print_stats(PROFILE_TOP_N)
+    lines = [
+        f'Profile {profile_id}',
+        f'{request.method} {request.full_path.rstrip("?")} ({endpoint}) -> {status}, triggered by {trigger}',
+        f'Wall time {seconds * 1000:.1f} ms, peak traced memory {peak / 1024:.1f} KiB',
+        '',
+        'Top allocation sites still held when the request ended:',
+    ]
+    lines.extend(f'  {size / 1024:>10.1f} KiB {count:>8} blocks  {where}' for size, count, where in sites)
+    lines.extend(['', 'Top functions by cumulative time:', listing.getvalue()])
+    with open(base + '.txt', 'w') as f:
+        f.write('\n'.join(lines))
+    _prune_profiles()
+
+
+def _run_profiled(endpoint, trigger, view, args, kwargs):
+    """Run a view under cProfile and tracemalloc, write the report and tag the response"""
+    already_tracing = tracemalloc.is_tracing()
+    baseline = None
+    if already_tracing:
+        baseline = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+    else:
+        tracemalloc.start()
+
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    try:
+        response = make_response(profiler.runcall(view, *args, **kwargs))
+    finally:
+        seconds = time.perf_counter() - started
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if not already_tracing:
+            tracemalloc.stop()
+
+    PROFILED_REQUESTS.inc(endpoint=endpoint, trigger=trigger)
+    profile_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{endpoint}-{uuid.uuid4().hex[:6]}"
+    stats = pstats.Stats(profiler)
+    sites = _allocation_sites(snapshot, baseline)
+
+    summary = [f'id={profile_id}', f'wall_ms={seconds * 1000:.1f}', f'peak_kib={peak / 1024:.1f}']
+    slowest = _slowest_function(stats)
+    if slowest:
+        summary.append(f'top_self={slowest}')
+    if sites:
+        size, _, where = sites[0]
+        summary.append(f'top_alloc={where} {size / 1024:.1f}KiB')
+    try:
+        _write_report(profile_id, endpoint, trigger, response.status_code, seconds, peak, stats, sites)
+    except OSError as e:
+        print(f"Could not write profile {profile_id}: {e}")
+        summary.append('unsaved')
+
+    response.headers[PROFILE_HEADER] = '; '.join(summary)
+    return response
+
+
+def profiled(endpoint):
+    """
+    Decorator profiling a view on demand (see the module docstring).
+
+    Returns the view unchanged when profiling is disabled.
+    """
+    def decorate(view):
+        if not profiling_enabled():
+            return view
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            trigger = _trigger()
+            if trigger is None:
+                return view(*args, **kwargs)
+            if not _profile_lock.acquire(blocking=False):
+                # Another request is being profiled; asked-for profiles say so
+                response = make_response(view(*args, **kwargs))
+                if trigger == 'header':
+                    response.headers[PROFILE_HEADER] = 'busy'
+                return response
+            try:
+                return _run_profiled(endpoint, trigger, view, args, kwargs)
+            finally:
+                _profile_lock.release()
+
+        return wrapper
+    return decorate
@@ -0,0 +1,72 @@
+"""Token bucket rate limiting for outbound requests"""
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+
+    Tokens refill continuously at `rate` per second up to `capacity`; each
+    request takes one. acquire() blocks until a token is available, so a
+    pool of worker threads sharing one bucket stays under the rate.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if available right now; returns whether it did"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def time_until(self, tokens=1):
+        """Seconds until tokens will be available (0 if they are now)"""
+        with self._lock:
+            self._refill(time.monotonic())
+            missing = tokens - self._tokens
+        if missing <= 0:
+            return 0.0
+        return missing / self.rate if self.rate > 0 else float('inf')
+
+    def drain(self):
+        """Drop all banked tokens, e.g. after the upstream pushed back"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = 0.0
+
+    def acquire(self, tokens=1, timeout=None):
+        """
+        Wait until tokens are available and take them.
+
+        Returns:
+            True once acquired, False if timeout (seconds) ran out first
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate if self.rate > 0 else 0.1
+
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
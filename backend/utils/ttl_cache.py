@@ -0,0 +1,57 @@
+"""In-memory LRU cache with a time-to-live"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire ttl_seconds after they were put.
+
+    Past max_entries the least recently used entry is dropped. Values are
+    returned as stored, so callers that mutate them should store a copy.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (created_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the value for key, or None if missing or expired"""
+        return self._lookup(key, self.ttl_seconds, self.ttl_seconds)
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store a value under key"""
+        self._remember(key, time.time(), value)
+
+    def clear(self) -> None:
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, key, max_age, keep_for):
+        """Value if younger than max_age; entries older than keep_for are dropped"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                created_at, value = entry
+                if now - created_at <= max_age:
+                    self._entries.move_to_end(key)
+                    return value
+                if now - created_at > keep_for:
+                    del self._entries[key]
+        return None
+
+    def _remember(self, key, created_at, value):
+        with self._lock:
+            self._entries[key] = (created_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
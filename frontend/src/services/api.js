@@ -40,6 +40,23 @@ export const generateRoute = async ({ vibe, latitude, longitude, destination, du
   return response.data
 }
 
+/**
+ * Suggest known locations for a partial name (optionally favouring ones near latitude/longitude)
+ */
+export const autocompleteLocation = async (query, { latitude, longitude, limit } = {}) => {
+  const params = { q: query }
+  if (latitude != null && longitude != null) {
+    params.lat = latitude
+    params.lon = longitude
+  }
+  if (limit) {
+    params.limit = limit
+  }
+
+  const response = await axios.get(`${API_URL}/autocomplete`, { params })
+  return response.data.suggestions
+}
+
 /**
  * Health check
  */